@@ -0,0 +1,239 @@
+"""
+Resource profiler for the FileChunkManager pipeline.
+
+Python counterpart of resource_profiling/go (memory_limit_test.go,
+memory_dumping_simulation.go): every stage of the chunk-ciphering flow
+(generate, split, reassemble, verify) is wrapped and measured for
+- wall time and CPU time (user + system)
+- peak RSS (VmHWM, reset per stage through /proc/self/clear_refs when allowed)
+- tracemalloc peak and the source lines still holding the most memory at stage end
+- read/write bytes from /proc/self/io
+
+Optionally an RLIMIT_AS budget is enforced before the run, so a configuration
+can be proven to fit inside a container memory limit: a stage that exceeds
+the budget is recorded as failed with a MemoryError instead of crashing.
+
+Usage:
+    python chunk_stage_profiler.py --size-mb 100 --memory-budget-mb 512 --json profile.json
+"""
+import os
+import io
+import json
+import time
+import resource
+import argparse
+import tracemalloc
+import contextlib
+
+from file_into_chunks_peg_to_keys import FileChunkManager, INTEGRITY_ALGOS
+
+PROC_IO = "/proc/self/io"
+PROC_STATUS = "/proc/self/status"
+PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+
+def read_proc_io():
+    """Read the I/O counters of this process (empty dict if unavailable)"""
+    counters = {}
+    try:
+        with open(PROC_IO, 'r') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                counters[name.strip()] = int(value)
+    except OSError:
+        pass
+    return counters
+
+
+def read_peak_rss():
+    """Peak resident set size in bytes (VmHWM, falls back to ru_maxrss)"""
+    try:
+        with open(PROC_STATUS, 'r') as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def reset_peak_rss():
+    """Reset VmHWM to the current RSS; returns False if the kernel refuses"""
+    try:
+        with open(PROC_CLEAR_REFS, 'w') as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def set_memory_budget(budget_bytes):
+    """Enforce an address-space limit (RLIMIT_AS) on this process"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY and budget_bytes > hard:
+        raise ValueError(f"Budget {budget_bytes} exceeds hard RLIMIT_AS {hard}")
+    resource.setrlimit(resource.RLIMIT_AS, (budget_bytes, hard))
+    return soft, hard
+
+
+class StageProfiler:
+    def __init__(self, trace_allocations=True, top_allocators=5, quiet=False):
+        self.trace_allocations = trace_allocations
+        self.top_allocators = top_allocators
+        self.quiet = quiet
+        self.stages = []
+        self.memory_budget = None
+
+    def enforce_memory_budget(self, budget_mb):
+        """Limit the process address space to budget_mb megabytes"""
+        self.memory_budget = budget_mb * 1024 * 1024
+        set_memory_budget(self.memory_budget)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Profile the enclosed block as one pipeline stage"""
+        record = {"stage": name, "ok": True, "error": None}
+        peak_reset = reset_peak_rss()
+        io_before = read_proc_io()
+        cpu_before = resource.getrusage(resource.RUSAGE_SELF)
+        if self.trace_allocations:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+        wall_start = time.perf_counter()
+
+        # Silence the per-chunk prints of FileChunkManager if requested
+        out = io.StringIO() if self.quiet else None
+        redirect = contextlib.redirect_stdout(out) if self.quiet else contextlib.nullcontext()
+        try:
+            with redirect:
+                yield record
+        except MemoryError as e:
+            record["ok"] = False
+            record["error"] = f"MemoryError: {e}"
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu_after = resource.getrusage(resource.RUSAGE_SELF)
+            io_after = read_proc_io()
+
+            record["wall_s"] = round(wall, 6)
+            record["cpu_user_s"] = round(cpu_after.ru_utime - cpu_before.ru_utime, 6)
+            record["cpu_system_s"] = round(cpu_after.ru_stime - cpu_before.ru_stime, 6)
+            record["peak_rss_bytes"] = read_peak_rss()
+            record["peak_rss_is_per_stage"] = peak_reset
+            for counter in ("read_bytes", "write_bytes", "rchar", "wchar"):
+                if counter in io_after:
+                    record[counter] = io_after[counter] - io_before.get(counter, 0)
+
+            if self.trace_allocations:
+                _, traced_peak = tracemalloc.get_traced_memory()
+                snapshot = tracemalloc.take_snapshot().filter_traces((
+                    tracemalloc.Filter(False, __file__),
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                ))
+                tracemalloc.stop()
+                record["tracemalloc_peak_bytes"] = traced_peak
+                record["top_allocators"] = [
+                    {"location": str(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+                    for stat in snapshot.statistics('lineno')[:self.top_allocators]
+                ]
+
+            self.stages.append(record)
+
+    def report(self):
+        """Summary of all profiled stages"""
+        return {
+            "memory_budget_bytes": self.memory_budget,
+            "fits_budget": all(s["ok"] for s in self.stages),
+            "max_peak_rss_bytes": max((s["peak_rss_bytes"] for s in self.stages), default=0),
+            "stages": self.stages,
+        }
+
+    def print_report(self):
+        """Print a table of the profiled stages"""
+        print(f"\n=== STAGE PROFILE ===")
+        print(f"{'stage':<12}{'wall s':>10}{'cpu s':>10}{'peak RSS MB':>14}{'traced MB':>12}{'read MB':>10}{'write MB':>10}  status")
+        for s in self.stages:
+            cpu = s["cpu_user_s"] + s["cpu_system_s"]
+            traced = s.get("tracemalloc_peak_bytes", 0) / (1024 * 1024)
+            read_mb = s.get("read_bytes", 0) / (1024 * 1024)
+            write_mb = s.get("write_bytes", 0) / (1024 * 1024)
+            status = "ok" if s["ok"] else s["error"]
+            print(f"{s['stage']:<12}{s['wall_s']:>10.3f}{cpu:>10.3f}{s['peak_rss_bytes'] / (1024 * 1024):>14.1f}"
+                  f"{traced:>12.1f}{read_mb:>10.1f}{write_mb:>10.1f}  {status}")
+            for alloc in s.get("top_allocators", []):
+                print(f"    {alloc['size_bytes'] / 1024:>10.1f} KB  {alloc['location']}")
+
+
+def profile_pipeline(root_dir='.', size_mb=100, memory_budget_mb=None, trace_allocations=True, quiet=True,
+                     integrity_algo="sha256"):
+    """Run generate -> split -> reassemble -> verify under the profiler"""
+    profiler = StageProfiler(trace_allocations=trace_allocations, quiet=quiet)
+    if memory_budget_mb is not None:
+        profiler.enforce_memory_budget(memory_budget_mb)
+
+    manager = FileChunkManager(root_dir, integrity_algo=integrity_algo)
+    chunks_dir = os.path.join(root_dir, "chunks")
+    original_file = reassembled_file = None
+
+    with profiler.stage("generate"):
+        original_file = manager.generate_large_file(target_size_mb=size_mb)
+    if original_file:
+        with profiler.stage("split"):
+            manager.split_file_directly(original_file, chunks_dir)
+    if profiler.stages[-1]["ok"]:
+        with profiler.stage("reassemble"):
+            reassembled_file = manager.reassemble_from_chunks(chunks_dir)
+    if reassembled_file:
+        with profiler.stage("verify") as record:
+            record["identical"] = manager.verify_final_integrity(original_file, reassembled_file)
+
+    return profiler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the chunk-ciphering stages")
+    parser.add_argument("--root-dir", default=".")
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--memory-budget-mb", type=int, default=None,
+                        help="enforce RLIMIT_AS before running the pipeline")
+    parser.add_argument("--integrity-algo", choices=INTEGRITY_ALGOS, default="sha256")
+    parser.add_argument("--no-tracemalloc", action="store_true",
+                        help="skip allocation tracing (it slows allocation-heavy stages)")
+    parser.add_argument("--verbose", action="store_true", help="keep FileChunkManager output")
+    parser.add_argument("--json", dest="json_path", default=None, help="write the report as JSON")
+    args = parser.parse_args()
+
+    profiler = profile_pipeline(args.root_dir, args.size_mb, args.memory_budget_mb,
+                                trace_allocations=not args.no_tracemalloc, quiet=not args.verbose,
+                                integrity_algo=args.integrity_algo)
+    profiler.print_report()
+
+    report = profiler.report()
+    if args.memory_budget_mb is not None:
+        verdict = "fits" if report["fits_budget"] else "does NOT fit"
+        print(f"\nConfiguration {verdict} in a {args.memory_budget_mb} MB address-space budget")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Profile saved to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
+
+"""
+$ python chunk_stage_profiler.py --size-mb 100 --memory-budget-mb 1024
+
+=== STAGE PROFILE ===
+stage           wall s     cpu s   peak RSS MB   traced MB   read MB  write MB  status
+generate         0.412     0.405          22.0         2.0       0.0     100.0  ok
+    1024.1 KB  .../file_into_chunks_peg_to_keys.py:37
+split            0.617     0.551         222.5       200.1       0.0     100.0  ok
+    ...
+reassemble       0.501     0.447         323.3       300.0     100.0     100.0  ok
+verify           0.371     0.362          22.4         0.0     200.0       0.0  ok
+
+Configuration fits in a 1024 MB address-space budget
+"""
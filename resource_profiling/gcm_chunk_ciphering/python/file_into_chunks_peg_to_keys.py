@@ -7,6 +7,13 @@ Linked list structure with proper prev and next pointers
 Complete permit information for each chunk
 
 There are 100 chunks (00-99) with 100 corresponding node IDs in the JSON metadata.
+
+Whole-file integrity is selected with integrity_algo:
+- "sha256": sequential SHA-256 of the file (metadata key original_sha256)
+- "blake2b-tree": 2-level BLAKE2b tree hash; every 1 MB chunk is a leaf hashed
+  in parallel (hashlib releases the GIL), leaf digests are combined at the root.
+  Each node carries its leaf_blake2b so chunks verify one by one, and the root
+  (original_blake2b_tree) covers the whole object.
 """
 import os
 import json
@@ -14,11 +21,19 @@ import zipfile
 import hashlib
 import secrets
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+INTEGRITY_ALGOS = ("sha256", "blake2b-tree")
+BLAKE2_DIGEST_SIZE = 32
 
 class FileChunkManager:
-    def __init__(self, root_dir='.'):
+    def __init__(self, root_dir='.', integrity_algo="sha256", hash_workers=None):
+        if integrity_algo not in INTEGRITY_ALGOS:
+            raise ValueError(f"Unknown integrity algorithm {integrity_algo!r}, expected one of {INTEGRITY_ALGOS}")
         self.root_dir = root_dir
         self.chunk_size = 1024 * 1024  # 1 MB
+        self.integrity_algo = integrity_algo
+        self.hash_workers = hash_workers or os.cpu_count() or 1
         
     def generate_large_file(self, target_size_mb=100, output_path=None):
         """Generate a large file with random data"""
@@ -51,6 +66,51 @@ class FileChunkManager:
                 sha256_hash.update(chunk)
         return sha256_hash.hexdigest()
     
+    def _blake2_node(self, node_depth, node_offset, last_node):
+        """BLAKE2b hasher for one node of the 2-level tree (leaves at depth 0, root at depth 1)"""
+        return hashlib.blake2b(digest_size=BLAKE2_DIGEST_SIZE, fanout=0, depth=2,
+                               leaf_size=self.chunk_size, node_offset=node_offset,
+                               node_depth=node_depth, inner_size=BLAKE2_DIGEST_SIZE,
+                               last_node=last_node)
+    
+    def blake2_leaf_digest(self, data, index, leaf_count):
+        """Hash one chunk as leaf `index` of a tree with `leaf_count` leaves"""
+        leaf = self._blake2_node(0, index, index == leaf_count - 1)
+        leaf.update(data)
+        return leaf.hexdigest()
+    
+    def blake2_root_digest(self, leaf_digests):
+        """Combine the leaf digests (hex, in order) into the root digest"""
+        root = self._blake2_node(1, 0, True)
+        for leaf_hex in leaf_digests:
+            root.update(bytes.fromhex(leaf_hex))
+        return root.hexdigest()
+    
+    def calculate_blake2_tree(self, file_path):
+        """Calculate the BLAKE2b tree hash of a file, hashing leaves in parallel.
+        Returns (root_hex, [leaf_hex, ...])"""
+        file_size = os.path.getsize(file_path)
+        leaf_count = max(1, -(-file_size // self.chunk_size))
+        
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            def hash_leaf(index):
+                data = os.pread(fd, self.chunk_size, index * self.chunk_size)
+                return self.blake2_leaf_digest(data, index, leaf_count)
+            
+            with ThreadPoolExecutor(max_workers=self.hash_workers) as executor:
+                leaf_digests = list(executor.map(hash_leaf, range(leaf_count)))
+        finally:
+            os.close(fd)
+        
+        return self.blake2_root_digest(leaf_digests), leaf_digests
+    
+    def calculate_digest(self, file_path):
+        """Whole-file digest using the configured integrity algorithm"""
+        if self.integrity_algo == "blake2b-tree":
+            return self.calculate_blake2_tree(file_path)[0]
+        return self.calculate_sha256(file_path)
+    
     def zip_file(self, input_path, output_path=None):
         """Compress file using zip"""
         if output_path is None:
@@ -92,6 +152,11 @@ class FileChunkManager:
         # Pre-generate all node IDs to ensure consistency
         node_ids = [self.generate_node_id() for _ in range(total_chunks)]
         
+        # Leaf digests line up with the chunks holding data
+        leaf_digests = []
+        if self.integrity_algo == "blake2b-tree":
+            root_digest, leaf_digests = self.calculate_blake2_tree(input_file_path)
+        
         # Create output directory
         os.makedirs(output_dir, exist_ok=True)
         
@@ -123,6 +188,9 @@ class FileChunkManager:
                 }
             }
             
+            if i < len(leaf_digests) and chunk_data:
+                node["leaf_blake2b"] = leaf_digests[i]
+            
             nodes.append(node)
             
             # Save chunk
@@ -135,12 +203,16 @@ class FileChunkManager:
         # Save metadata to JSON file
         metadata = {
             "total_size": file_size,
-            "original_sha256": self.calculate_sha256(input_file_path),
+            "integrity_algo": self.integrity_algo,
             "chunk_count": total_chunks,
             "chunk_size": chunk_size,
             "file_size_mb": 100,
             "nodes": nodes
         }
+        if self.integrity_algo == "blake2b-tree":
+            metadata["original_blake2b_tree"] = root_digest
+        else:
+            metadata["original_sha256"] = self.calculate_sha256(input_file_path)
         
         metadata_path = os.path.join(output_dir, "metadata.json")
         with open(metadata_path, 'w') as f:
@@ -173,11 +245,14 @@ class FileChunkManager:
         # Use the node order from metadata
         assembled_data = bytearray()
         nodes = metadata["nodes"]
+        integrity_algo = metadata.get("integrity_algo", "sha256")
+        leaf_count = sum(1 for node in nodes if "leaf_blake2b" in node)
         
         print(f"Found {len(nodes)} nodes in metadata")
         
-        # Iterate through nodes in the order they appear in the array
-        for i, node in enumerate(nodes):
+        def load_chunk(i):
+            """Read one chunk and, for tree hashes, verify it against its leaf digest"""
+            node = nodes[i]
             chunk_filename = node["permit"]["domains"][0]
             chunk_path = os.path.join(chunks_dir, chunk_filename)
             
@@ -187,8 +262,18 @@ class FileChunkManager:
             with open(chunk_path, 'rb') as f:
                 chunk_data = f.read()
             
-            assembled_data.extend(chunk_data)
-            print(f"Added chunk {i+1}/{len(nodes)}: {chunk_filename} ({len(chunk_data)} bytes)")
+            if "leaf_blake2b" in node:
+                leaf_digest = self.blake2_leaf_digest(chunk_data, i, leaf_count)
+                if leaf_digest != node["leaf_blake2b"]:
+                    raise ValueError(f"BLAKE2b leaf mismatch for {chunk_filename}")
+            return chunk_filename, chunk_data
+        
+        # Iterate through nodes in the order they appear in the array
+        workers = self.hash_workers if integrity_algo == "blake2b-tree" else 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for i, (chunk_filename, chunk_data) in enumerate(executor.map(load_chunk, range(len(nodes)))):
+                assembled_data.extend(chunk_data)
+                print(f"Added chunk {i+1}/{len(nodes)}: {chunk_filename} ({len(chunk_data)} bytes)")
         
         # Save reassembled file
         with open(output_file_path, 'wb') as f:
@@ -198,6 +283,16 @@ class FileChunkManager:
         if len(assembled_data) != metadata["total_size"]:
             raise ValueError(f"Size mismatch: expected {metadata['total_size']}, got {len(assembled_data)}")
         
+        if integrity_algo == "blake2b-tree":
+            # Leaves were verified per chunk; the root binds their order and count
+            reassembled_root = self.calculate_blake2_tree(output_file_path)[0]
+            if reassembled_root != metadata["original_blake2b_tree"]:
+                raise ValueError(f"BLAKE2b tree mismatch! Expected {metadata['original_blake2b_tree']}, got {reassembled_root}")
+            
+            print(f"Successfully reassembled {output_file_path}")
+            print(f"BLAKE2b tree verified: {reassembled_root}")
+            return output_file_path
+        
         # Verify SHA256
         reassembled_sha256 = self.calculate_sha256(output_file_path)
         if reassembled_sha256 != metadata["original_sha256"]:
@@ -209,13 +304,14 @@ class FileChunkManager:
         return output_file_path
     
     def verify_final_integrity(self, original_file, final_file):
-        """Verify SHA256 of original and final files match"""
-        original_hash = self.calculate_sha256(original_file)
-        final_hash = self.calculate_sha256(final_file)
+        """Verify digests (configured integrity algorithm) of original and final files match"""
+        original_hash = self.calculate_digest(original_file)
+        final_hash = self.calculate_digest(final_file)
+        label = "SHA256" if self.integrity_algo == "sha256" else "BLAKE2b tree"
         
         print(f"\n=== INTEGRITY VERIFICATION ===")
-        print(f"Original file SHA256: {original_hash}")
-        print(f"Final file SHA256:    {final_hash}")
+        print(f"Original file {label}: {original_hash}")
+        print(f"Final file {label}:    {final_hash}")
         
         if original_hash == final_hash:
             print("✅ SUCCESS: Files are identical! Data integrity verified.")
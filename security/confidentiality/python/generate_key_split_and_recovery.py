@@ -1,12 +1,16 @@
-#!pip install sslib
+#!pip install numpy
 
 import os
 import json
 import random
 from hashlib import sha256
-from sslib import shamir
 from typing import List
 
+import shamir_gf256 as shamir
+import share_codec
+from share_vault import ShareVault
+from master_key_hierarchy import MasterKeyring
+
 """ generate key without name order
 def generate_keys(key_names: List[str], key_length: int) -> dict:
     keys = {}
@@ -25,6 +29,13 @@ def generate_keys(key_names: List[str], key_length: int) -> dict:
         print(f"SHA256({name}) = {sha256(key_bytes).hexdigest()}")
     return keys
 
+def derive_keys(keyring: MasterKeyring, key_names: List[str]) -> dict:
+    keys = {}
+    for name, key_bytes in keyring.derive_many(key_names).items():
+        keys[name] = key_bytes.hex()
+        print(f"SHA256({name}) = {sha256(key_bytes).hexdigest()}")
+    return keys
+
 def sha256_of_json(obj: dict) -> str:
     json_bytes = json.dumps(obj, sort_keys=True).encode('utf-8')
     return sha256(json_bytes).hexdigest()
@@ -32,19 +43,27 @@ def sha256_of_json(obj: dict) -> str:
 def pretty_print_json(obj: dict):
     print(json.dumps(obj, indent=4, sort_keys=True))
 
-def shamir_split(secret: str, k: int, n: int): 
-    secret_bytes = secret.encode('utf-8')
-    return shamir.to_base64(shamir.split_secret(secret_bytes, k, n))
-
-def shamir_combine(shares):
-    combined = shamir.recover_secret(shamir.from_base64(shares))
-    return combined.decode('utf-8')
-
-def show_shares(shares_of_key, number_of_shares):
-    print(f"prime_mod: {shares_of_key['prime_mod']}")
+def show_shares(split_of_key, number_of_shares):
+    # split_of_key: {"required_shares": k, "shares": [(x, share_bytes), ...]} (shamir.split_many)
+    print(f"required_shares: {split_of_key['required_shares']}")
 
     for i in range(number_of_shares):
-        print(f"share_{i}: {shares_of_key['shares'][i]}")
+        x, share = split_of_key["shares"][i]
+        print(f"share_{i}: x={x} {share.hex()}")
+
+def load_share_mac_key(path: str) -> bytes:
+    # the vault MAC key must outlive the run, or earlier versions can never be verified again:
+    # $SHARE_MAC_KEY (hex) if set, else the key file, created (mode 0600) on the first run
+    if os.environ.get("SHARE_MAC_KEY"):
+        return bytes.fromhex(os.environ["SHARE_MAC_KEY"])
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        key = os.urandom(32)
+        with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as f:
+            f.write(key)
+        return key
 
 
 # --- Parameters ---
@@ -52,10 +71,20 @@ N_BYTES = 32
 KEY_NAMES = ['root_key_encryption', 'policy_encryption', 'key_ursa', 'key_major']
 N_SHARES = 5
 K_THRESHOLD = 3  # Minimum number of shares needed to reconstruct
+USE_MASTER_KEY = False  # True: split one master secret, derive every named key from it (master_key_hierarchy.py)
+MASTER_KEY_NAME = 'master_secret'
+VAULT_PATH = 'master_vault.db' if USE_MASTER_KEY else 'shares_vault.db'
+SHARE_MAC_KEY_PATH = 'shares_vault.key'
+SHARE_MAC_KEY = load_share_mac_key(SHARE_MAC_KEY_PATH)  # authenticates each share record (held by the verifier)
 
 # Step 1: Generate keys
-print("Generating keys...")
-keys = generate_keys(KEY_NAMES, N_BYTES)
+if USE_MASTER_KEY:
+    print("Generating master secret and deriving keys...")
+    master_secret = os.urandom(N_BYTES)
+    keys = derive_keys(MasterKeyring(master_secret, key_length=N_BYTES), KEY_NAMES)
+else:
+    print("Generating keys...")
+    keys = generate_keys(KEY_NAMES, N_BYTES)
 
 # Step 2: Format and hash JSON
 print("\nFormatted JSON:")
@@ -63,109 +92,91 @@ pretty_print_json(keys)
 
 print("\nSHA256(JSON):")
 json_str = json.dumps(keys, sort_keys=True)
-json_hash = hashlib.sha256(json_str.encode()).hexdigest()
+json_hash = sha256(json_str.encode()).hexdigest()
 print(json_hash)
 
-shares_of_keys_split = []
-
 parsed_keys = json.loads(json_str)
 count = 0
 
 # Step 3: Shamir split
+if USE_MASTER_KEY:
+    # only the master secret is split; the named keys are derived from it again after recovery
+    secrets_to_split = {MASTER_KEY_NAME: master_secret}
+else:
+    secrets_to_split = {key_name: bytes.fromhex(key_value) for key_name, key_value in parsed_keys.items()}
+# The whole keyring is split in one vectorised call (shamir.split_many)
+keys_split = shamir.split_many(secrets_to_split, K_THRESHOLD, N_SHARES)
+
 # Access and print each key name and its value
-for key_name, key_value in parsed_keys.items():
+for key_name, key_value in secrets_to_split.items():
     print(f"Key Name: {key_name}")
-    print(f"Key Value: {key_value}")
+    print(f"Key Value: {key_value.hex()}")
     print(f"\nSplitting secret with threshold {K_THRESHOLD} of {N_SHARES}...")
-    shares_of_keys_split.append(shamir_split(key_value, K_THRESHOLD, N_SHARES))
-    show_shares(shares_of_keys_split[count], N_SHARES)
+    show_shares(keys_split[key_name], N_SHARES)
     count += 1
 
-# store key_names
-print("\nFormatted JSON (key_names) before writing to key_names.json:")
-pretty_print_json(KEY_NAMES)
-
-with open('key_names.json', 'w') as f:
-    json.dump(KEY_NAMES, f)
-
-# store json 
-print("\nFormatted JSON (shares_of_keys_split) before writing to shares_of_keys_split.json:")
-pretty_print_json(shares_of_keys_split)
-
-with open('shares_of_keys_split.json', 'w') as f:
-    json.dump(shares_of_keys_split, f)
+# store shares in the vault: one row per (key name, version, custodian), binary share records
+vault = ShareVault(VAULT_PATH, SHARE_MAC_KEY)
+versions = vault.put_many(keys_split)
+print(f"\nStored {count * N_SHARES} share records ({share_codec.record_size(N_BYTES, with_mac=True)} bytes each) "
+      f"in {VAULT_PATH}")
+pretty_print_json(versions)
 
-del shares_of_keys_split
+del keys_split
 del KEY_NAMES
+vault.close()
 
-# print(f"KEY_NAMES: {KEY_NAMES}")
-
-# read key_names
-with open('key_names.json', 'r') as f:
-    KEY_NAMES = json.load(f)
+# reopen the vault; key names come from its index, not from list positions
+vault = ShareVault(VAULT_PATH, SHARE_MAC_KEY)
+if USE_MASTER_KEY:
+    # the vault holds only the master secret; the named keys are derived from it by name
+    KEY_NAMES = sorted(parsed_keys)
+else:
+    KEY_NAMES = list(vault.key_names())
 
 print(f"KEY_NAMES: {KEY_NAMES}")
 
-# read json
-with open('shares_of_keys_split.json', 'r') as f:
-    shares_of_keys_split = json.load(f)
-
-
-
-print("\nFormatted JSON (shares_of_keys_split) after reading from shares_of_keys_split.json:")
-pretty_print_json(shares_of_keys_split)
-
 # Step 4: Recombine and verify (with all shares given)
-keys_collected = []
 """
-for i in range(0, count):
-    print(f"\nReconstructing key_{i}...")
-    reconstructed = shamir_combine(shares_of_keys_split[i])
+for key_name in KEY_NAMES:
+    print(f"\nReconstructing {key_name}...")
+    reconstructed = shamir.recover_secret(vault.get(key_name)).hex()
     print(reconstructed)
 """ 
 
-# Step 4: Recombine and verify (with randomly selected k shares given)
-for i in range(count):
-    print(f"\nReconstructing key_{i}...")
-
-    # Get full share dictionary
-    full_share_dict = shares_of_keys_split[i]
-
-    # Select K_THRESHOLD random shares
-    selected_shares = random.sample(full_share_dict["shares"], K_THRESHOLD)
-
-    # Build a reconstruction dictionary with the same format as original
-    partial_share_dict = {
-        "required_shares": K_THRESHOLD,
-        "prime_mod": full_share_dict["prime_mod"],
-        "shares": selected_shares
-    }
+# Step 4: Recombine and verify (with randomly selected k custodians per key)
+if USE_MASTER_KEY:
+    # one recovery ceremony: K_THRESHOLD random custodians rebuild the master secret
+    custodians = random.sample(range(1, N_SHARES + 1), K_THRESHOLD)
+    master_split = vault.get(MASTER_KEY_NAME, custodians=custodians)
+    keyring = MasterKeyring.from_shares(master_split["shares"], master_split["required_shares"], key_length=N_BYTES)
+    recovered_keys = keyring.derive_many(KEY_NAMES)
+else:
+    selected_share_sets = {}
+    for key_name in KEY_NAMES:
+        # Fetch only K_THRESHOLD random custodians' shares of this key from the vault
+        custodians = random.sample(range(1, N_SHARES + 1), K_THRESHOLD)
+        selected_share_sets[key_name] = vault.get(key_name, custodians=custodians)
+
+    # Combine all keys in one call (shamir.recover_many)
+    recovered_keys = shamir.recover_many(selected_share_sets)
+
+# reconstruct json and verify: recovered keys are keyed by name, no reordering needed
+reconstructed_keys = {}
+for key_name in KEY_NAMES:
+    print(f"\nReconstructing {key_name}...")
 
-    # Combine and decode
-    reconstructed = shamir_combine(partial_share_dict)
-    keys_collected.append(reconstructed)
+    # Decode
+    reconstructed = recovered_keys[key_name].hex()
+    reconstructed_keys[key_name] = reconstructed
     
     # Verify match
-    original = list(parsed_keys.values())[i]
-    print(f"Reconstructed key_{i}: {reconstructed}")
-    print(f"Original key_{i}     : {original}")
+    original = parsed_keys[key_name]
+    print(f"Reconstructed {key_name}: {reconstructed}")
+    print(f"Original {key_name}     : {original}")
     print("Match:", reconstructed == original)
 
-
-# reverse keys_collected list
-keys_collected = keys_collected[::-1]
-
-# reconstruct json and verify
 print("\nFormatted JSON:")
-# Recombine key-value dictionary using original key names
-# reconstructed_keys = dict(zip(KEY_NAMES, keys_collected)) # dict(zip(...)) doesn't guarantee the original key order will match the collected keys unless the order in keys_collected corresponds exactly to KEY_NAMES. Since the reconstruction loop uses i, it's safer to explicitly construct the dictionary with the known order.
-# Recombine key-value dictionary using correct order
-reconstructed_keys = {}
-for idx in range(len(KEY_NAMES)):
-    key_name = KEY_NAMES[idx]
-    reconstructed_keys[key_name] = keys_collected[idx]
-    print(f"Key Name: {key_name}")
-    print(f"Key Value: {keys_collected[idx]}")
 
 pretty_print_json(reconstructed_keys)
 
@@ -181,205 +192,101 @@ print("\n✅ Match with original hash:", reconstructed_json_hash == json_hash)
 
 """
 Generating keys...
-SHA256(root_key_encryption) = ebbafb6830df94d9f9093c2aca43b5de3c50f3f3747200edb41ad79e74af2626
-SHA256(policy_encryption) = 3bfcbca65c3905c4544bc0008b049b8d4e8d722ad85324a9f502741d9d589dd1
-SHA256(key_ursa) = 64336c297f50018772f74f93882c41ff5d6d5c523d0c4e0f13e9306eb1246540
-SHA256(key_major) = 2c5bc606a3f17dcd5096dd9f4cbeecb68d65b98223f61d05cf4bb623c5a8e24f
+SHA256(root_key_encryption) = c76d00cc39f5347ac833dd0a6c339cfa2b269e536d1975178e452355a0bcee5f
+SHA256(policy_encryption) = fb23c4dffc5751e03fa85be969c91a1e3a558a0300d75a38529859921d0a873e
+SHA256(key_ursa) = f7c377fce939d23ee5e0703279eeac1e216c9b93dae3bcb26dc487e32db513dc
+SHA256(key_major) = bdc41178d839bc12bc957f24b15ca81460ba087ffee30352b1db81d37e3734a4
 
 Formatted JSON:
 {
-    "key_major": "39964b5303318f7ed23a35425a220fdbd1cdbbf2a4c99c4fd49322c1f731aded",
-    "key_ursa": "53365b6d12662ee8047a5c0279d2c325d50e7a0774e113a06e4dc16eae1dc3d2",
-    "policy_encryption": "ba13616e57d92fc94c121da8d10108cbde50b8b556ccaf93d1190bd755a70897",
-    "root_key_encryption": "c2dabdde201c5dd65622675c6b4ef1d584cbbc64a4f19dee2d9bdda279ca20d9"
+    "key_major": "16b5567a5a9f67cd39bbaab07ed38a952a96ac6992d594a0922d5b0327647079",
+    "key_ursa": "5c8cfd02b392256fe4ed299196779618fb65fd571d57f667d88dd808e41fe0e0",
+    "policy_encryption": "5c2e68e35ab2bd2def31dbecf932cbdb60cd447aa11015472c970c77e5b7de45",
+    "root_key_encryption": "737cd8998afd6061955ea6b8cd1e22bc83c3eb1e70e09e180aa7f912e289d016"
 }
 
 SHA256(JSON):
-fc68cf1b4eda2d6b69181bb2916e0d9695771fc97e547271d9df4ff6fd4cd0b1
+0f455d91c68376279581b4522582ffcd792e95adfb0ac4e4990909c608dd2494
 Key Name: key_major
-Key Value: 39964b5303318f7ed23a35425a220fdbd1cdbbf2a4c99c4fd49322c1f731aded
+Key Value: 16b5567a5a9f67cd39bbaab07ed38a952a96ac6992d594a0922d5b0327647079
 
 Splitting secret with threshold 3 of 5...
-prime_mod: Af//////////////////////////////////////////////////////////////////////////////////////
-share_0: 1-AYcjQ2Y8CiXu6i9WkKSIXye0vpRVXsE5KXF5SES5+U+PLht/OAJhoH4Z1dOc8uKh/qWzRqDy0IfaQtydqO/vkpne
-share_1: 2-AZtssC1fi7JqPzoilp+jALWoQDYpssmMa5g8yE/5xGy1zRZ2U+iQGsArEJKHKZ/PKYyOSDTiSI1+TQvAozw/cP+H
-share_2: 3-Zw9/jqC5B6cyUJdFIohK4T/pF7BdTC76pn/hU/GRvdg/VRa3Fu3RLGYRcSHdcOq1GvU49QGaQ09P86AiFlD/ll8=
-share_3: 4-AeoLsYn/kiWlw3K0nC04Pap7uTjpXkkg1pxCk1ChYUL2hNdgYY16w8LK2G9tDlX0oVDoGOFQxalNS5Q8JX4kPl5k
-share_4: 5-JGFGH3wXDGXyoHqbv7LZEVuwmdS1wGH/eYTeRgky/BCdnVNTTDbyg1lljWi8TuzuLmbn+c/Kv3g/7ZStc7ktV5k=
+required_shares: 3
+share_0: x=1 c28a2767ef739c024f6da7023847ab6b0e7a295c52b4485c4cf293083e3ff417
+share_1: x=2 925fa3c01b875e854ba3089f905930f840fa5ff83720c4581e244e6d5ffb28e8
+share_2: x=3 4660d2ddae6ba54a3d75052dd6cd11066416dacdf74118a4c0fb866646a0ac86
+share_3: x=4 d91cfb2318ee6844930123b52a0e285176c4f4913bf8d5273db93f24e4e5f76f
+share_4: x=5 0d238a3ead02938be5d72e076c9a09af522871a4fb9909dbe366f72ffdbe7301
 Key Name: key_ursa
-Key Value: 53365b6d12662ee8047a5c0279d2c325d50e7a0774e113a06e4dc16eae1dc3d2
+Key Value: 5c8cfd02b392256fe4ed299196779618fb65fd571d57f667d88dd808e41fe0e0
 
 Splitting secret with threshold 3 of 5...
-prime_mod: Af//////////////////////////////////////////////////////////////////////////////////////
-share_0: 1-AfLvTtEOT1Q7k0K/HOHqN2iQdrciV/uxG5NyhxO071zRLfkzm3AupRGceEVuFoMrgrdgj0Caywc3bnIOj6biU0yP
-share_1: 2-ARkvcdNMdkKTrYQUn+mcVdqdhYvwJQFDXCHzYRQ1ekZiiRI9TTBmxoeSzalH7ktnRYpNMzhf6q6T2EZMySZGZ69h
-share_2: 3-AZz1nDnwqi0+svUyv01IwLtfXLKgyEYZ8d25x2W0A+/mRq9SRaXfxZIaN1/yuInmqaj8URuzwidLot4f3eKPcIym
-share_3: 4-AX5BzgT66xQ8o5YZewzveArV/Cs0Qco03MbFuggwjFlcZtByhNCZojEytWludT6prxNt6OqWUXFezjmHzdu9beRf
-share_4: 5-vRQHNGs4941/ZsjTKJB7yQFj9aqRjZQc3Rc4+6sTgsTpdZ4KsJRcZNxHxbskabBVyaH6pQeYjM1aWISZEdBftow=
+required_shares: 3
+share_0: x=1 fcc6acf4de8fffc0a851d9b974bc6d8b294546b1355e50bea6485fb368279686
+share_1: x=2 f66f83ba38a7fe5129b4eefcdf6b25ae76fff2fd3b6887e7ff5c1b2ca988e52c
+share_2: x=3 5625d24c55ba24fe65081ed43da0de3da4df491b1361213e81999c9725b0934a
+share_3: x=4 fa965c4ee1c443e42ab74cbf6a3d8875320f70f7929d8cd8d72f307f5d9b6363
+share_4: x=5 5adc0db88cd9994b660bbc9788f673e6e02fcb11ba942a01a9eab7c4d1a31505
 Key Name: policy_encryption
-Key Value: ba13616e57d92fc94c121da8d10108cbde50b8b556ccaf93d1190bd755a70897
+Key Value: 5c2e68e35ab2bd2def31dbecf932cbdb60cd447aa11015472c970c77e5b7de45
 
 Splitting secret with threshold 3 of 5...
-prime_mod: Af//////////////////////////////////////////////////////////////////////////////////////
-share_0: 1-zF72YHE4f0WrohdRxzaVwPRj1Bwjsu5uCE+Xui2KKq20pt+jlu440hqlFuVYtYu13WJ8gllYYGLw0weLQFJrTts=
-share_1: 2-AVHfwxLvFmOd2o4orV7e3n37+FG9SVtOCeQBBoAyQLbUE5I0eK7uf0hD0I7cdQI3A2MV8dzeaHQbE2+x/LxxQm3s
-share_2: 3-Abrkx0isz94+8flrdwArQJpP8dwUoyqDNMt4fYI/U9zWfyZjtHhjC8Swt55IuEdoIcR+kUDIYJ2Mnws0tauMvZZq
-share_3: 4-B24DAapk7yjx49+uqxu8FfBQcyIxII3uvrX8wFTDnLT3Y21W80veR2FaRSoihR8RAZxarhdA3LeTpY+2DaTcyFY=
-share_4: 5-N3t2PefVllvaTYVUX7BQ8N0UFuXzPW43vbmEOnKP9m98SVFgH6j20FW4g4Czu1vRGm9OJMsJMZvxPsL94rmgA64=
+required_shares: 3
+share_0: x=1 603018b33d51b045bc5999224b8044a2d063726511e14abdbd1b6ed5216a4d58
+share_1: x=2 a86f55fda2073b5230bcb7fea564830ad431e4903d699089a2419e0899e1762b
+share_2: x=3 947125adc5e4363a63d4f53017d60c73649fd28f8d98cf7333cdfcaa5d3ce536
+share_3: x=4 a9434b116978ec59b55f8eaacd3a74ee02f402c833d4e844c15970098ceaf7d2
+share_4: x=5 955d3b410e9be131e637cc647f88fb97b25a34d78325b7be50d512ab483764cf
 Key Name: root_key_encryption
-Key Value: c2dabdde201c5dd65622675c6b4ef1d584cbbc64a4f19dee2d9bdda279ca20d9
+Key Value: 737cd8998afd6061955ea6b8cd1e22bc83c3eb1e70e09e180aa7f912e289d016
 
 Splitting secret with threshold 3 of 5...
-prime_mod: Af//////////////////////////////////////////////////////////////////////////////////////
-share_0: 1-f8hn9k+6y2Pig5JDMYAvrcKclqarhbcD+Q3ufUbYTfEdi9nbN333x+DybUvBlKoFH9UL27D+YgoZ793Jl0ni2JY=
-share_1: 2-AVDxEzg7RfAFgEnSkpfMO5wfHh9APcpCk0ifrfyvHiWmtBQ8aidVuvxnjfxX9Wm+Q/XF5aKWZHSrl/pbFl8NkxYI
-share_2: 3-nd00KiQD0kk+hPEflhmIL0u5z/7pA9njUeugsp43uIT40VwQMems08gz4YrMuKEh5wTxjhKWnEWsVrFJuH1BHJA=
-share_3: 4-ZozKzAn0ci8dNO3qLGgVZ0hvqOKtMnz0FPHGnxQlBovrwzjNVznNTgLkHORHgVKe85IvniWU2NhXBOBjo5js7C0=
-share_4: 5-qv/XHe0Xz7ccWcjyWrfjRBU/qeuKVivFkbIfwhDmD7uM6dKhl0YcaxeermRlw9K7G22f0s9fKmOYBOhkIGCWhN8=
-
-Formatted JSON (key_names) before writing to key_names.json:
-[
-    "root_key_encryption",
-    "policy_encryption",
-    "key_ursa",
-    "key_major"
-]
-
-Formatted JSON (shares_of_keys_split) before writing to shares_of_keys_split.json:
-[
-    {
-        "prime_mod": "Af//////////////////////////////////////////////////////////////////////////////////////",
-        "required_shares": 3,
-        "shares": [
-            "1-AYcjQ2Y8CiXu6i9WkKSIXye0vpRVXsE5KXF5SES5+U+PLht/OAJhoH4Z1dOc8uKh/qWzRqDy0IfaQtydqO/vkpne",
-            "2-AZtssC1fi7JqPzoilp+jALWoQDYpssmMa5g8yE/5xGy1zRZ2U+iQGsArEJKHKZ/PKYyOSDTiSI1+TQvAozw/cP+H",
-            "3-Zw9/jqC5B6cyUJdFIohK4T/pF7BdTC76pn/hU/GRvdg/VRa3Fu3RLGYRcSHdcOq1GvU49QGaQ09P86AiFlD/ll8=",
-            "4-AeoLsYn/kiWlw3K0nC04Pap7uTjpXkkg1pxCk1ChYUL2hNdgYY16w8LK2G9tDlX0oVDoGOFQxalNS5Q8JX4kPl5k",
-            "5-JGFGH3wXDGXyoHqbv7LZEVuwmdS1wGH/eYTeRgky/BCdnVNTTDbyg1lljWi8TuzuLmbn+c/Kv3g/7ZStc7ktV5k="
-        ]
-    },
-    {
-        "prime_mod": "Af//////////////////////////////////////////////////////////////////////////////////////",
-        "required_shares": 3,
-        "shares": [
-            "1-AfLvTtEOT1Q7k0K/HOHqN2iQdrciV/uxG5NyhxO071zRLfkzm3AupRGceEVuFoMrgrdgj0Caywc3bnIOj6biU0yP",
-            "2-ARkvcdNMdkKTrYQUn+mcVdqdhYvwJQFDXCHzYRQ1ekZiiRI9TTBmxoeSzalH7ktnRYpNMzhf6q6T2EZMySZGZ69h",
-            "3-AZz1nDnwqi0+svUyv01IwLtfXLKgyEYZ8d25x2W0A+/mRq9SRaXfxZIaN1/yuInmqaj8URuzwidLot4f3eKPcIym",
-            "4-AX5BzgT66xQ8o5YZewzveArV/Cs0Qco03MbFuggwjFlcZtByhNCZojEytWludT6prxNt6OqWUXFezjmHzdu9beRf",
-            "5-vRQHNGs4941/ZsjTKJB7yQFj9aqRjZQc3Rc4+6sTgsTpdZ4KsJRcZNxHxbskabBVyaH6pQeYjM1aWISZEdBftow="
-        ]
-    },
-    {
-        "prime_mod": "Af//////////////////////////////////////////////////////////////////////////////////////",
-        "required_shares": 3,
-        "shares": [
-            "1-zF72YHE4f0WrohdRxzaVwPRj1Bwjsu5uCE+Xui2KKq20pt+jlu440hqlFuVYtYu13WJ8gllYYGLw0weLQFJrTts=",
-            "2-AVHfwxLvFmOd2o4orV7e3n37+FG9SVtOCeQBBoAyQLbUE5I0eK7uf0hD0I7cdQI3A2MV8dzeaHQbE2+x/LxxQm3s",
-            "3-Abrkx0isz94+8flrdwArQJpP8dwUoyqDNMt4fYI/U9zWfyZjtHhjC8Swt55IuEdoIcR+kUDIYJ2Mnws0tauMvZZq",
-            "4-B24DAapk7yjx49+uqxu8FfBQcyIxII3uvrX8wFTDnLT3Y21W80veR2FaRSoihR8RAZxarhdA3LeTpY+2DaTcyFY=",
-            "5-N3t2PefVllvaTYVUX7BQ8N0UFuXzPW43vbmEOnKP9m98SVFgH6j20FW4g4Czu1vRGm9OJMsJMZvxPsL94rmgA64="
-        ]
-    },
-    {
-        "prime_mod": "Af//////////////////////////////////////////////////////////////////////////////////////",
-        "required_shares": 3,
-        "shares": [
-            "1-f8hn9k+6y2Pig5JDMYAvrcKclqarhbcD+Q3ufUbYTfEdi9nbN333x+DybUvBlKoFH9UL27D+YgoZ793Jl0ni2JY=",
-            "2-AVDxEzg7RfAFgEnSkpfMO5wfHh9APcpCk0ifrfyvHiWmtBQ8aidVuvxnjfxX9Wm+Q/XF5aKWZHSrl/pbFl8NkxYI",
-            "3-nd00KiQD0kk+hPEflhmIL0u5z/7pA9njUeugsp43uIT40VwQMems08gz4YrMuKEh5wTxjhKWnEWsVrFJuH1BHJA=",
-            "4-ZozKzAn0ci8dNO3qLGgVZ0hvqOKtMnz0FPHGnxQlBovrwzjNVznNTgLkHORHgVKe85IvniWU2NhXBOBjo5js7C0=",
-            "5-qv/XHe0Xz7ccWcjyWrfjRBU/qeuKVivFkbIfwhDmD7uM6dKhl0YcaxeermRlw9K7G22f0s9fKmOYBOhkIGCWhN8="
-        ]
-    }
-]
-KEY_NAMES: ['root_key_encryption', 'policy_encryption', 'key_ursa', 'key_major']
-
-Formatted JSON (shares_of_keys_split) after reading from shares_of_keys_split.json:
-[
-    {
-        "prime_mod": "Af//////////////////////////////////////////////////////////////////////////////////////",
-        "required_shares": 3,
-        "shares": [
-            "1-AYcjQ2Y8CiXu6i9WkKSIXye0vpRVXsE5KXF5SES5+U+PLht/OAJhoH4Z1dOc8uKh/qWzRqDy0IfaQtydqO/vkpne",
-            "2-AZtssC1fi7JqPzoilp+jALWoQDYpssmMa5g8yE/5xGy1zRZ2U+iQGsArEJKHKZ/PKYyOSDTiSI1+TQvAozw/cP+H",
-            "3-Zw9/jqC5B6cyUJdFIohK4T/pF7BdTC76pn/hU/GRvdg/VRa3Fu3RLGYRcSHdcOq1GvU49QGaQ09P86AiFlD/ll8=",
-            "4-AeoLsYn/kiWlw3K0nC04Pap7uTjpXkkg1pxCk1ChYUL2hNdgYY16w8LK2G9tDlX0oVDoGOFQxalNS5Q8JX4kPl5k",
-            "5-JGFGH3wXDGXyoHqbv7LZEVuwmdS1wGH/eYTeRgky/BCdnVNTTDbyg1lljWi8TuzuLmbn+c/Kv3g/7ZStc7ktV5k="
-        ]
-    },
-    {
-        "prime_mod": "Af//////////////////////////////////////////////////////////////////////////////////////",
-        "required_shares": 3,
-        "shares": [
-            "1-AfLvTtEOT1Q7k0K/HOHqN2iQdrciV/uxG5NyhxO071zRLfkzm3AupRGceEVuFoMrgrdgj0Caywc3bnIOj6biU0yP",
-            "2-ARkvcdNMdkKTrYQUn+mcVdqdhYvwJQFDXCHzYRQ1ekZiiRI9TTBmxoeSzalH7ktnRYpNMzhf6q6T2EZMySZGZ69h",
-            "3-AZz1nDnwqi0+svUyv01IwLtfXLKgyEYZ8d25x2W0A+/mRq9SRaXfxZIaN1/yuInmqaj8URuzwidLot4f3eKPcIym",
-            "4-AX5BzgT66xQ8o5YZewzveArV/Cs0Qco03MbFuggwjFlcZtByhNCZojEytWludT6prxNt6OqWUXFezjmHzdu9beRf",
-            "5-vRQHNGs4941/ZsjTKJB7yQFj9aqRjZQc3Rc4+6sTgsTpdZ4KsJRcZNxHxbskabBVyaH6pQeYjM1aWISZEdBftow="
-        ]
-    },
-    {
-        "prime_mod": "Af//////////////////////////////////////////////////////////////////////////////////////",
-        "required_shares": 3,
-        "shares": [
-            "1-zF72YHE4f0WrohdRxzaVwPRj1Bwjsu5uCE+Xui2KKq20pt+jlu440hqlFuVYtYu13WJ8gllYYGLw0weLQFJrTts=",
-            "2-AVHfwxLvFmOd2o4orV7e3n37+FG9SVtOCeQBBoAyQLbUE5I0eK7uf0hD0I7cdQI3A2MV8dzeaHQbE2+x/LxxQm3s",
-            "3-Abrkx0isz94+8flrdwArQJpP8dwUoyqDNMt4fYI/U9zWfyZjtHhjC8Swt55IuEdoIcR+kUDIYJ2Mnws0tauMvZZq",
-            "4-B24DAapk7yjx49+uqxu8FfBQcyIxII3uvrX8wFTDnLT3Y21W80veR2FaRSoihR8RAZxarhdA3LeTpY+2DaTcyFY=",
-            "5-N3t2PefVllvaTYVUX7BQ8N0UFuXzPW43vbmEOnKP9m98SVFgH6j20FW4g4Czu1vRGm9OJMsJMZvxPsL94rmgA64="
-        ]
-    },
-    {
-        "prime_mod": "Af//////////////////////////////////////////////////////////////////////////////////////",
-        "required_shares": 3,
-        "shares": [
-            "1-f8hn9k+6y2Pig5JDMYAvrcKclqarhbcD+Q3ufUbYTfEdi9nbN333x+DybUvBlKoFH9UL27D+YgoZ793Jl0ni2JY=",
-            "2-AVDxEzg7RfAFgEnSkpfMO5wfHh9APcpCk0ifrfyvHiWmtBQ8aidVuvxnjfxX9Wm+Q/XF5aKWZHSrl/pbFl8NkxYI",
-            "3-nd00KiQD0kk+hPEflhmIL0u5z/7pA9njUeugsp43uIT40VwQMems08gz4YrMuKEh5wTxjhKWnEWsVrFJuH1BHJA=",
-            "4-ZozKzAn0ci8dNO3qLGgVZ0hvqOKtMnz0FPHGnxQlBovrwzjNVznNTgLkHORHgVKe85IvniWU2NhXBOBjo5js7C0=",
-            "5-qv/XHe0Xz7ccWcjyWrfjRBU/qeuKVivFkbIfwhDmD7uM6dKhl0YcaxeermRlw9K7G22f0s9fKmOYBOhkIGCWhN8="
-        ]
-    }
-]
-
-Reconstructing key_0...
-Reconstructed key_0: 39964b5303318f7ed23a35425a220fdbd1cdbbf2a4c99c4fd49322c1f731aded
-Original key_0     : 39964b5303318f7ed23a35425a220fdbd1cdbbf2a4c99c4fd49322c1f731aded
+required_shares: 3
+share_0: x=1 ec6fa14bd43140b9c361d6091c44e7801cb8726043d0b797521f0c1d53c8b4e0
+share_1: x=2 fa35f94822473fa11a601a7dfa6dd4646bc0465e06e1538431ce63e5ec9cd4e0
+share_2: x=3 6526809a7c8b1f794c5f6acc2b371158f4bbdf2035d17a0b697696ea5dddb016
+share_3: x=4 fc49fb839176a24d1c39aeefadc952a1513c8c58dc7d5569667d616e39c9c5e5
+share_4: x=5 635a8251cfba82954a06de5e7c93979dce471526ef4d7ce63ec594618888a113
+
+Stored 20 share records (56 bytes each) in shares_vault.db
+{
+    "key_major": 1,
+    "key_ursa": 1,
+    "policy_encryption": 1,
+    "root_key_encryption": 1
+}
+KEY_NAMES: ['key_major', 'key_ursa', 'policy_encryption', 'root_key_encryption']
+
+Reconstructing key_major...
+Reconstructed key_major: 16b5567a5a9f67cd39bbaab07ed38a952a96ac6992d594a0922d5b0327647079
+Original key_major     : 16b5567a5a9f67cd39bbaab07ed38a952a96ac6992d594a0922d5b0327647079
 Match: True
 
-Reconstructing key_1...
-Reconstructed key_1: 53365b6d12662ee8047a5c0279d2c325d50e7a0774e113a06e4dc16eae1dc3d2
-Original key_1     : 53365b6d12662ee8047a5c0279d2c325d50e7a0774e113a06e4dc16eae1dc3d2
+Reconstructing key_ursa...
+Reconstructed key_ursa: 5c8cfd02b392256fe4ed299196779618fb65fd571d57f667d88dd808e41fe0e0
+Original key_ursa     : 5c8cfd02b392256fe4ed299196779618fb65fd571d57f667d88dd808e41fe0e0
 Match: True
 
-Reconstructing key_2...
-Reconstructed key_2: ba13616e57d92fc94c121da8d10108cbde50b8b556ccaf93d1190bd755a70897
-Original key_2     : ba13616e57d92fc94c121da8d10108cbde50b8b556ccaf93d1190bd755a70897
+Reconstructing policy_encryption...
+Reconstructed policy_encryption: 5c2e68e35ab2bd2def31dbecf932cbdb60cd447aa11015472c970c77e5b7de45
+Original policy_encryption     : 5c2e68e35ab2bd2def31dbecf932cbdb60cd447aa11015472c970c77e5b7de45
 Match: True
 
-Reconstructing key_3...
-Reconstructed key_3: c2dabdde201c5dd65622675c6b4ef1d584cbbc64a4f19dee2d9bdda279ca20d9
-Original key_3     : c2dabdde201c5dd65622675c6b4ef1d584cbbc64a4f19dee2d9bdda279ca20d9
+Reconstructing root_key_encryption...
+Reconstructed root_key_encryption: 737cd8998afd6061955ea6b8cd1e22bc83c3eb1e70e09e180aa7f912e289d016
+Original root_key_encryption     : 737cd8998afd6061955ea6b8cd1e22bc83c3eb1e70e09e180aa7f912e289d016
 Match: True
 
 Formatted JSON:
-Key Name: root_key_encryption
-Key Value: c2dabdde201c5dd65622675c6b4ef1d584cbbc64a4f19dee2d9bdda279ca20d9
-Key Name: policy_encryption
-Key Value: ba13616e57d92fc94c121da8d10108cbde50b8b556ccaf93d1190bd755a70897
-Key Name: key_ursa
-Key Value: 53365b6d12662ee8047a5c0279d2c325d50e7a0774e113a06e4dc16eae1dc3d2
-Key Name: key_major
-Key Value: 39964b5303318f7ed23a35425a220fdbd1cdbbf2a4c99c4fd49322c1f731aded
 {
-    "key_major": "39964b5303318f7ed23a35425a220fdbd1cdbbf2a4c99c4fd49322c1f731aded",
-    "key_ursa": "53365b6d12662ee8047a5c0279d2c325d50e7a0774e113a06e4dc16eae1dc3d2",
-    "policy_encryption": "ba13616e57d92fc94c121da8d10108cbde50b8b556ccaf93d1190bd755a70897",
-    "root_key_encryption": "c2dabdde201c5dd65622675c6b4ef1d584cbbc64a4f19dee2d9bdda279ca20d9"
+    "key_major": "16b5567a5a9f67cd39bbaab07ed38a952a96ac6992d594a0922d5b0327647079",
+    "key_ursa": "5c8cfd02b392256fe4ed299196779618fb65fd571d57f667d88dd808e41fe0e0",
+    "policy_encryption": "5c2e68e35ab2bd2def31dbecf932cbdb60cd447aa11015472c970c77e5b7de45",
+    "root_key_encryption": "737cd8998afd6061955ea6b8cd1e22bc83c3eb1e70e09e180aa7f912e289d016"
 }
 
 SHA256(Reconstructed JSON):
-fc68cf1b4eda2d6b69181bb2916e0d9695771fc97e547271d9df4ff6fd4cd0b1
+0f455d91c68376279581b4522582ffcd792e95adfb0ac4e4990909c608dd2494
 
 ✅ Match with original hash: True
 
@@ -399,17 +306,31 @@ Keys are serialized into JSON (sorted by key).
 SHA-256 hash of the entire JSON object is computed for later verification.
 
 3. Shamir Split
-Each key is split into N_SHARES using threshold K_THRESHOLD.
-Shares are base64 encoded using sslib.shamir.to_base64().
-Each share and the prime modulus are printed for each key.
+Each key is split into N_SHARES using threshold K_THRESHOLD (all keys in one shamir_gf256.split_many call).
+Keys are split byte-wise over GF(256) (shamir_gf256.py), so each share is as long as the raw key.
+Shares are encoded as compact binary records (share_codec.py): versioned header,
+threshold, 1-byte x-coordinate, raw share bytes and a truncated HMAC.
+The HMAC key comes from $SHARE_MAC_KEY (hex) or shares_vault.key, created on
+the first run, so versions written by earlier runs still verify.
+Each share and the threshold are printed for each key.
+Records are stored in an append-only SQLite vault (share_vault.py), one row per
+(key name, version, custodian); a re-split or refresh is appended as a new version.
+Each record's HMAC also covers its row, so a record copied to another key,
+version or custodian fails to decode.
 
 4. Shamir Recombine
-For each key, randomly selects K_THRESHOLD shares.
-Reconstructs the key using sslib.shamir.recover_secret().
+For each key, fetches the shares of K_THRESHOLD random custodians from the vault by name; all keys are recombined in one shamir_gf256.recover_many call.
+Reconstructs the key using shamir_gf256.recover_secret() (Lagrange interpolation at x = 0).
 Verifies reconstructed key matches the original hex string.
 
+Master-key mode (USE_MASTER_KEY = True, vault master_vault.db)
+Only one master secret is split and stored (as master_secret); every named key is
+HKDF-SHA256(master, info=key name) (master_key_hierarchy.py). The shares no longer
+grow with KEY_NAMES, and one recovery ceremony unlocks every key; adding a key
+needs no new shares. The named keys are derived again from the recovered master.
+
 5. Reconstruct JSON & Final Verification
-Rebuilds the key-value JSON using KEY_NAMES and collected keys.
+Rebuilds the key-value JSON from the vault key names and the recovered keys (no list-position matching).
 Pretty prints the reconstructed JSON.
 Recomputes SHA-256 hash of the reconstructed JSON.
 Compares against original hash to verify full integrity.
@@ -0,0 +1,159 @@
+#!pip install numpy
+
+"""
+Master-key hierarchy: split one master secret, derive every named key from it.
+
+Splitting each entry of KEY_NAMES on its own makes share volume and custodian
+work grow with the keyring. Here only the master secret goes through Shamir
+(shamir_gf256.py); every named key is HKDF-SHA256(master, info=key name)
+(RFC 5869, built on the stdlib hmac module). One recovery ceremony unlocks any
+number of keys, and adding a key needs no new shares.
+generate_key_split_and_recovery.py works this way with USE_MASTER_KEY = True.
+
+- HKDF-Extract runs once per keyring; deriving a key is a single Expand
+  (one HMAC call for a 32-byte key)
+- derived keys are kept in an LRU cache (OrderedDict) of bounded size;
+  evicted keys are simply derived again on the next lookup
+- the same master, salt and name always give the same key, so derived keys
+  are never stored or split
+"""
+import hmac
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import shamir_gf256 as shamir
+
+HASH = hashlib.sha256
+HASH_LENGTH = HASH().digest_size
+DEFAULT_KEY_LENGTH = 32
+DEFAULT_CACHE_SIZE = 1024
+
+
+def hkdf_extract(salt: Optional[bytes], ikm: bytes) -> bytes:
+    """HKDF-Extract: PRK = HMAC(salt, ikm); an empty salt means HashLen zero bytes"""
+    return hmac.new(salt or bytes(HASH_LENGTH), ikm, HASH).digest()
+
+
+def hkdf_expand(prk: bytes, info: bytes, length: int = DEFAULT_KEY_LENGTH) -> bytes:
+    """HKDF-Expand: T(i) = HMAC(PRK, T(i-1) || info || i), truncated to length"""
+    if length > 255 * HASH_LENGTH:
+        raise ValueError(f"Cannot expand to more than {255 * HASH_LENGTH} bytes")
+    okm, block = b"", b""
+    for counter in range(1, -(-length // HASH_LENGTH) + 1):
+        block = hmac.new(prk, block + info + bytes([counter]), HASH).digest()
+        okm += block
+    return okm[:length]
+
+
+def hkdf(ikm: bytes, info: bytes, length: int = DEFAULT_KEY_LENGTH, salt: Optional[bytes] = None) -> bytes:
+    """HKDF-SHA256 (extract then expand)"""
+    return hkdf_expand(hkdf_extract(salt, ikm), info, length)
+
+
+class MasterKeyring:
+    def __init__(self, master_secret: bytes, salt: Optional[bytes] = None,
+                 key_length: int = DEFAULT_KEY_LENGTH, cache_size: int = DEFAULT_CACHE_SIZE):
+        if len(master_secret) < HASH_LENGTH:
+            raise ValueError(f"Master secret must be at least {HASH_LENGTH} bytes")
+        self.key_length = key_length
+        self.cache_size = cache_size
+        self._prk = hkdf_extract(salt, master_secret)
+        self._cache = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    # ==================== Derivation ====================
+
+    def derive(self, name: str) -> bytes:
+        """Key for `name` (HKDF-Expand with the UTF-8 name as info), cached"""
+        key = self._cache.get(name)
+        if key is not None:
+            self._cache.move_to_end(name)
+            self.hits += 1
+            return key
+
+        self.misses += 1
+        key = hkdf_expand(self._prk, name.encode('utf-8'), self.key_length)
+        if self.cache_size > 0:
+            self._cache[name] = key
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+        return key
+
+    __getitem__ = derive
+
+    def derive_many(self, names: Iterable[str]) -> Dict[str, bytes]:
+        """{name: key} for every name"""
+        return {name: self.derive(name) for name in names}
+
+    # ==================== Cache ====================
+
+    def cache_info(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "size": len(self._cache), "max_size": self.cache_size}
+
+    def clear_cache(self):
+        """Drop all cached keys (e.g. when the keyring is locked again)"""
+        self._cache.clear()
+
+    # ==================== Master secret sharing ====================
+
+    @staticmethod
+    def split_master(master_secret: bytes, k: int, n: int) -> List[Tuple[int, bytes]]:
+        """Split the master secret into n (x, share) pairs, any k of which recover it"""
+        return shamir.split_secret(master_secret, k, n)
+
+    @classmethod
+    def from_shares(cls, shares: Sequence[Tuple[int, bytes]], k: Optional[int] = None, **kwargs) -> "MasterKeyring":
+        """Recovery ceremony: rebuild the keyring from k shares of the master secret"""
+        return cls(shamir.recover_secret(shares, k), **kwargs)
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    import random
+
+    K_THRESHOLD, N_SHARES = 3, 5
+    KEY_NAMES = ["root_key_encryption", "policy_encryption", "key_ursa", "key_major"]
+
+    master = os.urandom(32)
+    shares = MasterKeyring.split_master(master, K_THRESHOLD, N_SHARES)
+    print(f"Master secret split into {len(shares)} shares of {len(shares[0][1])} bytes")
+
+    keyring = MasterKeyring.from_shares(random.sample(shares, K_THRESHOLD), K_THRESHOLD)
+    for name, key in keyring.derive_many(KEY_NAMES).items():
+        print(f"{name:<22}{key.hex()}")
+    print("Same keys after another ceremony:",
+          MasterKeyring.from_shares(shares[:K_THRESHOLD], K_THRESHOLD).derive_many(KEY_NAMES) == keyring.derive_many(KEY_NAMES))
+
+    # RFC 5869 test case 1
+    okm = hkdf(bytes.fromhex("0b" * 22), bytes.fromhex("f0f1f2f3f4f5f6f7f8f9"), 42,
+               salt=bytes.fromhex("000102030405060708090a0b0c"))
+    print("RFC 5869 test vector:", okm.hex() == "3cb25f25faacd57a90434f64d0362f2a2d2d0a90cf1a5a4c5db02d56ecc4c5bf"
+                                               "34007208d5b887185865")
+
+    names = [f"key_{i:06d}" for i in range(100000)]
+    keyring = MasterKeyring(master, cache_size=10000)
+    start = time.perf_counter()
+    keyring.derive_many(names)
+    elapsed = time.perf_counter() - start
+    print(f"\nDerived {len(names)} keys in {elapsed:.2f}s "
+          f"(per-key Shamir would need {len(names) * N_SHARES} shares instead of {N_SHARES})")
+    for name in random.choices(names[-5000:], k=50000):
+        keyring.derive(name)
+    print("Cache:", keyring.cache_info())
+
+"""
+Master secret split into 5 shares of 32 bytes
+root_key_encryption   3b53e618b6cae1978b4507c1e215b67727b601a8e79ddd6da5ccd3e5e56a905a
+policy_encryption     d782ccb51ee85c4a71a7d2512c021ced0caec04ee7ecbebd219753bf2f2b52c7
+key_ursa              473cf0be3b01b9eb94a76d211127c369b85b12dd3fa498a2cd56392ff072b8c9
+key_major             b63c799d5e22a69de7f28f76990658537b35dab987d365b9aae4c3b88789335a
+Same keys after another ceremony: True
+RFC 5869 test vector: True
+
+Derived 100000 keys in 0.72s (per-key Shamir would need 500000 shares instead of 5)
+Cache: {'hits': 50000, 'misses': 100000, 'evictions': 90000, 'size': 10000, 'max_size': 10000}
+"""
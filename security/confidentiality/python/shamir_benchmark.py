@@ -0,0 +1,333 @@
+#!pip install numpy sslib
+
+"""
+Split/recover cost of Shamir secret sharing across (k, n), secret size and batch size.
+
+Every case splits `batch` random secrets of `size` bytes k-of-n, then recovers
+all of them from k randomly chosen custodians (the same custodians for the
+whole batch, as in one recovery ceremony). Each case runs --repeat times and
+reports the median and best wall time, throughput (MB/s of secret bytes and
+secrets/s), latency per secret and share bytes stored per secret.
+
+Backends:
+- gf256: shamir_gf256.split_many / recover_many (vectorised GF(256))
+- sslib: sslib.shamir.split_secret / recover_secret, one secret at a time
+  (prime field sized to the secret, Python big ints)
+
+The default grid (2-of-3 .. 50-of-100, 16 B .. 16 MB, batch 1 .. 100k) contains
+cases that would need terabytes or hours; they are reported as skipped:
+- batch * size above --max-total-bytes (memory)
+- batch * size * k * n above --max-work (gf256 cost is linear in it)
+- sslib secrets above --sslib-max-size or batches above --sslib-max-total-bytes
+  (its cost grows super-linearly with secret size)
+Pass 0 to lift a limit.
+
+Usage:
+    python shamir_benchmark.py --json shamir_benchmark.json
+    python shamir_benchmark.py --thresholds 3/5,50/100 --sizes 32,1M --batches 1,10000 --backends gf256
+"""
+import os
+import json
+import time
+import random
+import argparse
+import statistics
+from typing import Dict, List, Sequence, Tuple
+
+import shamir_gf256
+
+try:
+    from sslib import shamir as sslib_shamir
+except ImportError:  # sslib is optional, only needed for the comparison
+    sslib_shamir = None
+
+THRESHOLDS = [(2, 3), (3, 5), (5, 10), (10, 20), (20, 40), (50, 100)]
+SECRET_SIZES = [16, 32, 256, 4096, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024]
+BATCH_SIZES = [1, 100, 10000, 100000]
+
+DEFAULT_MAX_TOTAL_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_WORK = 4 * 10 ** 9
+DEFAULT_SSLIB_MAX_SIZE = 4096
+DEFAULT_SSLIB_MAX_TOTAL_BYTES = 64 * 1024
+
+
+# ==================== Backends ====================
+
+class Gf256Backend:
+    name = "gf256"
+
+    def split(self, secrets: Dict[int, bytes], k: int, n: int) -> Dict[int, List[Tuple[int, bytes]]]:
+        return {i: split["shares"] for i, split in shamir_gf256.split_many(secrets, k, n).items()}
+
+    def recover(self, share_sets: Dict[int, List[Tuple[int, bytes]]], k: int) -> Dict[int, bytes]:
+        return shamir_gf256.recover_many(share_sets, k=k)
+
+
+class SslibBackend:
+    name = "sslib"
+
+    def split(self, secrets: Dict[int, bytes], k: int, n: int) -> Dict[int, List[Tuple[int, bytes]]]:
+        # keep the prime with the shares, sslib needs it to recover
+        self._prime_mod = {}
+        splits = {}
+        for i, secret in secrets.items():
+            split = sslib_shamir.split_secret(secret, k, n)
+            self._prime_mod[i] = split["prime_mod"]
+            splits[i] = split["shares"]
+        return splits
+
+    def recover(self, share_sets: Dict[int, List[Tuple[int, bytes]]], k: int) -> Dict[int, bytes]:
+        return {i: sslib_shamir.recover_secret({"required_shares": k, "prime_mod": self._prime_mod[i],
+                                                "shares": shares})
+                for i, shares in share_sets.items()}
+
+
+BACKENDS = {"gf256": Gf256Backend, "sslib": SslibBackend}
+
+
+# ==================== Grid ====================
+
+def parse_size(text: str) -> int:
+    """'16' -> 16, '4K' -> 4096, '16M' -> 16777216"""
+    text = text.strip().upper()
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    if text[-1:] in units:
+        return int(text[:-1]) * units[text[-1]]
+    return int(text)
+
+
+def parse_threshold(text: str) -> Tuple[int, int]:
+    """'3/5' -> (3, 5)"""
+    k, n = text.split("/")
+    return int(k), int(n)
+
+
+def skip_reason(backend: str, k: int, n: int, size: int, batch: int, limits: Dict[str, int]):
+    """Why a case is not run (None if it is)"""
+    total = size * batch
+    if limits["max_total_bytes"] and total > limits["max_total_bytes"]:
+        return f"batch holds {total} bytes > --max-total-bytes"
+    if limits["max_work"] and total * k * n > limits["max_work"]:
+        return f"batch*size*k*n = {total * k * n} > --max-work"
+    if backend == "sslib":
+        if sslib_shamir is None:
+            return "sslib not installed"
+        if limits["sslib_max_size"] and size > limits["sslib_max_size"]:
+            return f"secret size {size} > --sslib-max-size"
+        if limits["sslib_max_total_bytes"] and total > limits["sslib_max_total_bytes"]:
+            return f"batch holds {total} bytes > --sslib-max-total-bytes"
+    return None
+
+
+# ==================== Measurement ====================
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def _summary(times: Sequence[float], size: int, batch: int) -> Dict:
+    median = statistics.median(times)
+    return {
+        "median_s": round(median, 6),
+        "best_s": round(min(times), 6),
+        "throughput_mb_s": round(size * batch / median / (1024 * 1024), 3),
+        "secrets_per_s": round(batch / median, 1),
+        "latency_per_secret_ms": round(median / batch * 1000, 6),
+    }
+
+
+def run_case(backend, k: int, n: int, size: int, batch: int, repeat: int) -> Dict:
+    """Split and recover `batch` secrets of `size` bytes, `repeat` times"""
+    secrets = {i: os.urandom(size) for i in range(batch)}
+    split_times, recover_times = [], []
+    share_bytes = 0
+    for _ in range(repeat):
+        splits, elapsed = _timed(backend.split, secrets, k, n)
+        split_times.append(elapsed)
+        share_bytes = sum(len(share) for _, share in splits[0])
+
+        custodians = set(random.sample(range(1, n + 1), k))
+        share_sets = {i: [(x, share) for x, share in shares if x in custodians] for i, shares in splits.items()}
+        recovered, elapsed = _timed(backend.recover, share_sets, k)
+        recover_times.append(elapsed)
+        if recovered != secrets:
+            raise AssertionError(f"{backend.name} recovered wrong secrets for {k}-of-{n}, {size} B")
+        del splits, share_sets, recovered
+
+    return {
+        "split": _summary(split_times, size, batch),
+        "recover": _summary(recover_times, size, batch),
+        "share_bytes_per_secret": share_bytes,
+    }
+
+
+def run_grid(backends: Sequence[str], thresholds: Sequence[Tuple[int, int]], sizes: Sequence[int],
+             batches: Sequence[int], repeat: int, limits: Dict[str, int], progress: bool = True) -> List[Dict]:
+    """Run every (backend, k/n, size, batch) case; skipped cases carry a reason"""
+    results = []
+    for k, n in thresholds:
+        for size in sizes:
+            for batch in batches:
+                for name in backends:
+                    case = {"backend": name, "k": k, "n": n, "secret_bytes": size, "batch": batch}
+                    reason = skip_reason(name, k, n, size, batch, limits)
+                    if reason:
+                        case["skipped"] = reason
+                    else:
+                        case.update(run_case(BACKENDS[name](), k, n, size, batch, repeat))
+                    results.append(case)
+                    if progress:
+                        print_case(case)
+    return results
+
+
+def print_case(case: Dict):
+    label = f"{case['backend']:<7}{case['k']:>4}/{case['n']:<5}{case['secret_bytes']:>10}{case['batch']:>8}"
+    if "skipped" in case:
+        print(f"{label}  skipped: {case['skipped']}")
+        return
+    split, recover = case["split"], case["recover"]
+    print(f"{label}{split['throughput_mb_s']:>12.2f}{split['latency_per_secret_ms']:>14.4f}"
+          f"{recover['throughput_mb_s']:>12.2f}{recover['latency_per_secret_ms']:>14.4f}"
+          f"{case['share_bytes_per_secret']:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Shamir split/recover backends")
+    parser.add_argument("--backends", default="gf256,sslib", help="comma-separated: " + ", ".join(BACKENDS))
+    parser.add_argument("--thresholds", default=",".join(f"{k}/{n}" for k, n in THRESHOLDS),
+                        help="comma-separated k/n pairs")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in SECRET_SIZES),
+                        help="comma-separated secret sizes (K/M suffixes allowed)")
+    parser.add_argument("--batches", default=",".join(str(b) for b in BATCH_SIZES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-total-bytes", type=parse_size, default=DEFAULT_MAX_TOTAL_BYTES)
+    parser.add_argument("--max-work", type=int, default=DEFAULT_MAX_WORK)
+    parser.add_argument("--sslib-max-size", type=parse_size, default=DEFAULT_SSLIB_MAX_SIZE)
+    parser.add_argument("--sslib-max-total-bytes", type=parse_size, default=DEFAULT_SSLIB_MAX_TOTAL_BYTES)
+    parser.add_argument("--json", dest="json_path", default=None, help="write all cases as JSON")
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(",")]
+    unknown = set(backends) - set(BACKENDS)
+    if unknown:
+        parser.error(f"Unknown backend(s): {', '.join(sorted(unknown))}")
+    limits = {"max_total_bytes": args.max_total_bytes, "max_work": args.max_work,
+              "sslib_max_size": args.sslib_max_size, "sslib_max_total_bytes": args.sslib_max_total_bytes}
+
+    print(f"{'backend':<7}{'k/n':>6}{'':<4}{'size B':>10}{'batch':>8}{'split MB/s':>12}{'split ms/op':>14}"
+          f"{'rec MB/s':>12}{'rec ms/op':>14}{'share B':>12}")
+    results = run_grid(backends,
+                       [parse_threshold(t) for t in args.thresholds.split(",")],
+                       [parse_size(s) for s in args.sizes.split(",")],
+                       [int(b) for b in args.batches.split(",")],
+                       args.repeat, limits)
+
+    if args.json_path:
+        report = {"repeat": args.repeat, "limits": limits, "cpu_count": os.cpu_count(), "cases": results}
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults saved to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
+
+"""
+$ python shamir_benchmark.py --thresholds 2/3,3/5,50/100 --sizes 16,32,4K,1M,16M --batches 1,100,10000 --json shamir_benchmark.json
+backend   k/n        size B   batch  split MB/s   split ms/op    rec MB/s     rec ms/op     share B
+gf256     2/3            16       1        0.12        0.1250        0.15        0.0994          48
+sslib     2/3            16       1        0.00        3.8453        0.31        0.0485          72
+gf256     2/3            16     100        2.67        0.0057        2.45        0.0062          48
+sslib     2/3            16     100        0.01        2.7923        1.21        0.0127          72
+gf256     2/3            16   10000        2.59        0.0059        2.69        0.0057          48
+sslib     2/3            16   10000  skipped: batch holds 160000 bytes > --sslib-max-total-bytes
+gf256     2/3            32       1        0.52        0.0589        0.79        0.0387          96
+sslib     2/3            32       1        0.01        2.1788        1.60        0.0191         120
+gf256     2/3            32     100       11.41        0.0027        9.83        0.0031          96
+sslib     2/3            32     100        0.01        2.8890        1.94        0.0158         120
+gf256     2/3            32   10000        5.73        0.0053        5.55        0.0055          96
+sslib     2/3            32   10000  skipped: batch holds 320000 bytes > --sslib-max-total-bytes
+gf256     2/3          4096       1       35.62        0.1097       73.51        0.0531       12288
+sslib     2/3          4096       1        1.62        2.4064        0.25       15.8807       16687
+gf256     2/3          4096     100       41.82        0.0934      139.60        0.0280       12288
+sslib     2/3          4096     100  skipped: batch holds 409600 bytes > --sslib-max-total-bytes
+gf256     2/3          4096   10000       24.25        0.1611       72.27        0.0541       12288
+sslib     2/3          4096   10000  skipped: batch holds 40960000 bytes > --sslib-max-total-bytes
+gf256     2/3       1048576       1       42.62       23.4633      135.02        7.4063     3145728
+sslib     2/3       1048576       1  skipped: secret size 1048576 > --sslib-max-size
+gf256     2/3       1048576     100       28.66       34.8854       81.73       12.2349     3145728
+sslib     2/3       1048576     100  skipped: secret size 1048576 > --sslib-max-size
+gf256     2/3       1048576   10000  skipped: batch holds 10485760000 bytes > --max-total-bytes
+sslib     2/3       1048576   10000  skipped: batch holds 10485760000 bytes > --max-total-bytes
+gf256     2/3      16777216       1       28.55      560.4716      104.62      152.9383    50331648
+sslib     2/3      16777216       1  skipped: secret size 16777216 > --sslib-max-size
+gf256     2/3      16777216     100  skipped: batch holds 1677721600 bytes > --max-total-bytes
+sslib     2/3      16777216     100  skipped: batch holds 1677721600 bytes > --max-total-bytes
+gf256     2/3      16777216   10000  skipped: batch holds 167772160000 bytes > --max-total-bytes
+sslib     2/3      16777216   10000  skipped: batch holds 167772160000 bytes > --max-total-bytes
+gf256     3/5            16       1        0.12        0.1298        0.17        0.0891          80
+sslib     3/5            16       1        0.01        3.3719        0.34        0.0446         120
+gf256     3/5            16     100        2.60        0.0059        2.57        0.0059          80
+sslib     3/5            16     100        0.01        2.2495        0.56        0.0270         120
+gf256     3/5            16   10000        2.17        0.0070        2.23        0.0068          80
+sslib     3/5            16   10000  skipped: batch holds 160000 bytes > --sslib-max-total-bytes
+gf256     3/5            32       1        0.23        0.1354        0.22        0.1383         160
+sslib     3/5            32       1        0.01        3.7275        0.48        0.0630         200
+gf256     3/5            32     100        3.84        0.0080        4.55        0.0067         160
+sslib     3/5            32     100        0.01        3.4406        0.91        0.0336         200
+gf256     3/5            32   10000        4.37        0.0070        4.77        0.0064         160
+sslib     3/5            32   10000  skipped: batch holds 320000 bytes > --sslib-max-total-bytes
+gf256     3/5          4096       1       13.82        0.2827       32.47        0.1203       20480
+sslib     3/5          4096       1        1.04        3.7723        0.06       60.9351       27812
+gf256     3/5          4096     100       19.65        0.1988       84.94        0.0460       20480
+sslib     3/5          4096     100  skipped: batch holds 409600 bytes > --sslib-max-total-bytes
+gf256     3/5          4096   10000       13.35        0.2926       60.28        0.0648       20480
+sslib     3/5          4096   10000  skipped: batch holds 40960000 bytes > --sslib-max-total-bytes
+gf256     3/5       1048576       1       26.83       37.2765      137.75        7.2593     5242880
+sslib     3/5       1048576       1  skipped: secret size 1048576 > --sslib-max-size
+gf256     3/5       1048576     100       11.49       87.0431       51.91       19.2658     5242880
+sslib     3/5       1048576     100  skipped: secret size 1048576 > --sslib-max-size
+gf256     3/5       1048576   10000  skipped: batch holds 10485760000 bytes > --max-total-bytes
+sslib     3/5       1048576   10000  skipped: batch holds 10485760000 bytes > --max-total-bytes
+gf256     3/5      16777216       1       10.67     1499.1094       59.70      268.0056    83886080
+sslib     3/5      16777216       1  skipped: secret size 16777216 > --sslib-max-size
+gf256     3/5      16777216     100  skipped: batch holds 1677721600 bytes > --max-total-bytes
+sslib     3/5      16777216     100  skipped: batch holds 1677721600 bytes > --max-total-bytes
+gf256     3/5      16777216   10000  skipped: batch holds 167772160000 bytes > --max-total-bytes
+sslib     3/5      16777216   10000  skipped: batch holds 167772160000 bytes > --max-total-bytes
+gf256    50/100          16       1        0.00       12.4193        0.01        2.3062        1600
+sslib    50/100          16       1        0.00        5.6562        0.00        6.3112        2400
+gf256    50/100          16     100        0.04        0.4145        0.25        0.0611        1600
+sslib    50/100          16     100        0.00        5.6904        0.00        6.4821        2399
+gf256    50/100          16   10000        0.06        0.2636        0.26        0.0590        1600
+sslib    50/100          16   10000  skipped: batch holds 160000 bytes > --sslib-max-total-bytes
+gf256    50/100          32       1        0.00       11.7056        0.01        2.2595        3200
+sslib    50/100          32       1        0.01        6.1034        0.00        9.0783        4000
+gf256    50/100          32     100        0.06        0.5321        0.61        0.0501        3200
+sslib    50/100          32     100        0.01        5.9905        0.00        8.6508        4000
+gf256    50/100          32   10000        0.07        0.4311        0.82        0.0371        3200
+sslib    50/100          32   10000  skipped: batch holds 320000 bytes > --sslib-max-total-bytes
+gf256    50/100        4096       1        0.10       38.4901        2.26        1.7287      409600
+sslib    50/100        4096       1        0.04       93.2912        0.00    18205.4966      556249
+gf256    50/100        4096     100        0.12       33.6937        7.00        0.5580      409600
+sslib    50/100        4096     100  skipped: batch holds 409600 bytes > --sslib-max-total-bytes
+gf256    50/100        4096   10000  skipped: batch*size*k*n = 204800000000 > --max-work
+sslib    50/100        4096   10000  skipped: batch*size*k*n = 204800000000 > --max-work
+gf256    50/100     1048576       1  skipped: batch*size*k*n = 5242880000 > --max-work
+sslib    50/100     1048576       1  skipped: batch*size*k*n = 5242880000 > --max-work
+gf256    50/100     1048576     100  skipped: batch*size*k*n = 524288000000 > --max-work
+sslib    50/100     1048576     100  skipped: batch*size*k*n = 524288000000 > --max-work
+gf256    50/100     1048576   10000  skipped: batch holds 10485760000 bytes > --max-total-bytes
+sslib    50/100     1048576   10000  skipped: batch holds 10485760000 bytes > --max-total-bytes
+gf256    50/100    16777216       1  skipped: batch*size*k*n = 83886080000 > --max-work
+sslib    50/100    16777216       1  skipped: batch*size*k*n = 83886080000 > --max-work
+gf256    50/100    16777216     100  skipped: batch holds 1677721600 bytes > --max-total-bytes
+sslib    50/100    16777216     100  skipped: batch holds 1677721600 bytes > --max-total-bytes
+gf256    50/100    16777216   10000  skipped: batch holds 167772160000 bytes > --max-total-bytes
+sslib    50/100    16777216   10000  skipped: batch holds 167772160000 bytes > --max-total-bytes
+
+Results saved to shamir_benchmark.json
+"""
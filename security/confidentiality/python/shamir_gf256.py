@@ -0,0 +1,443 @@
+#!pip install numpy
+
+"""
+Byte-wise Shamir secret sharing over GF(2^8), vectorised with NumPy.
+
+Every byte of the secret is the constant term of its own random polynomial of
+degree k-1 over GF(256) (AES field, x^8 + x^4 + x^3 + x + 1). Shares are the
+polynomials evaluated at x = 1..n, so a share is exactly as long as the secret
+and carries a 1-byte x-coordinate.
+
+Field multiplication is a lookup in a 256x256 table built from log/antilog
+tables, so split and recover operate on whole arrays at once: across all bytes
+of a secret and across a batch of equal-length secrets (shape (m, L)).
+
+split_many / recover_many process whole keyrings: keys are grouped by length
+(and, on recovery, by the set of custodian x-coordinates), each group is one
+vectorised call, and very large groups can be spread over a process pool.
+
+Recovery weights (Lagrange basis at x = 0) depend only on which custodians
+take part, so they are cached in an LRU keyed by the sorted x-coordinates;
+recovering many keys from the same custodians costs one cached lookup plus a
+single GF(256) dot product per secret, O(k) per byte instead of O(k^2).
+
+Proactive refresh: every custodian deals shares of a random polynomial with
+zero constant term and everyone XORs what they receive into their share. The
+shares change, the secret does not, and it is never reconstructed; old and new
+shares cannot be mixed. refresh_many runs this over a whole keyring at once.
+
+This replaces the sslib backend (521-bit prime, Python big ints, secret
+hex-encoded to UTF-8 before splitting).
+"""
+import os
+import base64
+import functools
+import numpy as np
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+GF_POLY = 0x11B        # x^8 + x^4 + x^3 + x + 1
+GF_GENERATOR = 0x03    # primitive element of GF(256) under GF_POLY
+MAX_SHARES = 255       # x-coordinates 1..255, 0 is the secret
+LAGRANGE_CACHE_SIZE = 4096
+
+
+def _build_tables():
+    """Build exp/log tables and the full multiplication and inverse tables"""
+    exp = np.zeros(512, dtype=np.uint8)
+    log = np.zeros(256, dtype=np.int32)
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        # multiply by the generator 0x03 = x * 2 ^ x
+        doubled = x << 1
+        if doubled & 0x100:
+            doubled ^= GF_POLY
+        x = doubled ^ x
+    exp[255:510] = exp[:255]
+
+    mul = exp[log[:, None] + log[None, :]]
+    mul[0, :] = 0
+    mul[:, 0] = 0
+
+    inv = np.zeros(256, dtype=np.uint8)
+    inv[1:] = exp[255 - log[1:]]
+    return exp, log, mul, inv
+
+
+EXP_TABLE, LOG_TABLE, MUL_TABLE, INV_TABLE = _build_tables()
+
+
+def gf_mul(a, b):
+    """Multiply field elements (ints or uint8 arrays, broadcast)"""
+    return MUL_TABLE[a, b]
+
+
+def gf_inv(a):
+    """Multiplicative inverse of a non-zero field element"""
+    if np.any(np.asarray(a) == 0):
+        raise ZeroDivisionError("0 has no inverse in GF(256)")
+    return INV_TABLE[a]
+
+
+def random_bytes(shape) -> np.ndarray:
+    """Uniform random uint8 array from os.urandom"""
+    shape = tuple(np.atleast_1d(shape))
+    size = int(np.prod(shape))
+    return np.frombuffer(os.urandom(size), dtype=np.uint8).reshape(shape)
+
+
+def _check_threshold(k: int, n: int):
+    if not 1 <= k <= n:
+        raise ValueError(f"Threshold must satisfy 1 <= k <= n, got k={k}, n={n}")
+    if n > MAX_SHARES:
+        raise ValueError(f"At most {MAX_SHARES} shares are possible over GF(256), got n={n}")
+
+
+def _check_xs(xs: Sequence[int]):
+    if len(set(xs)) != len(xs):
+        raise ValueError(f"Duplicate share x-coordinates: {sorted(xs)}")
+    if any(not 1 <= x <= MAX_SHARES for x in xs):
+        raise ValueError(f"Share x-coordinates must be in 1..{MAX_SHARES}: {sorted(xs)}")
+
+
+def evaluate_polynomials(secrets: np.ndarray, coefficients: np.ndarray, xs: Sequence[int]) -> np.ndarray:
+    """
+    Evaluate f(x) = secrets + c1*x + ... + c_{k-1}*x^(k-1) at every x (Horner).
+    coefficients has shape (k-1,) + secrets.shape; returns (len(xs),) + secrets.shape.
+    """
+    shares = np.empty((len(xs),) + secrets.shape, dtype=np.uint8)
+    for i, x in enumerate(xs):
+        # multiplication by a fixed x is a 256-entry lookup (take is the fastest gather)
+        mul_x = MUL_TABLE[x]
+        acc = np.zeros(secrets.shape, dtype=np.uint8)
+        for c in coefficients[::-1]:
+            acc = mul_x.take(acc)
+            acc ^= c
+        np.bitwise_xor(mul_x.take(acc), secrets, out=shares[i])
+    return shares
+
+
+def split_secrets(secrets: np.ndarray, k: int, n: int) -> Tuple[List[int], np.ndarray]:
+    """
+    Split a batch of equal-length secrets (uint8 array, any shape, typically (m, L)).
+    Returns (xs, shares) with xs = [1..n] and shares of shape (n,) + secrets.shape.
+    """
+    _check_threshold(k, n)
+    secrets = np.asarray(secrets, dtype=np.uint8)
+    coefficients = random_bytes((k - 1,) + secrets.shape)
+    xs = list(range(1, n + 1))
+    return xs, evaluate_polynomials(secrets, coefficients, xs)
+
+
+@functools.lru_cache(maxsize=LAGRANGE_CACHE_SIZE)
+def _sorted_lagrange_weights(xs: Tuple[int, ...]) -> np.ndarray:
+    """Lagrange weights for a sorted tuple of x-coordinates (cached, read-only)"""
+    _check_xs(xs)
+    weights = np.empty(len(xs), dtype=np.uint8)
+    for j, xj in enumerate(xs):
+        w = 1
+        for m, xm in enumerate(xs):
+            if m != j:
+                # subtraction is XOR in characteristic 2
+                w = MUL_TABLE[w, MUL_TABLE[xm, INV_TABLE[xm ^ xj]]]
+        weights[j] = w
+    weights.setflags(write=False)
+    return weights
+
+
+def lagrange_weights(xs: Sequence[int]) -> np.ndarray:
+    """
+    Lagrange basis coefficients at x = 0: w_j = prod_{m != j} x_m / (x_m - x_j),
+    returned in the order of xs. Computed once per custodian set (LRU cache).
+    """
+    key = tuple(sorted(int(x) for x in xs))
+    weights = _sorted_lagrange_weights(key)
+    if key == tuple(xs):
+        return weights
+    position = {x: j for j, x in enumerate(key)}
+    return weights[[position[x] for x in xs]]
+
+
+def lagrange_cache_info():
+    """Hit/miss statistics of the Lagrange weight cache"""
+    return _sorted_lagrange_weights.cache_info()
+
+
+def combine_shares(xs: Sequence[int], shares: np.ndarray) -> np.ndarray:
+    """
+    Recover secrets from shares of shape (k,) + secret_shape taken at xs.
+    Any k or more distinct points of the same polynomials give the same result.
+    """
+    shares = np.asarray(shares, dtype=np.uint8)
+    if len(xs) != shares.shape[0]:
+        raise ValueError(f"Got {len(xs)} x-coordinates for {shares.shape[0]} shares")
+    weights = lagrange_weights(xs)
+    # dot product over GF(256): XOR of w_j * y_j across the k shares
+    secrets = np.zeros(shares.shape[1:], dtype=np.uint8)
+    for w, share in zip(weights, shares):
+        secrets ^= MUL_TABLE[w].take(share)
+    return secrets
+
+
+# ==================== Single-secret API ====================
+
+def split_secret(secret: bytes, k: int, n: int) -> List[Tuple[int, bytes]]:
+    """Split one secret into n (x, share_bytes) pairs, any k of which recover it"""
+    xs, shares = split_secrets(np.frombuffer(secret, dtype=np.uint8), k, n)
+    return [(x, share.tobytes()) for x, share in zip(xs, shares)]
+
+
+def _share_list(share_set, k: Optional[int], name: str = "the secret") -> Sequence[Tuple[int, bytes]]:
+    """
+    The (x, share_bytes) pairs of a share list or split dict, checked against
+    the threshold (k, else the dict's required_shares): fewer than k shares
+    interpolate a wrong secret instead of failing
+    """
+    if isinstance(share_set, Mapping):
+        shares = share_set["shares"]
+        if k is None:
+            k = share_set.get("required_shares")
+    else:
+        shares = share_set
+    if not shares:
+        raise ValueError(f"No shares given for {name}")
+    if k is not None and len({x for x, _ in shares}) < k:
+        raise ValueError(f"{name} needs {k} distinct shares, got {len({x for x, _ in shares})}")
+    return shares
+
+
+def recover_secret(shares: Union[Dict, Sequence[Tuple[int, bytes]]], k: Optional[int] = None) -> bytes:
+    """
+    Recover one secret from (x, share_bytes) pairs or a split dict. Pass the
+    threshold k with a bare list; without it too few shares go unnoticed
+    """
+    shares = _share_list(shares, k)
+    lengths = {len(share) for _, share in shares}
+    if len(lengths) != 1:
+        raise ValueError(f"Shares have different lengths: {sorted(lengths)}")
+    xs = [x for x, _ in shares]
+    ys = np.stack([np.frombuffer(share, dtype=np.uint8) for _, share in shares])
+    return combine_shares(xs, ys).tobytes()
+
+
+def to_base64(shares: Sequence[Tuple[int, bytes]], k: int) -> Dict:
+    """Text form of one split, "x-base64(share)" per share (same layout as sslib.shamir.to_base64)"""
+    return {
+        "required_shares": k,
+        "shares": [f"{x}-{base64.b64encode(share).decode('ascii')}" for x, share in shares],
+    }
+
+
+def from_base64(data: Dict) -> List[Tuple[int, bytes]]:
+    """Parse the output of to_base64 back into (x, share_bytes) pairs"""
+    shares = []
+    for text in data["shares"]:
+        x, _, encoded = text.partition('-')
+        shares.append((int(x), base64.b64decode(encoded)))
+    return shares
+
+
+# ==================== Keyring (batch) API ====================
+
+DEFAULT_BATCH_SIZE = 65536
+
+ShareList = List[Tuple[int, bytes]]
+
+
+def _split_batch(secrets: np.ndarray, k: int, n: int) -> np.ndarray:
+    return split_secrets(secrets, k, n)[1]
+
+
+def _combine_batch(xs: Sequence[int], shares: np.ndarray) -> np.ndarray:
+    return combine_shares(xs, shares)
+
+
+def _batches(count: int, batch_size: int) -> Iterable[slice]:
+    for start in range(0, count, batch_size):
+        yield slice(start, min(start + batch_size, count))
+
+
+def _run_batches(func, jobs: List[tuple], workers: int) -> List[np.ndarray]:
+    """Run func(*job) for every job, on a process pool when workers > 1"""
+    if workers and workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(func, *zip(*jobs)))
+    return [func(*job) for job in jobs]
+
+
+def split_many(keys: Mapping[str, bytes], k: int, n: int,
+               batch_size: int = DEFAULT_BATCH_SIZE, workers: int = None) -> Dict[str, Dict]:
+    """
+    Split every key of a keyring in vectorised batches.
+    Returns {name: {"required_shares": k, "shares": [(x, share_bytes), ...]}}
+    in the order of `keys`. Nothing is printed.
+    """
+    _check_threshold(k, n)
+    by_length = defaultdict(list)
+    for name, secret in keys.items():
+        by_length[len(secret)].append(name)
+
+    jobs, job_names = [], []
+    for length, names in by_length.items():
+        stacked = np.frombuffer(b"".join(keys[name] for name in names), dtype=np.uint8)
+        stacked = stacked.reshape(len(names), length)
+        for part in _batches(len(names), batch_size):
+            jobs.append((stacked[part], k, n))
+            job_names.append(names[part])
+
+    xs = list(range(1, n + 1))
+    splits = {}
+    for names, shares in zip(job_names, _run_batches(_split_batch, jobs, workers)):
+        # shares: (n, batch, L) -> one contiguous row per key and custodian
+        per_key = np.ascontiguousarray(shares.transpose(1, 0, 2))
+        for name, key_shares in zip(names, per_key):
+            splits[name] = {
+                "required_shares": k,
+                "shares": [(x, share.tobytes()) for x, share in zip(xs, key_shares)],
+            }
+    return {name: splits[name] for name in keys}
+
+
+def _stack_shares(members: List[Tuple[str, ShareList]], count: int, length: int) -> np.ndarray:
+    """(count, m, L) array: row j holds share j of every member (shares sorted by x)"""
+    return np.stack([
+        np.frombuffer(b"".join(shares[j][1] for _, shares in members), dtype=np.uint8)
+        .reshape(len(members), length)
+        for j in range(count)
+    ])
+
+
+def recover_many(share_sets: Mapping[str, Union[Dict, ShareList]],
+                 batch_size: int = DEFAULT_BATCH_SIZE, workers: int = None,
+                 k: Optional[int] = None) -> Dict[str, bytes]:
+    """
+    Recover every key of a keyring. Each value is a list of (x, share_bytes)
+    pairs or a split dict as returned by split_many; a key with fewer shares
+    than k (or its dict's required_shares) raises ValueError. Keys recovered
+    from the same custodian x-coordinates are combined in one vectorised call.
+    Returns {name: secret} in the order of `share_sets`. Nothing is printed.
+    """
+    groups = defaultdict(list)
+    for name, share_set in share_sets.items():
+        shares = sorted(_share_list(share_set, k, repr(name)))
+        xs = tuple(x for x, _ in shares)
+        lengths = {len(share) for _, share in shares}
+        if len(lengths) != 1:
+            raise ValueError(f"Shares of {name!r} have different lengths: {sorted(lengths)}")
+        groups[(xs, lengths.pop())].append((name, shares))
+
+    jobs, job_names = [], []
+    for (xs, length), members in groups.items():
+        stacked = _stack_shares(members, len(xs), length)
+        for part in _batches(len(members), batch_size):
+            jobs.append((xs, stacked[:, part]))
+            job_names.append([name for name, _ in members[part]])
+
+    recovered = {}
+    for names, secrets in zip(job_names, _run_batches(_combine_batch, jobs, workers)):
+        for name, secret in zip(names, secrets):
+            recovered[name] = secret.tobytes()
+    return {name: recovered[name] for name in share_sets}
+
+
+# ==================== Proactive refresh ====================
+
+def refresh_contribution(xs: Sequence[int], k: int, shape) -> np.ndarray:
+    """
+    One custodian's refresh contribution: a random degree k-1 polynomial with
+    f(0) = 0 per byte, evaluated at every custodian x. Row j is sent to xs[j].
+    Returns shape (len(xs),) + shape.
+    """
+    _check_xs(list(xs))
+    shape = tuple(np.atleast_1d(shape))
+    zeros = np.zeros(shape, dtype=np.uint8)
+    return evaluate_polynomials(zeros, random_bytes((k - 1,) + shape), xs)
+
+
+def apply_refresh(share: np.ndarray, received: Iterable[np.ndarray]) -> np.ndarray:
+    """Add (XOR) every contribution row received by one custodian into its share"""
+    refreshed = np.array(share, dtype=np.uint8)
+    for row in received:
+        refreshed ^= row
+    return refreshed
+
+
+def refresh_shares(xs: Sequence[int], shares: np.ndarray, k: int) -> np.ndarray:
+    """
+    Run the refresh protocol for all custodians at once: shares has shape
+    (len(xs),) + secret_shape, typically (n, m, L) for m keys. Each custodian's
+    contribution is generated independently and summed into every share.
+    """
+    shares = np.asarray(shares, dtype=np.uint8)
+    refreshed = shares.copy()
+    for _ in xs:
+        refreshed ^= refresh_contribution(xs, k, shares.shape[1:])
+    return refreshed
+
+
+def refresh_many(splits: Mapping[str, Dict]) -> Dict[str, Dict]:
+    """
+    Refresh every split of a keyring (split_many layout, all n shares per key)
+    in vectorised groups of keys with the same custodians and length.
+    Returns new splits; no secret is ever reconstructed. Nothing is printed.
+    """
+    groups = defaultdict(list)
+    for name, split in splits.items():
+        shares = sorted(split["shares"])
+        xs = tuple(x for x, _ in shares)
+        lengths = {len(share) for _, share in shares}
+        if len(lengths) != 1:
+            raise ValueError(f"Shares of {name!r} have different lengths: {sorted(lengths)}")
+        groups[(xs, lengths.pop(), split["required_shares"])].append((name, shares))
+
+    refreshed = {}
+    for (xs, length, k), members in groups.items():
+        stacked = _stack_shares(members, len(xs), length)
+        per_key = np.ascontiguousarray(refresh_shares(xs, stacked, k).transpose(1, 0, 2))
+        for (name, _), key_shares in zip(members, per_key):
+            refreshed[name] = {
+                "required_shares": k,
+                "shares": [(x, share.tobytes()) for x, share in zip(xs, key_shares)],
+            }
+    return {name: refreshed[name] for name in splits}
+
+
+if __name__ == "__main__":
+    secret = os.urandom(32)
+    shares = split_secret(secret, 3, 5)
+    for x, share in shares:
+        print(f"share_{x}: {share.hex()}")
+
+    recovered = recover_secret([shares[4], shares[0], shares[2]], k=3)
+    print(f"Secret   : {secret.hex()}")
+    print(f"Recovered: {recovered.hex()}")
+    print("Match:", recovered == secret)
+    try:
+        recover_secret(shares[:2], k=3)
+        raise AssertionError("two shares of a 3-of-5 split accepted")
+    except ValueError as e:
+        print("Too few shares:", e)
+
+    # Batch: 10,000 keys of 32 bytes split in one call
+    batch = random_bytes((10000, 32))
+    xs, batch_shares = split_secrets(batch, 3, 5)
+    recovered_batch = combine_shares(xs[1:4], batch_shares[1:4])
+    print("Batch match:", np.array_equal(recovered_batch, batch))
+
+    # Keyring: split and recover 100,000 named keys
+    keyring = {f"key_{i:06d}": os.urandom(32) for i in range(100000)}
+    splits = split_many(keyring, 3, 5)
+    selected = {name: split["shares"][1:4] for name, split in splits.items()}
+    print("Keyring match:", recover_many(selected, k=3) == keyring)
+    print(lagrange_cache_info())
+
+    # Proactive refresh of the whole keyring without reconstructing any key
+    refreshed = refresh_many(splits)
+    selected = {name: split["shares"][:3] for name, split in refreshed.items()}
+    print("Refreshed keyring match:", recover_many(selected, k=3) == keyring)
+    name = "key_000000"
+    mixed = [splits[name]["shares"][0], refreshed[name]["shares"][1], refreshed[name]["shares"][2]]
+    print("Old + new shares mixed recover the key:", recover_secret(mixed, k=3) == keyring[name])
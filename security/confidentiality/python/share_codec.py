@@ -0,0 +1,151 @@
+"""
+Compact binary encoding for GF(256) Shamir shares (see shamir_gf256.py).
+
+One share record:
+
+    offset  size  field
+    0       2     magic b"SS"
+    2       1     format version (SHARE_FORMAT_VERSION)
+    3       1     flags (FLAG_MAC: a MAC trails the payload)
+    4       1     threshold k
+    5       1     x-coordinate
+    6       2     payload length L (big-endian)
+    8       L     share payload (raw bytes, same length as the secret)
+    8+L     16    HMAC-SHA256(mac_key, header || payload || context)[:16], if FLAG_MAC
+
+The optional context is associated data that is not stored in the record:
+whatever the share belongs to (e.g. key name, version and custodian in
+share_vault.py), so an authenticated record cannot be moved to another key.
+The header carries the payload length, so appending the context keeps the
+MAC input unambiguous, and an empty context gives the MAC of format 1 as is.
+
+A 32-byte key share is 40 bytes (56 with MAC) instead of a base64 string in a
+JSON dict repeating the prime modulus. Records are concatenated as-is into a
+share file; parsing is struct.unpack_from on a memoryview, no JSON or base64.
+"""
+import hmac
+import struct
+import hashlib
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+SHARE_MAGIC = b"SS"
+SHARE_FORMAT_VERSION = 1
+FLAG_MAC = 0x01
+MAC_SIZE = 16
+
+HEADER = struct.Struct(">2sBBBBH")
+
+
+class ShareFormatError(ValueError):
+    """Raised for malformed, unsupported or unauthenticated share records"""
+
+
+def _mac(mac_key: bytes, data, context: bytes = b"") -> bytes:
+    mac = hmac.new(mac_key, data, hashlib.sha256)
+    mac.update(context)
+    return mac.digest()[:MAC_SIZE]
+
+
+def record_size(payload_length: int, with_mac: bool = False) -> int:
+    """Size in bytes of one encoded share"""
+    return HEADER.size + payload_length + (MAC_SIZE if with_mac else 0)
+
+
+def encode_share(x: int, share: bytes, k: int, mac_key: Optional[bytes] = None, context: bytes = b"") -> bytes:
+    """Encode one (x, share) pair of a k-of-n split; the MAC also covers `context`"""
+    if not 1 <= x <= 255 or not 1 <= k <= 255:
+        raise ShareFormatError(f"x and k must fit in one byte (1..255), got x={x}, k={k}")
+    if len(share) > 0xFFFF:
+        raise ShareFormatError(f"Share payload too long: {len(share)} bytes")
+    flags = FLAG_MAC if mac_key is not None else 0
+    record = HEADER.pack(SHARE_MAGIC, SHARE_FORMAT_VERSION, flags, k, x, len(share)) + share
+    if mac_key is not None:
+        record += _mac(mac_key, record, context)
+    return record
+
+
+def decode_share(data, offset: int = 0, mac_key: Optional[bytes] = None,
+                 context: bytes = b"") -> Tuple[int, int, memoryview, int]:
+    """
+    Decode the record starting at `offset`.
+    Returns (k, x, payload_view, next_offset); the payload is a view into `data`.
+    A record carrying a MAC is verified when mac_key is given, with the
+    same context it was encoded with.
+    """
+    view = memoryview(data)
+    if len(view) - offset < HEADER.size:
+        raise ShareFormatError("Truncated share header")
+    magic, version, flags, k, x, length = HEADER.unpack_from(view, offset)
+    if magic != SHARE_MAGIC:
+        raise ShareFormatError(f"Bad share magic {bytes(magic)!r}")
+    if version != SHARE_FORMAT_VERSION:
+        raise ShareFormatError(f"Unsupported share format version {version}")
+
+    payload_start = offset + HEADER.size
+    payload_end = payload_start + length
+    end = payload_end + (MAC_SIZE if flags & FLAG_MAC else 0)
+    if end > len(view):
+        raise ShareFormatError("Truncated share payload")
+
+    if flags & FLAG_MAC and mac_key is not None:
+        expected = _mac(mac_key, view[offset:payload_end], context)
+        if not hmac.compare_digest(expected, view[payload_end:end]):
+            raise ShareFormatError(f"Share MAC mismatch for x={x}")
+    elif mac_key is not None:
+        raise ShareFormatError(f"Share x={x} carries no MAC")
+
+    return k, x, view[payload_start:payload_end], end
+
+
+def iter_shares(data, mac_key: Optional[bytes] = None, context: bytes = b"") -> Iterator[Tuple[int, int, memoryview]]:
+    """Iterate over (k, x, payload_view) of concatenated share records"""
+    offset, size = 0, len(data)
+    while offset < size:
+        k, x, payload, offset = decode_share(data, offset, mac_key, context)
+        yield k, x, payload
+
+
+def pack_shares(shares: Sequence[Tuple[int, bytes]], k: int, mac_key: Optional[bytes] = None,
+                context: bytes = b"") -> bytes:
+    """Concatenate the records of one split (one context, e.g. the key name, for all of them)"""
+    return b"".join(encode_share(x, share, k, mac_key, context) for x, share in shares)
+
+
+def unpack_shares(data, mac_key: Optional[bytes] = None, context: bytes = b"") -> Tuple[int, List[Tuple[int, bytes]]]:
+    """Parse the output of pack_shares into (k, [(x, share_bytes), ...])"""
+    k, shares = None, []
+    for record_k, x, payload in iter_shares(data, mac_key, context):
+        if k is not None and record_k != k:
+            raise ShareFormatError(f"Mixed thresholds in one split: {k} and {record_k}")
+        k = record_k
+        shares.append((x, bytes(payload)))
+    return k, shares
+
+
+if __name__ == "__main__":
+    import os
+    import json
+    import shamir_gf256 as shamir
+
+    secret = os.urandom(32)
+    mac_key = os.urandom(32)
+    shares = shamir.split_secret(secret, 3, 5)
+
+    packed = pack_shares(shares, 3, mac_key)
+    text = shamir.to_base64(shares, 3)
+    print(f"Binary split : {len(pack_shares(shares, 3))} bytes ({record_size(32)} per share)")
+    print(f"  with MAC   : {len(packed)} bytes ({record_size(32, True)} per share)")
+    print(f"Base64 JSON  : {len(json.dumps(text))} bytes")
+
+    k, parsed = unpack_shares(packed, mac_key)
+    print("Round trip:", parsed == shares and k == 3)
+    print("Recovered :", shamir.recover_secret(parsed[2:], k) == secret)
+
+    # records bound to one key do not verify under another
+    bound = pack_shares(shares, 3, mac_key, context=b"key_a")
+    try:
+        unpack_shares(bound, mac_key, context=b"key_b")
+        raise AssertionError("record moved to another key accepted")
+    except ShareFormatError as e:
+        print("Moved record:", e)
+    print("Bound round trip:", unpack_shares(bound, mac_key, context=b"key_a")[1] == shares)
@@ -0,0 +1,232 @@
+"""
+Indexed, append-only share vault (SQLite in WAL mode).
+
+Replaces key_names.json + shares_of_keys_split.bin: instead of two blobs that
+must be loaded in full and matched up by list position, every share is one row
+keyed by (key_name, version, custodian) and stored as a share_codec record.
+
+- get(name) is a primary-key range scan: one key's shares without touching the rest
+- WAL mode: readers run concurrently with each other and with one writer;
+  every thread gets its own connection
+- append-only: a re-split or refresh is stored as a new version, triggers
+  reject UPDATE and DELETE on stored shares
+- each record's MAC covers its row (key name, version, custodian) as
+  share_codec context, and the decoded x must be the custodian: a record
+  copied to another row, even with the triggers dropped, fails to read
+"""
+import time
+import struct
+import sqlite3
+import threading
+import contextlib
+from typing import Dict, Iterable, Iterator, Mapping, Optional, Sequence, Tuple
+
+import share_codec
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS keys (
+    key_name        TEXT    NOT NULL,
+    version         INTEGER NOT NULL,
+    required_shares INTEGER NOT NULL,
+    created         REAL    NOT NULL,
+    PRIMARY KEY (key_name, version)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS shares (
+    key_name  TEXT    NOT NULL,
+    version   INTEGER NOT NULL,
+    custodian INTEGER NOT NULL,
+    record    BLOB    NOT NULL,
+    PRIMARY KEY (key_name, version, custodian)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS shares_by_custodian ON shares (custodian, key_name, version);
+
+CREATE TRIGGER IF NOT EXISTS shares_no_update BEFORE UPDATE ON shares
+BEGIN SELECT RAISE(ABORT, 'share vault is append-only'); END;
+
+CREATE TRIGGER IF NOT EXISTS shares_no_delete BEFORE DELETE ON shares
+BEGIN SELECT RAISE(ABORT, 'share vault is append-only'); END;
+
+CREATE TRIGGER IF NOT EXISTS keys_no_update BEFORE UPDATE ON keys
+BEGIN SELECT RAISE(ABORT, 'share vault is append-only'); END;
+
+CREATE TRIGGER IF NOT EXISTS keys_no_delete BEFORE DELETE ON keys
+BEGIN SELECT RAISE(ABORT, 'share vault is append-only'); END;
+"""
+
+
+def record_context(name: str, version: int, custodian: int) -> bytes:
+    """share_codec context of the record stored at (name, version, custodian)"""
+    encoded = name.encode('utf-8')
+    return struct.pack(">H", len(encoded)) + encoded + struct.pack(">IH", version, custodian)
+
+
+class ShareVault:
+    def __init__(self, path: str, mac_key: Optional[bytes] = None):
+        self.path = path
+        self.mac_key = mac_key
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    # ==================== Connections ====================
+
+    def _connection(self) -> sqlite3.Connection:
+        """Per-thread connection (sqlite3 connections must not be shared)"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Write transaction; BEGIN IMMEDIATE takes the single WAL writer lock up front"""
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def close(self):
+        """Close this thread's connection"""
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+    # ==================== Writes ====================
+
+    def put_many(self, splits: Mapping[str, Dict]) -> Dict[str, int]:
+        """
+        Append splits ({name: {"required_shares": k, "shares": [(x, share), ...]}})
+        in one transaction. Each key gets version latest + 1; returns {name: version}.
+        """
+        now = time.time()
+        versions, key_rows, share_rows = {}, [], []
+        with self._transaction() as db:
+            for name, split in splits.items():
+                row = db.execute("SELECT MAX(version) FROM keys WHERE key_name = ?", (name,)).fetchone()
+                version = (row[0] or 0) + 1
+                k = split["required_shares"]
+                versions[name] = version
+                key_rows.append((name, version, k, now))
+                share_rows.extend(
+                    (name, version, x, share_codec.encode_share(x, share, k, self.mac_key,
+                                                                record_context(name, version, x)))
+                    for x, share in split["shares"]
+                )
+            db.executemany("INSERT INTO keys VALUES (?, ?, ?, ?)", key_rows)
+            db.executemany("INSERT INTO shares VALUES (?, ?, ?, ?)", share_rows)
+        return versions
+
+    def put(self, name: str, split: Dict) -> int:
+        """Append one split; returns its version"""
+        return self.put_many({name: split})[name]
+
+    # ==================== Reads ====================
+
+    def _decode(self, name: str, version: int, custodian: int, record: bytes, k: Optional[int] = None) -> bytes:
+        """Share bytes of one row; the record must belong to exactly this row"""
+        record_k, x, payload, _ = share_codec.decode_share(
+            record, mac_key=self.mac_key, context=record_context(name, version, custodian))
+        if x != custodian or (k is not None and record_k != k):
+            raise share_codec.ShareFormatError(
+                f"Record of {name!r} v{version} custodian {custodian} holds x={x}, k={record_k}")
+        return bytes(payload)
+
+    def latest_version(self, name: str) -> Optional[int]:
+        row = self._connection().execute(
+            "SELECT MAX(version) FROM keys WHERE key_name = ?", (name,)).fetchone()
+        return row[0]
+
+    def get(self, name: str, version: Optional[int] = None,
+            custodians: Optional[Sequence[int]] = None) -> Dict:
+        """
+        Shares of one key (latest version unless given), optionally only those
+        of some custodians: {"required_shares", "version", "shares": [(x, share), ...]}.
+        """
+        db = self._connection()
+        if version is None:
+            version = self.latest_version(name)
+        row = db.execute("SELECT required_shares FROM keys WHERE key_name = ? AND version = ?",
+                         (name, version)).fetchone()
+        if row is None:
+            raise KeyError(f"No shares stored for {name!r} (version {version})")
+
+        query = "SELECT custodian, record FROM shares WHERE key_name = ? AND version = ?"
+        params = [name, version]
+        if custodians is not None:
+            query += f" AND custodian IN ({', '.join('?' * len(custodians))})"
+            params.extend(custodians)
+
+        shares = []
+        for custodian, record in db.execute(query + " ORDER BY custodian", params):
+            shares.append((custodian, self._decode(name, version, custodian, record, row[0])))
+        return {"required_shares": row[0], "version": version, "shares": shares}
+
+    def get_many(self, names: Iterable[str], custodians: Optional[Sequence[int]] = None) -> Dict[str, Dict]:
+        """Latest split of each named key (input for shamir_gf256.recover_many)"""
+        return {name: self.get(name, custodians=custodians) for name in names}
+
+    def key_names(self) -> Iterator[str]:
+        """All stored key names, streamed in name order"""
+        for (name,) in self._connection().execute("SELECT DISTINCT key_name FROM keys ORDER BY key_name"):
+            yield name
+
+    def custodian_shares(self, custodian: int, latest_only: bool = True) -> Iterator[Tuple[str, int, bytes]]:
+        """(key_name, version, share) of one custodian, e.g. to hand out or refresh their shares"""
+        query = "SELECT key_name, version, record FROM shares WHERE custodian = ?"
+        if latest_only:
+            query += (" AND version = (SELECT MAX(version) FROM keys"
+                      " WHERE keys.key_name = shares.key_name)")
+        for name, version, record in self._connection().execute(query + " ORDER BY key_name", (custodian,)):
+            yield name, version, self._decode(name, version, custodian, record)
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    import shamir_gf256 as shamir
+
+    path = os.path.join(tempfile.mkdtemp(), "share_vault.db")
+    vault = ShareVault(path, mac_key=os.urandom(32))
+
+    keyring = {f"key_{i:06d}": os.urandom(32) for i in range(100000)}
+    start = time.perf_counter()
+    vault.put_many(shamir.split_many(keyring, 3, 5))
+    print(f"Stored {len(keyring)} keys in {time.perf_counter() - start:.2f}s ({os.path.getsize(path)} bytes)")
+
+    start = time.perf_counter()
+    split = vault.get("key_042424", custodians=[2, 4, 5])
+    recovered = shamir.recover_secret(split)
+    print(f"Recovered one key in {(time.perf_counter() - start) * 1000:.2f} ms:",
+          recovered == keyring["key_042424"])
+
+    version = vault.put("key_042424", shamir.refresh_many({"key_042424": vault.get("key_042424")})["key_042424"])
+    print(f"Refreshed key_042424 stored as version {version}:",
+          shamir.recover_secret(vault.get("key_042424", custodians=[1, 3, 5])) == keyring["key_042424"])
+
+    try:
+        vault._connection().execute("DELETE FROM shares WHERE key_name = 'key_000001'")
+    except sqlite3.DatabaseError as e:
+        print(f"Delete rejected: {e}")
+
+    # with the triggers dropped, records swapped between two keys no longer read back
+    db = vault._connection()
+    for trigger in ("shares_no_update", "shares_no_delete"):
+        db.execute(f"DROP TRIGGER {trigger}")
+    rows = dict(db.execute("SELECT key_name, record FROM shares WHERE key_name IN ('key_000001', 'key_000002')"
+                           " AND custodian = 1"))
+    for name, other in (("key_000001", "key_000002"), ("key_000002", "key_000001")):
+        db.execute("UPDATE shares SET record = ? WHERE key_name = ? AND custodian = 1", (rows[other], name))
+    try:
+        vault.get("key_000001")
+        raise AssertionError("record of another key accepted")
+    except share_codec.ShareFormatError as e:
+        print(f"Swapped records rejected: {e}")
@@ -0,0 +1,364 @@
+"""
+Verifiable secret sharing (Feldman / Pedersen) with batched share verification.
+
+Plain Shamir recovery trusts whatever shares it is given: one corrupted share
+silently yields a wrong key. Here the dealer publishes commitments to the
+polynomial coefficients next to the shares:
+
+    Feldman   C_j = G^a_j                 share (x, s),    check G^s       == prod C_j^(x^j)
+    Pedersen  C_j = G^a_j * H^b_j         share (x, s, t), check G^s * H^t == prod C_j^(x^j)
+
+Feldman commitments hide the secret only computationally (C_0 = G^secret);
+Pedersen commitments are perfectly hiding and need a blinding share t.
+
+Arithmetic is in a 2048-bit prime-order subgroup of Z_P^* (order Q, 264 bits,
+so every 32-byte key fits). Shares are integers mod Q, so this scheme is
+separate from the byte-wise GF(256) engine in shamir_gf256.py: commitments
+need the exponent field of a group, GF(256) has none.
+
+Batch verification (small-exponent test, Bellare-Garay-Rabin): every share i
+gets a random 128-bit weight r_i and all checks collapse into
+
+    G^(sum r_i s_i) * H^(sum r_i t_i) == prod_keys prod_j C_j^(sum_{i of key} r_i x_i^j)
+
+The right-hand exponents stay ~128 + 8j bits, so checking thousands of shares
+across thousands of keys is one Straus multi-exponentiation instead of one
+full-size exponentiation per share. find_bad_shares bisects a failing batch.
+
+The group (P, Q, G, H) is derived from GROUP_SEED by derive_group_parameters()
+so nobody knows log_G(H).
+"""
+import os
+import hashlib
+import functools
+import secrets
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+GROUP_SEED = b"mechanisms/verifiable_shamir/v1"
+
+# Group embedded from derive_group_parameters(): |P| = 2048, |Q| = 264, P = Q*r + 1
+GROUP_COUNTER = 972
+Q = int(
+    "93cf50eb83d6e6e17b58fd74c5fbb2596fe5377eaa8cea03f405e555d200e828"
+    "87",
+    16,
+)
+P = int(
+    "90c5e7e89946d1554a7512957af07914110928c8e7f5681ec6cb85d8c85a83f8"
+    "c7565ecea766ccd5c3ea1b25fc2e6e586283aa0f2a5e289f6b24c149f891ef6c"
+    "a1db90350f42ca3baeb9d4dd70d481105398481f61aa6ce69eaa00f1857ce459"
+    "ef16cf0b713548a46f85f9ae29facf7056af5a5073f8901f8955d5621e34a16a"
+    "83587e505999478a402e04646a301218688a4f0732c943088856c1d4bb04ff2a"
+    "13ce274844d610ec6737b2d883294a0eb10a09a75e474be8e29f73feb52bf035"
+    "7b65f4d693b5bb89aac133c31ceb1f4d37b4e9a44368dd61378d66bfb5bc9e69"
+    "15f4c5a2459eafaffee5fe33dfc5531c08932bff44a035672d21970bdd062c6b",
+    16,
+)
+G = int(
+    "e52258ae462d47ba66162d860662693c0dd7b8d35a711aa5b61a30b89dae9db2"
+    "b551b2c4d71919b285c845f9cc3636620704d9ff8d4d126754ee1864f868eb13"
+    "5a68ec2d5b015ad4f08eb0a4e144490da96ea8dfb40ba3e4d4740e9451f2698e"
+    "481f5654987fa95cbea9b748c64a9725b6533909fc540d33a196d9a7dcadc248"
+    "d44a4e8d4bfff214e851cf49fb6d19d262578865993f6ee9a1d3146123f1316e"
+    "5ac49c9357c8fcc54c248bdc918a6ce56ef96230ee35916de7fe53ae204373ec"
+    "27f9099fb8f2d817dd5d700510d637e2b6a0d6eca87f1a03c0044035873ab01d"
+    "ccdb3f98e7a72d5a55631a9501044d5ff3bdbcabe428ecc041752888cd700e4",
+    16,
+)
+H = int(
+    "3d57f8914f8e3ae1b3ebfe3d13dc372ca57496dcf8061398738071c339cafa56"
+    "62f659cd399b7a12f164ebe07f4c0c1109d90831ea3941314c9f24e0c4c45ae5"
+    "2ea4a1fa12c509fba4e88836039cd905dc64d057641f63a88774ad397aad4bc7"
+    "98155b10ef5e63f5b2d6a6e6312fb6bdcf59a350994db1d5d793467e661d2c01"
+    "a2b98bb86ad317a05650b23b22096933cdfa5ca175e56462701ee7335fcf1514"
+    "3582a67b6e9b3fe8f71f6185032b48721044fbf2e893af4d38e36f9a0bc0f0e0"
+    "ff4ccc8a49f63d8c54ff47b8c359478bb314ee3d951aec7b8b0447326e29e2b5"
+    "fceef15611b9fecfd52c512a2c1f017dd0c3426fb565a00957bbf2fd25415f69",
+    16,
+)
+
+BATCH_WEIGHT_BITS = 128
+MULTI_EXP_WINDOW = 4
+
+# share: (x, s) for Feldman, (x, s, t) for Pedersen
+Share = Tuple[int, ...]
+
+
+# ==================== Group parameters ====================
+
+def _expand(label: bytes, bits: int) -> int:
+    """Deterministic integer of `bits` bits from SHA-256(GROUP_SEED / label / counter)"""
+    out, counter = b"", 0
+    while len(out) * 8 < bits:
+        out += hashlib.sha256(GROUP_SEED + b"/" + label + counter.to_bytes(4, 'big')).digest()
+        counter += 1
+    return int.from_bytes(out, 'big') >> (len(out) * 8 - bits)
+
+
+def _is_probable_prime(n: int, rounds: int = 40) -> bool:
+    if n < 2:
+        return False
+    for small in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        if n % small == 0:
+            return n == small
+    d, r = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        r += 1
+    for _ in range(rounds):
+        a = secrets.randbelow(n - 3) + 2
+        x = pow(a, d, n)
+        if x in (1, n - 1):
+            continue
+        for _ in range(r - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def derive_group_parameters(q_bits: int = 264, p_bits: int = 2048) -> Tuple[int, int, int, int, int]:
+    """
+    Re-derive (counter, Q, P, G, H) from GROUP_SEED: Q is the first prime at or
+    above a seed-derived q_bits integer, P = Q*r + 1 for the first seed-derived
+    r that makes P prime, G and H are seed-derived elements raised to (P-1)/Q.
+    Takes a few seconds; used to audit the constants above.
+    """
+    q = _expand(b"q", q_bits) | (1 << (q_bits - 1)) | 1
+    while not _is_probable_prime(q):
+        q += 2
+    counter = 0
+    while True:
+        r = (_expand(b"p" + counter.to_bytes(4, 'big'), p_bits - q_bits) | (1 << (p_bits - q_bits - 1))) & ~1
+        p = q * r + 1
+        if p.bit_length() == p_bits and _is_probable_prime(p, 1) and _is_probable_prime(p):
+            break
+        counter += 1
+    g = pow(2, (p - 1) // q, p)
+    h = pow(_expand(b"h", p_bits + 64) % p, (p - 1) // q, p)
+    return counter, q, p, g, h
+
+
+def check_group_parameters() -> bool:
+    """Quick sanity check of the embedded group (primality and subgroup order)"""
+    return (_is_probable_prime(Q) and _is_probable_prime(P) and (P - 1) % Q == 0
+            and G != 1 and H != 1 and pow(G, Q, P) == 1 and pow(H, Q, P) == 1)
+
+
+# ==================== Multi-exponentiation ====================
+
+def multi_exp(pairs: Iterable[Tuple[int, int]], modulus: int = P, window: int = MULTI_EXP_WINDOW) -> int:
+    """
+    prod base^exp mod modulus for many (base, exp) pairs (Straus / interleaved
+    windows): the squarings are shared, so short exponents cost only a few
+    multiplications each.
+    """
+    pairs = [(base % modulus, exp) for base, exp in pairs if exp]
+    if any(exp < 0 for _, exp in pairs):
+        raise ValueError("multi_exp needs non-negative exponents")
+    if not pairs:
+        return 1
+
+    size = 1 << window
+    mask = size - 1
+    tables = []
+    for base, exp in pairs:
+        table = [1, base]
+        for _ in range(size - 2):
+            table.append(table[-1] * base % modulus)
+        tables.append((table, exp))
+
+    max_bits = max(exp.bit_length() for _, exp in pairs)
+    result = 1
+    for shift in range(((max_bits + window - 1) // window - 1) * window, -1, -window):
+        if result != 1:
+            for _ in range(window):
+                result = result * result % modulus
+        for table, exp in tables:
+            if exp >> shift:
+                digit = (exp >> shift) & mask
+                if digit:
+                    result = result * table[digit] % modulus
+    return result
+
+
+# ==================== Dealing ====================
+
+def _eval_poly(coefficients: Sequence[int], x: int) -> int:
+    acc = 0
+    for c in reversed(coefficients):
+        acc = (acc * x + c) % Q
+    return acc
+
+
+def vss_split(secret: bytes, k: int, n: int, pedersen: bool = False) -> Tuple[List[int], List[Share]]:
+    """
+    Split `secret` k-of-n over Z_Q and commit to the polynomial.
+    Returns (commitments, shares); commitments are public, share i goes to custodian x = i + 1.
+    """
+    if not 1 <= k <= n:
+        raise ValueError(f"Threshold must satisfy 1 <= k <= n, got k={k}, n={n}")
+    value = int.from_bytes(secret, 'big')
+    if value >= Q:
+        raise ValueError(f"Secret must be smaller than the group order ({Q.bit_length()} bits)")
+
+    a = [value] + [secrets.randbelow(Q) for _ in range(k - 1)]
+    if pedersen:
+        b = [secrets.randbelow(Q) for _ in range(k)]
+        commitments = [multi_exp([(G, a_j), (H, b_j)]) for a_j, b_j in zip(a, b)]
+        shares = [(x, _eval_poly(a, x), _eval_poly(b, x)) for x in range(1, n + 1)]
+    else:
+        commitments = [pow(G, a_j, P) for a_j in a]
+        shares = [(x, _eval_poly(a, x)) for x in range(1, n + 1)]
+    return commitments, shares
+
+
+def vss_split_many(keys: Dict[str, bytes], k: int, n: int, pedersen: bool = False) -> Dict[str, Tuple[List[int], List[Share]]]:
+    """vss_split every key of a keyring: {name: (commitments, shares)}"""
+    return {name: vss_split(secret, k, n, pedersen) for name, secret in keys.items()}
+
+
+# ==================== Verification ====================
+
+@functools.lru_cache(maxsize=1 << 16)
+def _in_subgroup(c: int) -> bool:
+    # one full-size exponentiation; cached, as commitments are published once
+    # and checked again by every batch (find_bad_shares bisects over the same ones)
+    return 0 < c < P and pow(c, Q, P) == 1
+
+
+def in_subgroup(commitments: Iterable[int]) -> bool:
+    """
+    Every commitment is in the order-Q subgroup. Outside it (e.g. -C, of
+    order 2Q) the small-exponent test no longer holds: with weights of the
+    right parity the extra factor cancels out.
+    """
+    return all(_in_subgroup(c) for c in commitments)
+
+
+def verify_share(commitments: Sequence[int], share: Share) -> bool:
+    """Custodian-side check of one share against the published commitments"""
+    if not in_subgroup(commitments):
+        return False
+    x, s = share[0], share[1]
+    lhs = [(G, s % Q)]
+    if len(share) == 3:
+        lhs.append((H, share[2] % Q))
+    rhs = multi_exp((c, x ** j) for j, c in enumerate(commitments))
+    return multi_exp(lhs) == rhs
+
+
+def batch_verify(items: Sequence[Tuple[Sequence[int], Share]]) -> bool:
+    """
+    Verify many (commitments, share) pairs, across many keys, with one
+    multi-exponentiation. False means at least one share is bad (or a
+    commitment was tampered with); with every commitment checked to be in
+    the order-Q subgroup, false acceptance has probability 2^-128.
+    """
+    if not items:
+        return True
+    sum_s, sum_t = 0, 0
+    exponents: Dict[Tuple[int, ...], List[int]] = {}
+    for commitments, share in items:
+        r = secrets.randbits(BATCH_WEIGHT_BITS)
+        x = share[0]
+        sum_s += r * share[1]
+        if len(share) == 3:
+            sum_t += r * share[2]
+        # shares of the same key share one commitment vector: aggregate per C_j
+        acc = exponents.setdefault(tuple(commitments), [0] * len(commitments))
+        power = r
+        for j in range(len(commitments)):
+            acc[j] += power
+            power *= x
+
+    # one subgroup check per distinct commitment vector, not per share
+    if not all(in_subgroup(commitments) for commitments in exponents):
+        return False
+
+    # G^(-S) H^(-T) prod C^e == 1, with negative exponents taken mod Q
+    pairs = [(G, (-sum_s) % Q), (H, (-sum_t) % Q)]
+    for commitments, acc in exponents.items():
+        pairs.extend(zip(commitments, acc))
+    return multi_exp(pairs) == 1
+
+
+def find_bad_shares(items: Sequence[Tuple[Sequence[int], Share]]) -> List[int]:
+    """Indices of the bad items, by batch verification and bisection"""
+    if batch_verify(items):
+        return []
+    if len(items) == 1:
+        return [0]
+    mid = len(items) // 2
+    left = find_bad_shares(items[:mid])
+    right = find_bad_shares(items[mid:])
+    return left + [mid + i for i in right]
+
+
+# ==================== Recovery ====================
+
+def vss_recover(shares: Sequence[Share], length: int) -> bytes:
+    """Lagrange interpolation at 0 over Z_Q; returns the secret as `length` bytes"""
+    xs = [share[0] for share in shares]
+    if len(set(xs)) != len(xs):
+        raise ValueError(f"Duplicate share x-coordinates: {sorted(xs)}")
+    value = 0
+    for j, share in enumerate(shares):
+        num, den = 1, 1
+        for m, xm in enumerate(xs):
+            if m != j:
+                num = num * xm % Q
+                den = den * (xm - xs[j]) % Q
+        value = (value + share[1] * num * pow(den, -1, Q)) % Q
+    return value.to_bytes(length, 'big')
+
+
+if __name__ == "__main__":
+    import time
+
+    print("Group parameters check:", check_group_parameters())
+
+    N_KEYS, K, N = 200, 3, 5
+    keyring = {f"key_{i:04d}": os.urandom(32) for i in range(N_KEYS)}
+
+    start = time.perf_counter()
+    dealt = vss_split_many(keyring, K, N)
+    print(f"Dealt {N_KEYS} keys {K}-of-{N} with Feldman commitments in {time.perf_counter() - start:.2f}s")
+
+    items = [(commitments, share) for commitments, shares in dealt.values() for share in shares]
+
+    start = time.perf_counter()
+    print(f"Batch verify of {len(items)} shares:", batch_verify(items),
+          f"({time.perf_counter() - start:.3f}s)")
+
+    _in_subgroup.cache_clear()  # compare cold costs: each custodian checks the commitments once
+    start = time.perf_counter()
+    ok = all(verify_share(c, s) for c, s in items[:50])
+    per_share = (time.perf_counter() - start) / 50
+    print(f"One-by-one verify: {per_share * 1000:.1f} ms per share, ~{per_share * len(items):.1f}s for all ({ok})")
+
+    # corrupt two shares and locate them
+    x, s = items[17][1]
+    items[17] = (items[17][0], (x, (s + 1) % Q))
+    x, s = items[600][1]
+    items[600] = (items[600][0], (x, (s * 2) % Q))
+    print("Batch verify after corruption:", batch_verify(items))
+    print("Bad shares:", find_bad_shares(items))
+
+    # a commitment outside the order-Q subgroup: -C_0 passes the old odd-weight
+    # batch test for any even number of shares, the subgroup check catches it
+    commitments, shares = dealt["key_0002"]
+    tampered = [(-commitments[0]) % P] + commitments[1:]
+    for size in (2, 4):
+        batch = [(tampered, share) for share in shares[:size]]
+        assert not any(verify_share(c, share) for c, share in batch)
+        assert not any(batch_verify(batch) for _ in range(20)), "tampered commitment accepted"
+    print("Batches with a commitment outside the subgroup rejected:", True)
+
+    commitments, shares = dealt["key_0000"]
+    print("Recovered key_0000:", vss_recover(shares[2:], 32) == keyring["key_0000"])
+
+    commitments, shares = vss_split(keyring["key_0001"], K, N, pedersen=True)
+    print("Pedersen shares verify:", batch_verify([(commitments, share) for share in shares]))
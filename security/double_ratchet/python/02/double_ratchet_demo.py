@@ -1,12 +1,284 @@
 #!pip install pynacl
 
 import os
-import binascii
+import time
+import functools
+import struct
 import hashlib
 import hmac
-from typing import Dict, Tuple
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from nacl import bindings
 from nacl.public import PrivateKey, PublicKey, Box
 from nacl.secret import SecretBox
+from nacl.exceptions import CryptoError
+
+from ratchet_cipher_suites import SUITES, XSALSA20_POLY1305, MSG_NUM_SIZE, PUBLIC_KEY_SIZE, CipherSuite, negotiate
+
+MAX_SKIP = 1000              # most message keys skipped in one receiving chain
+MAX_SKIPPED_KEYS = 2000      # most skipped keys held per session (all chains)
+SKIPPED_KEY_TTL = 24 * 3600  # seconds a skipped key is kept for a late message
+CHECKPOINT_INTERVAL = 64     # skipped keys per stored chain-key checkpoint
+MAX_PREVIOUS_RATCHET_KEYS = 16  # retired sender ratchet keys remembered per session
+
+# Session state layout (to_bytes / from_bytes), all integers big-endian:
+#   header    magic b"DR", format version, sealed flag
+#   body      (SecretBox ciphertext of the same bytes when sealed)
+#     fixed   present-flags, send_count, recv_count, max_skip, max_skipped_keys,
+#             checkpoint interval, skipped-key TTL (-1: none), name length,
+#             cipher suite id (255: not negotiated yet; format version 1 has no
+#             suite id and means suite 0)
+#     name    UTF-8
+#     keys    identity, ephemeral, then root / send chain / recv chain /
+#             my ratchet / their ratchet / header key when their flag is set
+#             (32 bytes each; the header key flag exists from format version 3)
+#     retired their-ratchet-key count (1 byte), then those keys (32 bytes each;
+#             from format version 4)
+#     skipped chain count, then per chain: ratchet key, block count and per
+#             block: checkpoint number, age in seconds, chain key, pending bitmap
+SESSION_MAGIC = b"DR"
+SESSION_FORMAT_VERSION = 4
+SESSION_HEADER = struct.Struct(">2sBB")
+SESSION_FIXED = struct.Struct(">BIIIIHdHB")
+SESSION_FIXED_V1 = struct.Struct(">BIIIIHdH")
+NO_SUITE = 255
+SKIPPED_CHAIN = struct.Struct(">32sI")
+SKIPPED_BLOCK = struct.Struct(">Id32s")
+COUNT = struct.Struct(">I")
+
+# Message layout: suite header (ratchet public key, message number) | suite ciphertext,
+# see ratchet_cipher_suites.py; suite 0: public key (32) | number (4) | nonce (24) | secretbox
+OPTIONAL_KEYS = ("root_key", "send_chain_key", "recv_chain_key", "my_ratchet_key", "their_ratchet_key",
+                 "header_key")
+
+
+class RatchetMetrics:
+    """
+    Counters and log2 latency histograms for one or many sessions.
+
+    Histogram bucket i counts operations that took [2^(i-1), 2^i) microseconds
+    (bucket 0: under 1 us), so recording is an int.bit_length() and a list
+    increment. Share one instance between sessions to aggregate them.
+    """
+    
+    BUCKETS = 32
+    
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, List[int]] = {}
+    
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+    
+    def observe(self, name: str, seconds: float):
+        """Record one latency sample"""
+        buckets = self.histograms.get(name)
+        if buckets is None:
+            buckets = self.histograms[name] = [0] * self.BUCKETS
+        buckets[min(int(seconds * 1e6).bit_length(), self.BUCKETS - 1)] += 1
+    
+    @staticmethod
+    def _percentile(buckets: List[int], total: int, fraction: float) -> int:
+        """Upper bound (us) of the bucket holding the given fraction of samples"""
+        rank, seen = fraction * total, 0
+        for i, count in enumerate(buckets):
+            seen += count
+            if seen >= rank:
+                return 1 << i
+        return 1 << (len(buckets) - 1)
+    
+    def snapshot(self) -> Dict:
+        """Copy of all counters, plus count/p50/p99/buckets of every histogram"""
+        histograms = {}
+        for name, buckets in self.histograms.items():
+            total = sum(buckets)
+            histograms[name] = {
+                "count": total,
+                "p50_us": self._percentile(buckets, total, 0.50),
+                "p99_us": self._percentile(buckets, total, 0.99),
+                "buckets_us": {f"<{1 << i}": count for i, count in enumerate(buckets) if count},
+            }
+        return {"counters": dict(self.counters), "histograms": histograms}
+
+
+class SkippedMessageError(ValueError):
+    """Raised when a message key cannot (or must not) be derived"""
+
+
+class SessionFormatError(ValueError):
+    """Raised for malformed, unsupported or unauthenticated session state"""
+
+
+class SkippedKeyStore:
+    """
+    Message keys of skipped messages, derived lazily from chain-key checkpoints.
+
+    Instead of one 32-byte message key per skipped message, every receiving
+    chain keeps one checkpoint per block of CHECKPOINT_INTERVAL message numbers
+    (the chain key at the lowest skipped number still pending in that block)
+    plus a bitmap of the pending numbers. A late message's key is derived from
+    its block's checkpoint when it arrives: at most CHECKPOINT_INTERVAL HMACs.
+
+    Bounded: at most max_keys pending keys (the oldest is evicted first) and
+    each block expires ttl seconds after it was created.
+    """
+
+    def __init__(self, kdf_chain, max_keys: int = MAX_SKIPPED_KEYS, ttl: Optional[float] = SKIPPED_KEY_TTL,
+                 clock=time.monotonic, checkpoint_interval: int = CHECKPOINT_INTERVAL,
+                 metrics: Optional[RatchetMetrics] = None):
+        self.kdf_chain = kdf_chain
+        self.metrics = metrics
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.clock = clock
+        self.interval = checkpoint_interval
+        self.evicted = 0
+        self._count = 0
+        # ratchet_key -> {block: [checkpoint_index, chain_key, created, pending_bitmap]}
+        self._chains: "OrderedDict[bytes, Dict[int, list]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, key_id: Tuple[bytes, int]) -> bool:
+        self.prune()
+        return self._find(*key_id) is not None
+
+    def checkpoints(self) -> int:
+        """Number of chain keys held (one per block with pending keys)"""
+        return sum(len(chain) for chain in self._chains.values())
+
+    def skip(self, ratchet_key: bytes, msg_num: int, chain_key: bytes):
+        """
+        Record skipped message msg_num; chain_key is the chain key that derives
+        its message key. Numbers must be skipped in increasing order per chain.
+        """
+        chain = self._chains.setdefault(ratchet_key, {})
+        block, bit = divmod(msg_num, self.interval)
+        entry = chain.get(block)
+        if entry is None:
+            chain[block] = entry = [msg_num, chain_key, self.clock(), 0]
+        entry[3] |= 1 << bit
+        self._count += 1
+        while self._count > self.max_keys:
+            self._evict_oldest()
+
+    def peek(self, key_id: Tuple[bytes, int]) -> Optional[Tuple[bytes, bytes]]:
+        """
+        (message key, chain key at its number) of a skipped key, which stays
+        stored until discard() (None if unknown, evicted or expired)
+        """
+        if not self._chains:
+            return None
+        self.prune()
+        ratchet_key, msg_num = key_id
+        entry = self._find(ratchet_key, msg_num)
+        if entry is None:
+            return None
+        chain_key = entry[1]
+        for _ in range(msg_num - entry[0]):
+            chain_key, _ = self.kdf_chain(chain_key)
+        return self.kdf_chain(chain_key)[1], chain_key
+
+    def discard(self, key_id: Tuple[bytes, int], chain_key: bytes):
+        """Remove a skipped key found by peek(); chain_key as peek() returned it"""
+        self._remove(key_id[0], key_id[1], chain_key)
+
+    def pop(self, key_id: Tuple[bytes, int]) -> Optional[bytes]:
+        """Derive and remove a skipped key (None if unknown, evicted or expired)"""
+        found = self.peek(key_id)
+        if found is None:
+            return None
+        self.discard(key_id, found[1])
+        return found[0]
+
+    def prune(self):
+        """Drop expired blocks (blocks are created in order, oldest first)"""
+        if self.ttl is None:
+            return
+        deadline = self.clock() - self.ttl
+        while self._chains:
+            ratchet_key, chain = next(iter(self._chains.items()))
+            block, entry = next(iter(chain.items()))
+            if entry[2] > deadline:
+                break
+            dropped = bin(entry[3]).count("1")
+            self._count -= dropped
+            self.evicted += dropped
+            if self.metrics is not None:
+                self.metrics.count("skipped_keys_expired", dropped)
+            del chain[block]
+            if not chain:
+                del self._chains[ratchet_key]
+
+    def _find(self, ratchet_key: bytes, msg_num: int) -> Optional[list]:
+        chain = self._chains.get(ratchet_key)
+        if chain is None:
+            return None
+        block, bit = divmod(msg_num, self.interval)
+        entry = chain.get(block)
+        if entry is None or not entry[3] >> bit & 1:
+            return None
+        return entry
+
+    def _remove(self, ratchet_key: bytes, msg_num: int, chain_key: bytes):
+        """
+        Clear a pending number; chain_key is the chain key at msg_num. The
+        checkpoint always sits on the lowest pending number of its block, so
+        when that one goes the checkpoint moves forward to the next.
+        """
+        chain = self._chains[ratchet_key]
+        block, bit = divmod(msg_num, self.interval)
+        entry = chain[block]
+        entry[3] &= ~(1 << bit)
+        self._count -= 1
+        if not entry[3]:
+            del chain[block]
+            if not chain:
+                del self._chains[ratchet_key]
+        elif msg_num == entry[0]:
+            next_num = block * self.interval + (entry[3] & -entry[3]).bit_length() - 1
+            for _ in range(next_num - msg_num):
+                chain_key, _ = self.kdf_chain(chain_key)
+            entry[0], entry[1] = next_num, chain_key
+
+    def to_bytes(self) -> bytes:
+        """Pending blocks in the session state layout (ages instead of clock times)"""
+        now = self.clock()
+        bitmap_size = (self.interval + 7) // 8
+        parts = [COUNT.pack(len(self._chains))]
+        for ratchet_key, chain in self._chains.items():
+            parts.append(SKIPPED_CHAIN.pack(ratchet_key, len(chain)))
+            for checkpoint, chain_key, created, pending in chain.values():
+                parts.append(SKIPPED_BLOCK.pack(checkpoint, now - created, chain_key))
+                parts.append(pending.to_bytes(bitmap_size, 'big'))
+        return b"".join(parts)
+
+    def load(self, data, offset: int = 0) -> int:
+        """Restore the blocks written by to_bytes; returns the offset after them"""
+        now = self.clock()
+        bitmap_size = (self.interval + 7) // 8
+        (chains,), offset = COUNT.unpack_from(data, offset), offset + COUNT.size
+        for _ in range(chains):
+            ratchet_key, blocks = SKIPPED_CHAIN.unpack_from(data, offset)
+            offset += SKIPPED_CHAIN.size
+            chain = self._chains.setdefault(bytes(ratchet_key), {})
+            for _ in range(blocks):
+                checkpoint, age, chain_key = SKIPPED_BLOCK.unpack_from(data, offset)
+                offset += SKIPPED_BLOCK.size
+                pending = int.from_bytes(data[offset:offset + bitmap_size], 'big')
+                offset += bitmap_size
+                chain[checkpoint // self.interval] = [checkpoint, bytes(chain_key), now - age, pending]
+                self._count += bin(pending).count("1")
+        return offset
+
+    def _evict_oldest(self):
+        ratchet_key, chain = next(iter(self._chains.items()))
+        entry = next(iter(chain.values()))
+        self._remove(ratchet_key, entry[0], entry[1])
+        self.evicted += 1
+        if self.metrics is not None:
+            self.metrics.count("skipped_keys_evicted")
 
 
 class DoubleRatchet:
@@ -19,9 +291,25 @@ class DoubleRatchet:
     - Asymmetric DH ratcheting for forward secrecy
     """
     
-    def __init__(self, name: str):
+    def __init__(self, name: str, max_skip: int = MAX_SKIP, max_skipped_keys: int = MAX_SKIPPED_KEYS,
+                 skipped_key_ttl: Optional[float] = SKIPPED_KEY_TTL,
+                 identity_key: Optional[PrivateKey] = None, ephemeral_key: Optional[PrivateKey] = None,
+                 verbose: bool = False, metrics: Optional[RatchetMetrics] = None, key_pool=None,
+                 suites: Sequence[CipherSuite] = (XSALSA20_POLY1305,)):
         self.name = name
-        self.identity_key = PrivateKey.generate()
+        self.identity_key = identity_key or PrivateKey.generate()
+        
+        # Fresh key pairs come from key_pool.take() when given (see ratchet_keypool.py)
+        self.key_pool = key_pool
+        
+        # Step-by-step logging is off by default (console I/O in the hot path);
+        # counters and latencies always go to metrics
+        self.verbose = verbose
+        self.metrics = metrics if metrics is not None else RatchetMetrics()
+        
+        # Supported cipher suites in preference order; one is negotiated at init
+        self.suites = list(suites)
+        self.suite: Optional[CipherSuite] = None
         
         # Core ratchet state
         self.root_key = None           # Shared secret that gets ratcheted
@@ -31,47 +319,55 @@ class DoubleRatchet:
         # DH ratchet state
         self.my_ratchet_key = None     # Our current DH ratchet key pair
         self.their_ratchet_key = None  # Their current DH ratchet public key
+        self.previous_ratchet_keys: List[bytes] = []  # their retired keys, never ratcheted to again
+        self._receives = 0  # committed receives, to detect stale staged state
+        
+        # Static per-session key for encrypted frame headers (ratchet_framing.py)
+        self.header_key = None
         
         # Message counters
         self.send_count = 0
         self.recv_count = 0
         
-        # Out-of-order message handling
-        self.skipped_keys: Dict[Tuple[bytes, int], bytes] = {}
+        # Out-of-order message handling (bounded: see SkippedKeyStore)
+        self.max_skip = max_skip
+        self.skipped_keys = SkippedKeyStore(self._kdf_chain, max_skipped_keys, skipped_key_ttl,
+                                            metrics=self.metrics)
         
         # Ephemeral key for X3DH
-        self.ephemeral_key = PrivateKey.generate()
+        self.ephemeral_key = ephemeral_key or self._generate_key()
     
     def get_public_bundle(self) -> dict:
         """Get public keys for key exchange"""
         return {
             'identity': self.identity_key.public_key.encode(),
-            'ephemeral': self.ephemeral_key.public_key.encode()
+            'ephemeral': self.ephemeral_key.public_key.encode(),
+            'suites': [suite.suite_id for suite in self.suites]
         }
     
+    def _generate_key(self) -> PrivateKey:
+        """Fresh X25519 key pair, pre-generated by the key pool if there is one"""
+        if self.key_pool is not None:
+            return self.key_pool.take()
+        return PrivateKey.generate()
+    
     # ==================== Key Derivation Functions ====================
     
     def _kdf_root(self, root_key: bytes, dh_output: bytes) -> Tuple[bytes, bytes]:
         """
         Derive new root key and chain key from DH output.
-        Uses HMAC-based key derivation.
+        The KDF belongs to the negotiated cipher suite.
         """
-        # Extract pseudorandom key
-        prk = hmac.new(root_key, dh_output, hashlib.sha256).digest()
-        
-        # Expand to root key and chain key
-        new_root_key = hmac.new(prk, b"RootKey" + b'\x01', hashlib.sha256).digest()
-        new_chain_key = hmac.new(prk, b"ChainKey" + b'\x01', hashlib.sha256).digest()
-        
-        return new_root_key, new_chain_key
+        return self.suite.kdf_root(root_key, dh_output)
     
     def _kdf_chain(self, chain_key: bytes) -> Tuple[bytes, bytes]:
         """
         Derive next chain key and message key from current chain key.
         This is deterministic: same input always gives same output.
         """
-        message_key = hmac.new(chain_key, b"MessageKey", hashlib.sha256).digest()
-        next_chain_key = hmac.new(chain_key, b"NextChain", hashlib.sha256).digest()
+        # hmac.digest: one-shot HMAC in C, no HMAC object per derivation
+        message_key = hmac.digest(chain_key, b"MessageKey", 'sha256')
+        next_chain_key = hmac.digest(chain_key, b"NextChain", 'sha256')
         
         return next_chain_key, message_key
     
@@ -80,13 +376,17 @@ class DoubleRatchet:
     def init_as_alice(self, bob_bundle: dict) -> bytes:
         """
         Initialize session as Alice (initiator).
-        Returns Alice's ephemeral public key to send to Bob.
+        Returns Alice's ephemeral public key to send to Bob. A bundle from a
+        prekey server may carry a one-time prekey ('one_time', with its
+        'one_time_id' for Bob); it adds a fourth DH.
         """
         bob_identity = PublicKey(bob_bundle['identity'])
         bob_ephemeral = PublicKey(bob_bundle['ephemeral'])
+        # A bundle without a suite list only speaks suite 0
+        self.suite = negotiate([suite.suite_id for suite in self.suites], bob_bundle.get('suites', [0]))
         
         # Generate fresh ephemeral key for this session
-        alice_ephemeral = PrivateKey.generate()
+        alice_ephemeral = self._generate_key()
         
         # Perform 3-way Diffie-Hellman (X3DH)
         # DH1: Alice's identity with Bob's ephemeral
@@ -98,9 +398,13 @@ class DoubleRatchet:
         
         # Combine all DH outputs
         shared_secret = dh1 + dh2 + dh3
+        if bob_bundle.get('one_time') is not None:
+            # DH4: Alice's ephemeral with Bob's one-time prekey
+            shared_secret += Box(alice_ephemeral, PublicKey(bob_bundle['one_time'])).shared_key()
         
         # Derive initial root key
-        self.root_key = hashlib.sha256(b"RootKey_" + shared_secret).digest()
+        self.root_key = self.suite.initial_root(shared_secret)
+        self.header_key = hmac.digest(self.root_key, b"HeaderKey", 'sha256')
         
         # Alice sends first message
         # Set up the initial ratchet keys
@@ -111,16 +415,23 @@ class DoubleRatchet:
         dh_output = Box(self.my_ratchet_key, self.their_ratchet_key).shared_key()
         self.root_key, self.send_chain_key = self._kdf_root(self.root_key, dh_output)
         
-        self._log(f"Session initialized as Alice")
-        self._log(f"Root key: {self._hex(self.root_key)}")
-        self._log(f"Send chain: {self._hex(self.send_chain_key)}")
+        if self.verbose:
+            self._log(f"Session initialized as Alice")
+            self._log(f"Root key: {self._fingerprint(self.root_key)}")
+            self._log(f"Send chain: {self._fingerprint(self.send_chain_key)}")
         
         return alice_ephemeral.public_key.encode()
     
-    def init_as_bob(self, alice_bundle: dict, alice_ephemeral_bytes: bytes):
-        """Initialize session as Bob (responder)."""
+    def init_as_bob(self, alice_bundle: dict, alice_ephemeral_bytes: bytes,
+                    one_time_key: Optional[PrivateKey] = None):
+        """
+        Initialize session as Bob (responder). one_time_key is the private
+        one-time prekey Alice's bundle named, if it had one.
+        """
         alice_identity = PublicKey(alice_bundle['identity'])
         alice_ephemeral = PublicKey(alice_ephemeral_bytes)
+        # Alice picks her first choice that Bob supports; Bob reaches the same one
+        self.suite = negotiate(alice_bundle.get('suites', [0]), [suite.suite_id for suite in self.suites])
         
         # Perform same 3-way DH as Alice (same order!)
         # DH1: Bob's ephemeral with Alice's identity
@@ -132,9 +443,13 @@ class DoubleRatchet:
         
         # Same shared secret as Alice
         shared_secret = dh1 + dh2 + dh3
+        if one_time_key is not None:
+            # DH4: Bob's one-time prekey with Alice's ephemeral
+            shared_secret += Box(one_time_key, alice_ephemeral).shared_key()
         
         # Same initial root key
-        self.root_key = hashlib.sha256(b"RootKey_" + shared_secret).digest()
+        self.root_key = self.suite.initial_root(shared_secret)
+        self.header_key = hmac.digest(self.root_key, b"HeaderKey", 'sha256')
         
         # Bob receives Alice's first message
         self.their_ratchet_key = alice_ephemeral
@@ -144,105 +459,411 @@ class DoubleRatchet:
         dh_output = Box(self.my_ratchet_key, self.their_ratchet_key).shared_key()
         self.root_key, self.recv_chain_key = self._kdf_root(self.root_key, dh_output)
         
-        self._log(f"Session initialized as Bob")
-        self._log(f"Root key: {self._hex(self.root_key)}")
-        self._log(f"Recv chain: {self._hex(self.recv_chain_key)}")
+        if self.verbose:
+            self._log(f"Session initialized as Bob")
+            self._log(f"Root key: {self._fingerprint(self.root_key)}")
+            self._log(f"Recv chain: {self._fingerprint(self.recv_chain_key)}")
     
     # ==================== Message Encryption/Decryption ====================
     
-    def encrypt(self, plaintext: str) -> bytes:
-        """Encrypt a message."""
+    def _next_send_message_key(self) -> Tuple[int, bytes]:
+        """Advance the sending chain; returns (message number, message key)"""
         if self.send_chain_key is None:
             # Need to initialize sending chain (happens for Bob's first send)
-            self.my_ratchet_key = PrivateKey.generate()
+            self.my_ratchet_key = self._generate_key()
             dh_output = Box(self.my_ratchet_key, self.their_ratchet_key).shared_key()
             self.root_key, self.send_chain_key = self._kdf_root(self.root_key, dh_output)
             self.send_count = 0
-            self._log(f"Initialized send chain: {self._hex(self.send_chain_key)}")
+            self.metrics.count("dh_ratchets")
+            if self.verbose:
+                self._log(f"Initialized send chain: {self._fingerprint(self.send_chain_key)}")
         
         # Derive message key and advance chain
         self.send_chain_key, message_key = self._kdf_chain(self.send_chain_key)
         msg_num = self.send_count
         self.send_count += 1
+        return msg_num, message_key
+    
+    def _recv_message_key(self, sender_ratchet_key: bytes, msg_num: int) -> Tuple[bytes, Callable[[], None]]:
+        """
+        Message key for a received header, and a commit() that applies the
+        receive: DH ratchet on a new sender key, chain advance, skipped keys
+        used or stored. Nothing changes before commit(), which callers run
+        only once the message has authenticated, so a forged header can
+        neither re-root the session nor fill the skipped-key store.
+        """
+        try:
+            message_key, staged = self._stage_message_key(sender_ratchet_key, msg_num)
+        except SkippedMessageError:
+            self.metrics.count("skip_limit_rejections")
+            raise
+        return message_key, functools.partial(self._commit_receive, staged, self._receives)
+    
+    def encrypt(self, plaintext: str) -> bytes:
+        """Encrypt a message."""
+        return self.encrypt_bytes(plaintext.encode())
+    
+    def encrypt_bytes(self, plaintext: bytes) -> bytes:
+        """Encrypt a byte message; returns header + ciphertext."""
+        start = time.perf_counter()
+        msg_num, message_key = self._next_send_message_key()
         
-        # Encrypt message
-        box = SecretBox(message_key)
-        ciphertext = box.encrypt(plaintext.encode())
+        # Create header: [my_ratchet_public_key (32 bytes)][message_number (4 bytes)],
+        # preceded by the suite id for the AEAD suites
+        header = self.suite.header(self.my_ratchet_key.public_key.encode(), msg_num)
         
-        # Create header: [my_ratchet_public_key (32 bytes)][message_number (4 bytes)]
-        header = self.my_ratchet_key.public_key.encode() + msg_num.to_bytes(4, 'big')
+        # Encrypt message (the AEAD suites authenticate the header too)
+        ciphertext = self.suite.seal(message_key, msg_num, plaintext, header)
         
-        self._log(f"📤 Sent message #{msg_num}, key: {self._hex(message_key)}")
+        if self.verbose:
+            self._log(f"📤 Sent message #{msg_num}, key: {self._fingerprint(message_key)}")
         
+        self.metrics.count("messages_encrypted")
+        self.metrics.observe("encrypt", time.perf_counter() - start)
         return header + ciphertext
     
     def decrypt(self, message: bytes) -> str:
         """Decrypt a message."""
+        return self.decrypt_bytes(message).decode()
+    
+    def decrypt_bytes(self, message) -> bytes:
+        """Decrypt a message to bytes."""
+        # Split without copying: the AEAD suites read both parts in place
+        view = memoryview(message)
+        return self.decrypt_parts(view[:self.suite.header_size], view[self.suite.header_size:])
+    
+    def decrypt_parts(self, header, ciphertext) -> bytes:
+        """Decrypt a message given as header and ciphertext (bytes-like, e.g. memoryviews)."""
+        start = time.perf_counter()
         # Parse header
-        sender_ratchet_key = PublicKey(message[:32])
-        msg_num = int.from_bytes(message[32:36], 'big')
-        ciphertext = message[36:]
+        sender_ratchet_key, msg_num = self.suite.parse_header(header)
         
-        self._log(f"📥 Receiving message #{msg_num}")
+        if self.verbose:
+            self._log(f"📥 Receiving message #{msg_num}")
         
-        # Check if sender performed a DH ratchet
-        if self.their_ratchet_key is None or sender_ratchet_key.encode() != self.their_ratchet_key.encode():
-            self._perform_dh_ratchet(sender_ratchet_key)
+        message_key, commit = self._recv_message_key(sender_ratchet_key, msg_num)
         
-        # Get the message key (handle out-of-order messages)
-        message_key = self._get_message_key(sender_ratchet_key.encode(), msg_num)
-        
-        # Decrypt
+        # Decrypt; the ratchet state only moves once the message authenticated
         try:
-            box = SecretBox(message_key)
-            plaintext = box.decrypt(ciphertext)
-            self._log(f"✅ Decrypted successfully, key: {self._hex(message_key)}")
-            return plaintext.decode()
+            plaintext = self.suite.open(message_key, msg_num, ciphertext, header)
+            commit()
+            if self.verbose:
+                self._log(f"✅ Decrypted successfully, key: {self._fingerprint(message_key)}")
+            self.metrics.count("messages_decrypted")
+            self.metrics.observe("decrypt", time.perf_counter() - start)
+            return plaintext
         except Exception as e:
-            self._log(f"❌ Decryption failed: {e}")
+            self.metrics.count("decrypt_failures")
+            if self.verbose:
+                self._log(f"❌ Decryption failed: {e}")
             raise
     
-    # ==================== DH Ratchet ====================
-    
-    def _perform_dh_ratchet(self, new_their_key: PublicKey):
-        """Perform a DH ratchet step when receiving a new ratchet key."""
-        self._log(f"🔄 Performing DH ratchet")
+    # ==================== Stream Keys ====================
+
+    def next_stream_key(self) -> Tuple[bytes, bytes]:
+        """
+        (header, stream key) for a message whose body is encrypted outside
+        the suite, e.g. a streamed attachment (ratchet_attachments.py). The
+        message uses one message number like any other.
+        """
+        msg_num, message_key = self._next_send_message_key()
+        header = self.suite.header(self.my_ratchet_key.public_key.encode(), msg_num)
+        if self.verbose:
+            self._log(f"📤 Sent stream #{msg_num}, key: {self._fingerprint(message_key)}")
+        self.metrics.count("stream_keys_sent")
+        return header, hmac.digest(message_key, b"StreamKey", 'sha256')
+
+    def stream_key(self, header) -> Tuple[bytes, Callable[[], None]]:
+        """
+        (stream key, commit) for a received header from next_stream_key().
+        The header is not authenticated yet: call commit() once data sealed
+        with the stream key has opened, and drop it otherwise.
+        """
+        sender_ratchet_key, msg_num = self.suite.parse_header(header)
+        if self.verbose:
+            self._log(f"📥 Receiving stream #{msg_num}")
+        message_key, commit = self._recv_message_key(sender_ratchet_key, msg_num)
         
-        # Update to their new ratchet key
-        self.their_ratchet_key = new_their_key
+        def commit_stream():
+            commit()
+            self.metrics.count("stream_keys_received")
         
-        # Derive new receiving chain using our current ratchet key
-        dh_output = Box(self.my_ratchet_key, self.their_ratchet_key).shared_key()
-        self.root_key, self.recv_chain_key = self._kdf_root(self.root_key, dh_output)
+        return hmac.digest(message_key, b"StreamKey", 'sha256'), commit_stream
+
+    # ==================== Batch Encryption/Decryption ====================
+    
+    def encrypt_many(self, plaintexts: Sequence[bytes]) -> Tuple[bytearray, List[int]]:
+        """
+        Encrypt a burst of byte messages. Returns one buffer holding all
+        messages back to back and offsets: message i is buffer[offsets[i]:offsets[i + 1]].
+        Each message has the same layout as encrypt() produces.
+        """
+        start = time.perf_counter()
+        suite = self.suite
+        count = len(plaintexts)
+        offsets = [0] * (count + 1)
+        for i, plaintext in enumerate(plaintexts):
+            offsets[i + 1] = offsets[i] + suite.header_size + suite.overhead + len(plaintext)
+        buffer = bytearray(offsets[-1])
+        if suite is XSALSA20_POLY1305:
+            self._seal_many_secretbox(plaintexts, buffer, offsets)
+        else:
+            ratchet_public_key = None
+            for i, plaintext in enumerate(plaintexts):
+                msg_num, message_key = self._next_send_message_key()
+                if ratchet_public_key is None:
+                    # the ratchet key is fixed for the burst once the chain exists
+                    ratchet_public_key = self.my_ratchet_key.public_key.encode()
+                header = suite.header(ratchet_public_key, msg_num)
+                offset = offsets[i]
+                buffer[offset:offset + suite.header_size] = header
+                buffer[offset + suite.header_size:offsets[i + 1]] = \
+                    suite.seal(message_key, msg_num, bytes(plaintext), header)
         
-        self.recv_count = 0
+        if self.verbose:
+            self._log(f"📤 Sent {count} messages")
+        self.metrics.count("messages_encrypted", count)
+        self.metrics.observe("encrypt_many", time.perf_counter() - start)
+        return buffer, offsets
+    
+    def _seal_many_secretbox(self, plaintexts: Sequence[bytes], buffer: bytearray, offsets: List[int]):
+        """
+        Suite 0 burst: all nonces from one urandom call, the header prefix
+        encoded once, crypto_secretbox called directly (same bytes as suite.seal)
+        """
+        nonce_size = bindings.crypto_secretbox_NONCEBYTES
+        nonces = os.urandom(nonce_size * len(plaintexts))
+        header_prefix = None
+        for i, plaintext in enumerate(plaintexts):
+            msg_num, message_key = self._next_send_message_key()
+            if header_prefix is None:
+                # the ratchet key is fixed for the burst once the chain exists
+                header_prefix = self.my_ratchet_key.public_key.encode()
+            nonce = nonces[i * nonce_size:(i + 1) * nonce_size]
+            offset = offsets[i]
+            body = offset + PUBLIC_KEY_SIZE + MSG_NUM_SIZE
+            buffer[offset:body] = header_prefix + msg_num.to_bytes(MSG_NUM_SIZE, 'big')
+            buffer[body:body + nonce_size] = nonce
+            buffer[body + nonce_size:offsets[i + 1]] = bindings.crypto_secretbox(bytes(plaintext), nonce, message_key)
+    
+    def decrypt_many(self, messages, offsets: Optional[Sequence[int]] = None) -> Tuple[bytearray, List[int]]:
+        """
+        Decrypt a burst of messages, given as a sequence of messages or as
+        (buffer, offsets) from encrypt_many. Returns the plaintexts in one
+        buffer with offsets, like encrypt_many.
+        """
+        start = time.perf_counter()
+        if offsets is not None:
+            view = memoryview(messages)
+            messages = [view[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        count = len(messages)
+        plaintexts = []
+        plain_offsets = [0] * (count + 1)
+        suite = self.suite
+        # suite 0: one copy per message, crypto_secretbox_open called directly
+        secretbox = suite is XSALSA20_POLY1305
+        header_size, body = suite.header_size, suite.header_size + bindings.crypto_secretbox_NONCEBYTES
+        for i, message in enumerate(messages):
+            if secretbox:
+                message = bytes(message)
+            sender_ratchet_key, msg_num = suite.parse_header(message)
+            message_key, commit = self._recv_message_key(sender_ratchet_key, msg_num)
+            try:
+                if secretbox:
+                    plaintext = bindings.crypto_secretbox_open(message[body:], message[header_size:body], message_key)
+                else:
+                    plaintext = suite.open(message_key, msg_num, message[header_size:], message[:header_size])
+                commit()
+            except CryptoError as e:
+                self.metrics.count("decrypt_failures")
+                if self.verbose:
+                    self._log(f"❌ Decryption of message {i} of the burst failed: {e}")
+                raise
+            plaintexts.append(plaintext)
+            plain_offsets[i + 1] = plain_offsets[i] + len(plaintext)
         
-        self._log(f"New recv chain: {self._hex(self.recv_chain_key)}")
+        if self.verbose:
+            self._log(f"✅ Decrypted {count} messages")
+        self.metrics.count("messages_decrypted", count)
+        self.metrics.observe("decrypt_many", time.perf_counter() - start)
+        return bytearray(b"".join(plaintexts)), plain_offsets
+    
+    # ==================== DH Ratchet ====================
+    
+    def _check_skip(self, recv_count: int, msg_num: int):
+        """Refuse to derive more than max_skip keys for one message"""
+        if msg_num - recv_count > self.max_skip:
+            raise SkippedMessageError(
+                f"Message #{msg_num} would skip {msg_num - recv_count} keys (MAX_SKIP {self.max_skip})")
     
-    def _get_message_key(self, ratchet_key: bytes, msg_num: int) -> bytes:
+    def _stage_message_key(self, ratchet_key: bytes, msg_num: int) -> Tuple[bytes, tuple]:
         """
-        Get message key for a specific message number.
+        Get message key for a specific message number, on copies of the
+        receiving state; the second item is what _commit_receive() applies.
         Handles out-of-order delivery by storing skipped keys.
         """
-        key_id = (ratchet_key, msg_num)
-        
         # Check if we already computed this key (out-of-order message)
-        if key_id in self.skipped_keys:
-            self._log(f"Using stored key for message #{msg_num}")
-            return self.skipped_keys.pop(key_id)
+        stored = self.skipped_keys.peek((ratchet_key, msg_num))
+        if stored is not None:
+            message_key, stored_chain_key = stored
+            return message_key, (ratchet_key, msg_num, stored_chain_key, None, None, None, (), None, 0.0)
+        
+        new_their_key = new_chain_key = None
+        dh_seconds = 0.0
+        if self.their_ratchet_key is not None and ratchet_key == self.their_ratchet_key.encode():
+            # Already past this message: replayed, or its key was evicted/expired
+            if msg_num < self.recv_count:
+                raise SkippedMessageError(f"No key for message #{msg_num} (replayed, evicted or expired)")
+            self._check_skip(self.recv_count, msg_num)
+            root_key, chain_key, first = self.root_key, self.recv_chain_key, self.recv_count
+        else:
+            # A chain we already moved past is never ratcheted to again
+            if ratchet_key in self.previous_ratchet_keys:
+                raise SkippedMessageError(f"No key for message #{msg_num} of an old chain (evicted or expired)")
+            # Sender performed a DH ratchet; reject a huge gap before the DH
+            self._check_skip(0, msg_num)
+            start = time.perf_counter()
+            new_their_key = PublicKey(ratchet_key)
+            dh_output = Box(self.my_ratchet_key, new_their_key).shared_key()
+            root_key, chain_key = self._kdf_root(self.root_key, dh_output)
+            new_chain_key, first = chain_key, 0
+            dh_seconds = time.perf_counter() - start
         
-        # Advance chain to reach this message
-        while self.recv_count < msg_num:
-            self.recv_chain_key, skipped_key = self._kdf_chain(self.recv_chain_key)
-            self.skipped_keys[(ratchet_key, self.recv_count)] = skipped_key
-            self._log(f"Skipped message #{self.recv_count}, stored key")
-            self.recv_count += 1
+        # Advance a copy of the chain; skipped keys are only checkpointed
+        # and derived later if their message shows up
+        skipped = []
+        for _ in range(first, msg_num):
+            skipped.append(chain_key)
+            chain_key, _ = self._kdf_chain(chain_key)
+        next_chain_key, message_key = self._kdf_chain(chain_key)
+        return message_key, (ratchet_key, msg_num, None, new_their_key, new_chain_key, root_key,
+                             skipped, next_chain_key, dh_seconds)
+    
+    def _commit_receive(self, staged: tuple, receives: int):
+        """Apply a receive staged by _stage_message_key() once its message authenticated"""
+        if self._receives != receives:
+            # other messages were received in between (a stream commits
+            # late): stage again on the current state, same message key
+            staged = self._stage_message_key(staged[0], staged[1])[1]
+        (ratchet_key, msg_num, stored_chain_key, new_their_key, new_chain_key, root_key,
+         skipped, next_chain_key, dh_seconds) = staged
+        self._receives += 1
         
-        # Derive the actual message key
-        self.recv_chain_key, message_key = self._kdf_chain(self.recv_chain_key)
-        self.recv_count += 1
+        if stored_chain_key is not None:
+            self.skipped_keys.discard((ratchet_key, msg_num), stored_chain_key)
+            self.metrics.count("skipped_keys_used")
+            if self.verbose:
+                self._log(f"Using stored key for message #{msg_num}")
+            return
         
-        return message_key
+        if new_their_key is not None:
+            if self.verbose:
+                self._log(f"🔄 Performing DH ratchet")
+            if self.their_ratchet_key is not None:
+                self.previous_ratchet_keys.append(self.their_ratchet_key.encode())
+                del self.previous_ratchet_keys[:-MAX_PREVIOUS_RATCHET_KEYS]
+            self.their_ratchet_key = new_their_key
+            if self.verbose:
+                self._log(f"New recv chain: {self._fingerprint(new_chain_key)}")
+            self.metrics.count("dh_ratchets")
+            self.metrics.observe("dh_ratchet", dh_seconds)
+        self.root_key = root_key
+        if skipped:
+            self.metrics.count("skipped_keys_stored", len(skipped))
+        for skipped_num, skipped_chain_key in enumerate(skipped, msg_num - len(skipped)):
+            self.skipped_keys.skip(ratchet_key, skipped_num, skipped_chain_key)
+            if self.verbose:
+                self._log(f"Skipped message #{skipped_num}, stored key")
+        self.recv_chain_key, self.recv_count = next_chain_key, msg_num + 1
+    
+    # ==================== Serialization ====================
+    
+    def to_bytes(self, storage_key: Optional[bytes] = None) -> bytes:
+        """
+        Serialize the whole session (keys, counters, skipped keys) in the
+        versioned binary layout; sealed with SecretBox when storage_key is given.
+        """
+        name = self.name.encode('utf-8')
+        flags, keys = 0, [self.identity_key.encode(), self.ephemeral_key.encode()]
+        for bit, attribute in enumerate(OPTIONAL_KEYS):
+            value = getattr(self, attribute)
+            if value is not None:
+                flags |= 1 << bit
+                keys.append(value if isinstance(value, bytes) else value.encode())
+        store = self.skipped_keys
+        body = b"".join([
+            SESSION_FIXED.pack(flags, self.send_count, self.recv_count, self.max_skip, store.max_keys,
+                               store.interval, -1.0 if store.ttl is None else store.ttl, len(name),
+                               NO_SUITE if self.suite is None else self.suite.suite_id),
+            name,
+            *keys,
+            bytes([len(self.previous_ratchet_keys)]),
+            *self.previous_ratchet_keys,
+            store.to_bytes(),
+        ])
+        if storage_key is None:
+            return SESSION_HEADER.pack(SESSION_MAGIC, SESSION_FORMAT_VERSION, 0) + body
+        return SESSION_HEADER.pack(SESSION_MAGIC, SESSION_FORMAT_VERSION, 1) + SecretBox(storage_key).encrypt(body)
+    
+    @classmethod
+    def from_bytes(cls, data, storage_key: Optional[bytes] = None, **kwargs) -> "DoubleRatchet":
+        """
+        Restore a session written by to_bytes (same storage_key if it was sealed).
+        kwargs (verbose, metrics, key_pool) go to the constructor; they are not part of the state.
+        """
+        view = memoryview(data)
+        try:
+            magic, version, sealed = SESSION_HEADER.unpack_from(view)
+            if magic != SESSION_MAGIC or not 1 <= version <= SESSION_FORMAT_VERSION:
+                raise SessionFormatError(f"Unsupported session state {bytes(magic)!r} v{version}")
+            body = view[SESSION_HEADER.size:]
+            if sealed:
+                if storage_key is None:
+                    raise SessionFormatError("Session state is sealed, a storage key is needed")
+                body = memoryview(SecretBox(storage_key).decrypt(bytes(body)))
+            
+            fixed = SESSION_FIXED_V1 if version == 1 else SESSION_FIXED
+            flags, send_count, recv_count, max_skip, max_keys, interval, ttl, name_length, *suite_id = \
+                fixed.unpack_from(body)
+            suite_id = suite_id[0] if suite_id else XSALSA20_POLY1305.suite_id
+            if suite_id != NO_SUITE and suite_id not in SUITES:
+                raise SessionFormatError(f"Session uses unavailable cipher suite {suite_id}")
+            offset = fixed.size
+            name = bytes(body[offset:offset + name_length]).decode('utf-8')
+            offset += name_length
+            
+            def next_key() -> bytes:
+                nonlocal offset
+                key = bytes(body[offset:offset + 32])
+                if len(key) != 32:
+                    raise SessionFormatError("Truncated session state")
+                offset += 32
+                return key
+            
+            session = cls(name, max_skip, max_keys, None if ttl < 0 else ttl,
+                          identity_key=PrivateKey(next_key()), ephemeral_key=PrivateKey(next_key()), **kwargs)
+            for bit, attribute in enumerate(OPTIONAL_KEYS):
+                if flags >> bit & 1:
+                    setattr(session, attribute, next_key())
+            if session.my_ratchet_key is not None:
+                session.my_ratchet_key = PrivateKey(session.my_ratchet_key)
+            if session.their_ratchet_key is not None:
+                session.their_ratchet_key = PublicKey(session.their_ratchet_key)
+            if suite_id != NO_SUITE:
+                session.suite = SUITES[suite_id]
+                if 'suites' not in kwargs:
+                    session.suites = [session.suite]
+            if version >= 4:
+                retired, offset = body[offset], offset + 1
+                session.previous_ratchet_keys = [next_key() for _ in range(retired)]
+            session.send_count, session.recv_count = send_count, recv_count
+            session.skipped_keys.interval = interval
+            session.skipped_keys.load(body, offset)
+        except (struct.error, UnicodeDecodeError, IndexError) as e:
+            raise SessionFormatError(f"Malformed session state: {e}") from None
+        except CryptoError:
+            raise SessionFormatError("Session state failed authentication (wrong storage key?)") from None
+        return session
     
     # ==================== Utilities ====================
     
@@ -250,9 +871,16 @@ class DoubleRatchet:
         """Log a message with the participant's name."""
         print(f"{self.name}: {message}")
     
-    def _hex(self, data: bytes, length: int = 4) -> str:
-        """Convert bytes to hex string (first N bytes)."""
-        return binascii.b2a_hex(data[:length]).decode() + "..."
+    def _fingerprint(self, key: bytes) -> str:
+        """Short SHA-256 fingerprint to compare keys in logs without revealing them."""
+        return "fp:" + hashlib.sha256(key).hexdigest()[:8]
+    
+    def metrics_snapshot(self) -> Dict:
+        """Counters and latency histograms, plus this session's skipped-key gauges"""
+        snapshot = self.metrics.snapshot()
+        snapshot["skipped_keys_pending"] = len(self.skipped_keys)
+        snapshot["skipped_key_checkpoints"] = self.skipped_keys.checkpoints()
+        return snapshot
 
 
 # ==================== Test Suite ====================
@@ -264,8 +892,8 @@ def test_simple_conversation():
     print("=" * 70)
     
     # Setup
-    alice = DoubleRatchet("Alice")
-    bob = DoubleRatchet("Bob")
+    alice = DoubleRatchet("Alice", verbose=True)
+    bob = DoubleRatchet("Bob", verbose=True)
     
     # Key exchange
     alice_bundle = alice.get_public_bundle()
@@ -276,8 +904,8 @@ def test_simple_conversation():
     
     # Verify initial key agreement
     print(f"\n🔍 Verification:")
-    print(f"Alice root key: {alice._hex(alice.root_key)}")
-    print(f"Bob root key:   {bob._hex(bob.root_key)}")
+    print(f"Alice root key: {alice._fingerprint(alice.root_key)}")
+    print(f"Bob root key:   {bob._fingerprint(bob.root_key)}")
     print(f"Root keys match: {alice.root_key == bob.root_key}")
     print(f"Alice send == Bob recv: {alice.send_chain_key == bob.recv_chain_key}")
     
@@ -313,8 +941,8 @@ def test_multiple_messages():
     print("TEST: Multiple Consecutive Messages")
     print("=" * 70)
     
-    alice = DoubleRatchet("Alice")
-    bob = DoubleRatchet("Bob")
+    alice = DoubleRatchet("Alice", verbose=True)
+    bob = DoubleRatchet("Bob", verbose=True)
     
     alice_bundle = alice.get_public_bundle()
     bob_bundle = bob.get_public_bundle()
@@ -341,8 +969,8 @@ def test_out_of_order():
     print("TEST: Out-of-Order Delivery")
     print("=" * 70)
     
-    alice = DoubleRatchet("Alice")
-    bob = DoubleRatchet("Bob")
+    alice = DoubleRatchet("Alice", verbose=True)
+    bob = DoubleRatchet("Bob", verbose=True)
     
     alice_bundle = alice.get_public_bundle()
     bob_bundle = bob.get_public_bundle()
@@ -372,10 +1000,384 @@ def test_out_of_order():
     print("🎉 Out-of-order test PASSED!\n")
 
 
+def test_skipped_key_limits():
+    """Test MAX_SKIP and the bounded skipped-key store."""
+    print("=" * 70)
+    print("TEST: Skipped-Key Limits")
+    print("=" * 70)
+    
+    alice = DoubleRatchet("Alice")
+    bob = DoubleRatchet("Bob", max_skip=50, max_skipped_keys=60)
+    
+    alice_bundle = alice.get_public_bundle()
+    bob_bundle = bob.get_public_bundle()
+    
+    alice_ephemeral = alice.init_as_alice(bob_bundle)
+    bob.init_as_bob(alice_bundle, alice_ephemeral)
+    
+    print("\n--- Forged header with message number 2^32 - 1 ---\n")
+    forged = bytearray(alice.encrypt("Hello Bob!"))
+    forged[32:36] = (2 ** 32 - 1).to_bytes(4, 'big')
+    start = time.perf_counter()
+    try:
+        bob.decrypt(bytes(forged))
+        raise AssertionError("Forged header accepted")
+    except SkippedMessageError as e:
+        print(f"✅ Rejected in {(time.perf_counter() - start) * 1000:.2f} ms: {e}")
+    assert len(bob.skipped_keys) == 0 and bob.recv_count == 0
+    
+    print("\n--- Gaps within MAX_SKIP fill the store, the oldest keys are evicted ---\n")
+    messages = [alice.encrypt(f"Message {i}") for i in range(1, 101)]
+    assert bob.decrypt(messages[49]) == "Message 50"   # #50 skips #0..#49 (forged #0 was rejected)
+    assert bob.decrypt(messages[99]) == "Message 100"  # #100 skips 49 more: 99 > 60 stored
+    print(f"✅ Stored skipped keys: {len(bob.skipped_keys)} (cap 60, evicted {bob.skipped_keys.evicted})")
+    assert len(bob.skipped_keys) == 60
+    assert bob.decrypt(messages[98]) == "Message 99"
+    try:
+        bob.decrypt(messages[0])
+        raise AssertionError("Evicted key still available")
+    except SkippedMessageError as e:
+        print(f"✅ Evicted key refused: {e}")
+    
+    print("\n--- Skipped keys expire after their TTL ---\n")
+    now = [0.0]
+    store = SkippedKeyStore(bob._kdf_chain, max_keys=10, ttl=60, clock=lambda: now[0], checkpoint_interval=4)
+    chain_key = os.urandom(32)
+    for msg_num in range(8):
+        store.skip(b"chain", msg_num, chain_key)
+        chain_key, message_key = bob._kdf_chain(chain_key)
+        now[0] += 10.0
+    now[0] = 61.0  # block 0..3 created at t=0, block 4..7 at t=40
+    assert store.pop((b"chain", 0)) is None and store.pop((b"chain", 7)) == message_key
+    print("✅ Expired key dropped, fresh key kept")
+    
+    print("\n🎉 Skipped-key limits test PASSED!\n")
+
+
+def test_lazy_skipped_keys():
+    """Test checkpointed skipped keys over a large reorder window."""
+    print("=" * 70)
+    print("TEST: Lazy Skipped Keys")
+    print("=" * 70)
+    
+    import random
+    import tracemalloc
+    
+    window = 20000
+    alice = DoubleRatchet("Alice")
+    bob = DoubleRatchet("Bob", max_skip=window, max_skipped_keys=window)
+    
+    alice_bundle = alice.get_public_bundle()
+    bob_bundle = bob.get_public_bundle()
+    
+    alice_ephemeral = alice.init_as_alice(bob_bundle)
+    bob.init_as_bob(alice_bundle, alice_ephemeral)
+    
+    print(f"\n--- Alice sends {window + 1} messages, only the last arrives first ---\n")
+    messages = [alice.encrypt(f"Message {i}") for i in range(window + 1)]
+    
+    tracemalloc.start()
+    assert bob.decrypt(messages[-1]) == f"Message {window}"
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"✅ {len(bob.skipped_keys)} skipped keys held as {bob.skipped_keys.checkpoints()} checkpoints "
+          f"({held / 1024:.1f} KB)")
+    
+    print("\n--- Late messages arrive in random order ---\n")
+    order = list(range(window))
+    random.shuffle(order)
+    start = time.perf_counter()
+    for i in order:
+        assert bob.decrypt(messages[i]) == f"Message {i}"
+    elapsed = time.perf_counter() - start
+    print(f"✅ Decrypted {window} late messages, {elapsed / window * 1e6:.1f} us each")
+    assert len(bob.skipped_keys) == 0 and bob.skipped_keys.checkpoints() == 0
+    
+    print("\n🎉 Lazy skipped keys test PASSED!\n")
+
+
+def test_session_serialization():
+    """Test saving and restoring sessions mid-conversation."""
+    print("=" * 70)
+    print("TEST: Session Serialization")
+    print("=" * 70)
+    
+    alice = DoubleRatchet("Alice")
+    bob = DoubleRatchet("Bob")
+    
+    alice_bundle = alice.get_public_bundle()
+    bob_bundle = bob.get_public_bundle()
+    
+    alice_ephemeral = alice.init_as_alice(bob_bundle)
+    bob.init_as_bob(alice_bundle, alice_ephemeral)
+    
+    print("\n--- Bob saves his session with 100 skipped keys pending ---\n")
+    late = [alice.encrypt(f"Late {i}") for i in range(100)]
+    assert bob.decrypt(alice.encrypt("Newest")) == "Newest"
+    storage_key = os.urandom(32)
+    plain_state = bob.to_bytes()
+    sealed_state = bob.to_bytes(storage_key)
+    print(f"✅ State: {len(plain_state)} bytes, sealed: {len(sealed_state)} bytes")
+    
+    print("\n--- Restored session keeps the conversation going ---\n")
+    bob = DoubleRatchet.from_bytes(sealed_state, storage_key)
+    assert len(bob.skipped_keys) == 100 and len(bob.to_bytes()) == len(plain_state)
+    assert bob.decrypt(late[42]) == "Late 42"
+    assert alice.decrypt(bob.encrypt("Restored!")) == "Restored!"
+    assert bob.decrypt(alice.encrypt("After ratchet")) == "After ratchet"
+    assert bob.decrypt(late[7]) == "Late 7"
+    print("✅ Late, reply and post-ratchet messages decrypted after restore")
+    
+    try:
+        DoubleRatchet.from_bytes(sealed_state, os.urandom(32))
+        raise AssertionError("Wrong storage key accepted")
+    except SessionFormatError as e:
+        print(f"✅ Wrong storage key refused: {e}")
+    
+    print("\n🎉 Session serialization test PASSED!\n")
+
+
+def test_batch_messages():
+    """Test encrypt_many / decrypt_many against the single-message API."""
+    print("=" * 70)
+    print("TEST: Batch Messages")
+    print("=" * 70)
+    
+    alice = DoubleRatchet("Alice", verbose=True)
+    bob = DoubleRatchet("Bob", verbose=True)
+    
+    alice_bundle = alice.get_public_bundle()
+    bob_bundle = bob.get_public_bundle()
+    
+    alice_ephemeral = alice.init_as_alice(bob_bundle)
+    bob.init_as_bob(alice_bundle, alice_ephemeral)
+    
+    print("\n--- Bursts interoperate with single messages ---\n")
+    burst = [f"Burst {i}".encode() for i in range(5)]
+    buffer, offsets = alice.encrypt_many(burst)
+    assert bob.decrypt(bytes(buffer[offsets[0]:offsets[1]])) == "Burst 0"
+    plain, plain_offsets = bob.decrypt_many(buffer[offsets[1]:], [o - offsets[1] for o in offsets[1:]])
+    assert [bytes(plain[plain_offsets[i]:plain_offsets[i + 1]]) for i in range(4)] == burst[1:]
+    replies = [bob.encrypt("Reply A"), bob.encrypt("Reply B")]
+    plain, plain_offsets = alice.decrypt_many(replies)
+    assert bytes(plain) == b"Reply AReply B" and plain_offsets == [0, 7, 14]
+    print("✅ encrypt_many → decrypt/decrypt_many and encrypt → decrypt_many")
+    
+    print("\n--- Burst of 10000 messages ---\n")
+    alice.verbose = bob.verbose = False
+    texts = [os.urandom(50).hex() for _ in range(10000)]
+    messages = [text.encode() for text in texts]
+    
+    start = time.perf_counter()
+    singles = [alice.encrypt(text) for text in texts]
+    for message in singles:
+        bob.decrypt(message)
+    single = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    buffer, offsets = alice.encrypt_many(messages)
+    plain, plain_offsets = bob.decrypt_many(buffer, offsets)
+    batch = time.perf_counter() - start
+    assert bytes(plain) == b"".join(messages)
+    print(f"✅ Single calls: {single / len(messages) * 1e6:.1f} us/message, "
+          f"batch: {batch / len(messages) * 1e6:.1f} us/message")
+    
+    print("\n🎉 Batch messages test PASSED!\n")
+
+
+def test_metrics():
+    """Test counters and latency histograms, and that logs carry no key bytes."""
+    print("=" * 70)
+    print("TEST: Metrics")
+    print("=" * 70)
+    
+    metrics = RatchetMetrics()
+    alice = DoubleRatchet("Alice", metrics=metrics)
+    bob = DoubleRatchet("Bob", metrics=metrics, max_skip=10)
+    
+    alice_bundle = alice.get_public_bundle()
+    bob_bundle = bob.get_public_bundle()
+    
+    alice_ephemeral = alice.init_as_alice(bob_bundle)
+    bob.init_as_bob(alice_bundle, alice_ephemeral)
+    
+    print("\n--- Shared metrics over a conversation ---\n")
+    messages = [alice.encrypt(f"Message {i}") for i in range(5)]
+    for i in (4, 1, 0):
+        assert bob.decrypt(messages[i]) == f"Message {i}"
+    assert alice.decrypt(bob.encrypt("Reply")) == "Reply"
+    forged = bytearray(alice.encrypt("Forged"))
+    forged[32:36] = (1000).to_bytes(4, 'big')
+    try:
+        bob.decrypt(bytes(forged))
+    except SkippedMessageError:
+        pass
+    buffer, offsets = alice.encrypt_many([b"a", b"b", b"c"])
+    bob.decrypt_many(buffer, offsets)
+    
+    snapshot = bob.metrics_snapshot()
+    print(f"✅ Counters: {snapshot['counters']}")
+    print(f"✅ Decrypt latency: p50 < {snapshot['histograms']['decrypt']['p50_us']} us, "
+          f"p99 < {snapshot['histograms']['decrypt']['p99_us']} us")
+    assert snapshot["counters"]["messages_encrypted"] == 10
+    assert snapshot["counters"]["messages_decrypted"] == 7
+    assert snapshot["counters"]["skipped_keys_stored"] == 5   # #0-#3, then the forged #5
+    assert snapshot["counters"]["skipped_keys_used"] == 2
+    assert snapshot["counters"]["skip_limit_rejections"] == 1
+    assert snapshot["histograms"]["decrypt"]["count"] == 4
+    assert snapshot["skipped_keys_pending"] == 3
+    
+    print("\n--- Verbose logs show fingerprints, never key bytes ---\n")
+    lines = []
+    bob.verbose = True
+    bob._log = lines.append
+    bob.encrypt("Logged")
+    bob.verbose = False
+    assert bob.root_key.hex()[:8] not in lines[0] and "fp:" in lines[0]
+    print(f"✅ {lines[0]}")
+    
+    print("\n🎉 Metrics test PASSED!\n")
+
+
+def test_cipher_suites():
+    """Test suite negotiation and the AEAD suites."""
+    print("=" * 70)
+    print("TEST: Cipher Suites")
+    print("=" * 70)
+    
+    from ratchet_cipher_suites import preferred_suites
+    
+    print("\n--- Negotiation ---\n")
+    for alice_suites, bob_suites in ((preferred_suites(), preferred_suites()),
+                                     (preferred_suites(), [XSALSA20_POLY1305]),
+                                     (preferred_suites()[::-1][1:], preferred_suites())):
+        alice = DoubleRatchet("Alice", suites=alice_suites)
+        bob = DoubleRatchet("Bob", suites=bob_suites)
+        bob.init_as_bob(alice.get_public_bundle(), alice.init_as_alice(bob.get_public_bundle()))
+        assert alice.suite is bob.suite and alice.root_key == bob.root_key
+        print(f"✅ Alice {alice_suites} / Bob {bob_suites}: {alice.suite}")
+    
+    for suite in preferred_suites():
+        print(f"\n--- {suite} ---\n")
+        alice = DoubleRatchet("Alice", suites=[suite])
+        bob = DoubleRatchet("Bob", suites=[suite])
+        bob.init_as_bob(alice.get_public_bundle(), alice.init_as_alice(bob.get_public_bundle()))
+        
+        messages = [alice.encrypt(f"Message {i}") for i in range(3)]
+        assert len(messages[0]) == suite.header_size + suite.overhead + len("Message 0")
+        assert bob.decrypt(messages[2]) == "Message 2" and bob.decrypt(messages[0]) == "Message 0"
+        assert alice.decrypt(bob.encrypt("Reply")) == "Reply"
+        buffer, offsets = alice.encrypt_many([b"x" * 100, b"y" * 200])
+        plain, plain_offsets = bob.decrypt_many(buffer, offsets)
+        assert bytes(plain) == b"x" * 100 + b"y" * 200
+        
+        restored = DoubleRatchet.from_bytes(bob.to_bytes())
+        assert restored.suite is suite and restored.decrypt(messages[1]) == "Message 1"
+        print("✅ Out-of-order, reply, burst and restored session")
+        
+        if suite is not XSALSA20_POLY1305:
+            tampered = bytearray(alice.encrypt("Tamper"))
+            tampered[-1] ^= 1
+            try:
+                restored.decrypt(bytes(tampered))
+                raise AssertionError("Tampered ciphertext accepted")
+            except CryptoError:
+                print("✅ Tampered ciphertext rejected")
+            tampered[0] = XSALSA20_POLY1305.suite_id
+            try:
+                restored.decrypt(bytes(tampered))
+                raise AssertionError("Suite downgrade accepted")
+            except ValueError as e:
+                print(f"✅ Wrong suite id rejected: {e}")
+    
+    print("\n🎉 Cipher suites test PASSED!\n")
+
+
+def test_one_time_prekey():
+    """Test X3DH with a one-time prekey (fourth DH)."""
+    print("=" * 70)
+    print("TEST: One-Time Prekey")
+    print("=" * 70)
+    
+    one_time_key = PrivateKey.generate()
+    alice, bob = DoubleRatchet("Alice"), DoubleRatchet("Bob")
+    bob_bundle = dict(bob.get_public_bundle(), one_time=one_time_key.public_key.encode(), one_time_id=7)
+    alice_ephemeral = alice.init_as_alice(bob_bundle)
+    message = alice.encrypt("Hello with DH4")
+    
+    # Without the one-time prekey Bob derives a different root key
+    without = DoubleRatchet("Bob", identity_key=bob.identity_key, ephemeral_key=bob.ephemeral_key)
+    without.init_as_bob(alice.get_public_bundle(), alice_ephemeral)
+    assert without.root_key != alice.root_key
+    try:
+        without.decrypt(message)
+        raise AssertionError("Decrypted without the one-time prekey")
+    except CryptoError:
+        print("✅ Bob without the one-time prekey cannot decrypt")
+    
+    bob.init_as_bob(alice.get_public_bundle(), alice_ephemeral, one_time_key)
+    assert bob.decrypt(message) == "Hello with DH4"
+    assert alice.decrypt(bob.encrypt("Reply")) == "Reply"
+    print("✅ Bob with the one-time prekey decrypts, and replies")
+    
+    print("\n🎉 One-time prekey test PASSED!\n")
+
+
+def test_unauthenticated_headers():
+    """Test that messages failing authentication leave the session unchanged."""
+    print("=" * 70)
+    print("TEST: Unauthenticated Headers")
+    print("=" * 70)
+    
+    alice, bob = DoubleRatchet("Alice"), DoubleRatchet("Bob")
+    bob.init_as_bob(alice.get_public_bundle(), alice.init_as_alice(bob.get_public_bundle()))
+    assert bob.decrypt(alice.encrypt("Hello")) == "Hello"
+    
+    print("\n--- Forged message: random ratchet key, message #500 ---\n")
+    state = bob.to_bytes()
+    forged = os.urandom(32) + (500).to_bytes(4, 'big') + os.urandom(64)
+    try:
+        bob.decrypt(forged)
+        raise AssertionError("Forged message accepted")
+    except CryptoError:
+        pass
+    assert bob.to_bytes() == state and len(bob.skipped_keys) == 0
+    print("✅ Rejected; no DH ratchet, no skipped keys stored")
+    assert bob.decrypt(alice.encrypt("Still fine")) == "Still fine"
+    print("✅ Next genuine message decrypts")
+    
+    print("\n--- Message on a retired ratchet key ---\n")
+    retired = bob.ephemeral_key.public_key.encode()
+    assert alice.decrypt(bob.encrypt("Reply")) == "Reply"  # Alice ratchets off Bob's ephemeral
+    assert alice.previous_ratchet_keys == [retired]
+    root_key = alice.root_key
+    try:
+        alice.decrypt(retired + (3).to_bytes(4, 'big') + os.urandom(64))
+        raise AssertionError("Retired chain accepted")
+    except SkippedMessageError as e:
+        print(f"✅ Refused without a DH ratchet: {e}")
+    assert alice.root_key == root_key
+    assert alice.decrypt(bob.encrypt("Again")) == "Again"
+    
+    restored = DoubleRatchet.from_bytes(alice.to_bytes())
+    assert restored.previous_ratchet_keys == alice.previous_ratchet_keys
+    print("✅ Retired ratchet keys survive serialization")
+    
+    print("\n🎉 Unauthenticated headers test PASSED!\n")
+
+
 if __name__ == "__main__":
     test_simple_conversation()
     test_multiple_messages()
     test_out_of_order()
+    test_skipped_key_limits()
+    test_lazy_skipped_keys()
+    test_session_serialization()
+    test_batch_messages()
+    test_metrics()
+    test_cipher_suites()
+    test_one_time_prekey()
+    test_unauthenticated_headers()
     
     print("=" * 70)
     print("🎊 ALL TESTS PASSED! 🎊")
@@ -386,36 +1388,36 @@ if __name__ == "__main__":
 TEST: Simple Conversation
 ======================================================================
 Alice: Session initialized as Alice
-Alice: Root key: 753ca6f2...
-Alice: Send chain: 3d4efaef...
+Alice: Root key: fp:56a78411
+Alice: Send chain: fp:72491ca3
 Bob: Session initialized as Bob
-Bob: Root key: 753ca6f2...
-Bob: Recv chain: 3d4efaef...
+Bob: Root key: fp:56a78411
+Bob: Recv chain: fp:72491ca3
 
 🔍 Verification:
-Alice root key: 753ca6f2...
-Bob root key:   753ca6f2...
+Alice root key: fp:56a78411
+Bob root key:   fp:56a78411
 Root keys match: True
 Alice send == Bob recv: True
 
 --- Conversation Start ---
 
-Alice: 📤 Sent message #0, key: 330fdbe5...
+Alice: 📤 Sent message #0, key: fp:ed41c4a7
 Bob: 📥 Receiving message #0
-Bob: ✅ Decrypted successfully, key: 330fdbe5...
+Bob: ✅ Decrypted successfully, key: fp:ed41c4a7
 ✅ Alice → Bob: 'Hello Bob!'
 
-Bob: Initialized send chain: d700cb14...
-Bob: 📤 Sent message #0, key: 6b1b08dd...
+Bob: Initialized send chain: fp:989f7d6f
+Bob: 📤 Sent message #0, key: fp:fa0414e3
 Alice: 📥 Receiving message #0
 Alice: 🔄 Performing DH ratchet
-Alice: New recv chain: d700cb14...
-Alice: ✅ Decrypted successfully, key: 6b1b08dd...
+Alice: New recv chain: fp:989f7d6f
+Alice: ✅ Decrypted successfully, key: fp:fa0414e3
 ✅ Bob → Alice: 'Hi Alice! How are you?'
 
-Alice: 📤 Sent message #1, key: ae64e7d9...
+Alice: 📤 Sent message #1, key: fp:040de4f2
 Bob: 📥 Receiving message #1
-Bob: ✅ Decrypted successfully, key: ae64e7d9...
+Bob: ✅ Decrypted successfully, key: fp:040de4f2
 ✅ Alice → Bob: 'I'm great, thanks!'
 
 🎉 Simple conversation test PASSED!
@@ -424,27 +1426,27 @@ Bob: ✅ Decrypted successfully, key: ae64e7d9...
 TEST: Multiple Consecutive Messages
 ======================================================================
 Alice: Session initialized as Alice
-Alice: Root key: a7518a37...
-Alice: Send chain: 2dc6e3d2...
+Alice: Root key: fp:2ff9a5cd
+Alice: Send chain: fp:bb82db28
 Bob: Session initialized as Bob
-Bob: Root key: a7518a37...
-Bob: Recv chain: 2dc6e3d2...
+Bob: Root key: fp:2ff9a5cd
+Bob: Recv chain: fp:bb82db28
 
 --- Alice sends 3 messages in a row ---
 
-Alice: 📤 Sent message #0, key: 0e915449...
-Alice: 📤 Sent message #1, key: 3f671d26...
-Alice: 📤 Sent message #2, key: 405841e7...
+Alice: 📤 Sent message #0, key: fp:b1b4725c
+Alice: 📤 Sent message #1, key: fp:56449d71
+Alice: 📤 Sent message #2, key: fp:66071a17
 Bob: 📥 Receiving message #0
-Bob: ✅ Decrypted successfully, key: 0e915449...
+Bob: ✅ Decrypted successfully, key: fp:b1b4725c
 ✅ Message 1: 'Message 1'
 
 Bob: 📥 Receiving message #1
-Bob: ✅ Decrypted successfully, key: 3f671d26...
+Bob: ✅ Decrypted successfully, key: fp:56449d71
 ✅ Message 2: 'Message 2'
 
 Bob: 📥 Receiving message #2
-Bob: ✅ Decrypted successfully, key: 405841e7...
+Bob: ✅ Decrypted successfully, key: fp:66071a17
 ✅ Message 3: 'Message 3'
 
 🎉 Multiple messages test PASSED!
@@ -453,37 +1455,181 @@ Bob: ✅ Decrypted successfully, key: 405841e7...
 TEST: Out-of-Order Delivery
 ======================================================================
 Alice: Session initialized as Alice
-Alice: Root key: e5ccf07c...
-Alice: Send chain: a7e16fa8...
+Alice: Root key: fp:4c2d5166
+Alice: Send chain: fp:d44ae7fe
 Bob: Session initialized as Bob
-Bob: Root key: e5ccf07c...
-Bob: Recv chain: a7e16fa8...
+Bob: Root key: fp:4c2d5166
+Bob: Recv chain: fp:d44ae7fe
 
 --- Alice sends 3 messages, Bob receives out of order ---
 
-Alice: 📤 Sent message #0, key: 55355bed...
-Alice: 📤 Sent message #1, key: 7b9a3662...
-Alice: 📤 Sent message #2, key: faa04391...
+Alice: 📤 Sent message #0, key: fp:6a650299
+Alice: 📤 Sent message #1, key: fp:614620f9
+Alice: 📤 Sent message #2, key: fp:1de22511
 Bob: 📥 Receiving message #2
 Bob: Skipped message #0, stored key
 Bob: Skipped message #1, stored key
-Bob: ✅ Decrypted successfully, key: faa04391...
+Bob: ✅ Decrypted successfully, key: fp:1de22511
 ✅ Received message 3: 'Third'
 
 Bob: 📥 Receiving message #0
 Bob: Using stored key for message #0
-Bob: ✅ Decrypted successfully, key: 55355bed...
+Bob: ✅ Decrypted successfully, key: fp:6a650299
 ✅ Received message 1: 'First'
 
 Bob: 📥 Receiving message #1
 Bob: Using stored key for message #1
-Bob: ✅ Decrypted successfully, key: 7b9a3662...
+Bob: ✅ Decrypted successfully, key: fp:614620f9
 ✅ Received message 2: 'Second'
 
 🎉 Out-of-order test PASSED!
 
 ======================================================================
-🎊 ALL TESTS PASSED! 🎊
+TEST: Skipped-Key Limits
+======================================================================
+
+--- Forged header with message number 2^32 - 1 ---
+
+✅ Rejected in 0.03 ms: Message #4294967295 would skip 4294967295 keys (MAX_SKIP 50)
+
+--- Gaps within MAX_SKIP fill the store, the oldest keys are evicted ---
+
+✅ Stored skipped keys: 60 (cap 60, evicted 39)
+✅ Evicted key refused: No key for message #1 (replayed, evicted or expired)
+
+--- Skipped keys expire after their TTL ---
+
+✅ Expired key dropped, fresh key kept
+
+🎉 Skipped-key limits test PASSED!
+
+======================================================================
+TEST: Lazy Skipped Keys
+======================================================================
+
+--- Alice sends 20001 messages, only the last arrives first ---
+
+✅ 20000 skipped keys held as 313 checkpoints (84.6 KB)
+
+--- Late messages arrive in random order ---
+
+✅ Decrypted 20000 late messages, 303.8 us each
+
+🎉 Lazy skipped keys test PASSED!
+
 ======================================================================
+TEST: Session Serialization
+======================================================================
+
+--- Bob saves his session with 100 skipped keys pending ---
+
+✅ State: 406 bytes, sealed: 446 bytes
+
+--- Restored session keeps the conversation going ---
+
+✅ Late, reply and post-ratchet messages decrypted after restore
+✅ Wrong storage key refused: Session state failed authentication (wrong storage key?)
+
+🎉 Session serialization test PASSED!
+
+======================================================================
+TEST: Batch Messages
+======================================================================
+Alice: Session initialized as Alice
+Alice: Root key: fp:3f9ed59c
+Alice: Send chain: fp:5e33a99a
+Bob: Session initialized as Bob
+Bob: Root key: fp:3f9ed59c
+Bob: Recv chain: fp:5e33a99a
+
+--- Bursts interoperate with single messages ---
+
+Alice: 📤 Sent 5 messages
+Bob: 📥 Receiving message #0
+Bob: ✅ Decrypted successfully, key: fp:66cec8cd
+Bob: ✅ Decrypted 4 messages
+Bob: Initialized send chain: fp:8ab482ef
+Bob: 📤 Sent message #0, key: fp:9f3a5e3b
+Bob: 📤 Sent message #1, key: fp:463827ab
+Alice: 🔄 Performing DH ratchet
+Alice: New recv chain: fp:8ab482ef
+Alice: ✅ Decrypted 2 messages
+✅ encrypt_many → decrypt/decrypt_many and encrypt → decrypt_many
+
+--- Burst of 10000 messages ---
+
+✅ Single calls: 43.8 us/message, batch: 46.6 us/message
+
+🎉 Batch messages test PASSED!
 
-"""
\ No newline at end of file
+======================================================================
+TEST: Metrics
+======================================================================
+
+--- Shared metrics over a conversation ---
+
+✅ Counters: {'messages_encrypted': 10, 'skipped_keys_stored': 5, 'messages_decrypted': 7, 'skipped_keys_used': 2, 'dh_ratchets': 2, 'skip_limit_rejections': 1}
+✅ Decrypt latency: p50 < 64 us, p99 < 256 us
+
+--- Verbose logs show fingerprints, never key bytes ---
+
+✅ 📤 Sent message #1, key: fp:2e49e027
+
+🎉 Metrics test PASSED!
+
+======================================================================
+TEST: Cipher Suites
+======================================================================
+
+--- Negotiation ---
+
+✅ Alice [X25519_AES256GCM_SHA256, X25519_CHACHA20POLY1305_SHA256, X25519_XSALSA20POLY1305_SHA256] / Bob [X25519_AES256GCM_SHA256, X25519_CHACHA20POLY1305_SHA256, X25519_XSALSA20POLY1305_SHA256]: X25519_AES256GCM_SHA256
+✅ Alice [X25519_AES256GCM_SHA256, X25519_CHACHA20POLY1305_SHA256, X25519_XSALSA20POLY1305_SHA256] / Bob [X25519_XSALSA20POLY1305_SHA256]: X25519_XSALSA20POLY1305_SHA256
+✅ Alice [X25519_CHACHA20POLY1305_SHA256, X25519_AES256GCM_SHA256] / Bob [X25519_AES256GCM_SHA256, X25519_CHACHA20POLY1305_SHA256, X25519_XSALSA20POLY1305_SHA256]: X25519_CHACHA20POLY1305_SHA256
+
+--- X25519_AES256GCM_SHA256 ---
+
+✅ Out-of-order, reply, burst and restored session
+✅ Tampered ciphertext rejected
+✅ Wrong suite id rejected: Message is not X25519_AES256GCM_SHA256 (suite id 0, expected 2)
+
+--- X25519_CHACHA20POLY1305_SHA256 ---
+
+✅ Out-of-order, reply, burst and restored session
+✅ Tampered ciphertext rejected
+✅ Wrong suite id rejected: Message is not X25519_CHACHA20POLY1305_SHA256 (suite id 0, expected 1)
+
+--- X25519_XSALSA20POLY1305_SHA256 ---
+
+✅ Out-of-order, reply, burst and restored session
+
+🎉 Cipher suites test PASSED!
+
+======================================================================
+TEST: One-Time Prekey
+======================================================================
+✅ Bob without the one-time prekey cannot decrypt
+✅ Bob with the one-time prekey decrypts, and replies
+
+🎉 One-time prekey test PASSED!
+
+======================================================================
+TEST: Unauthenticated Headers
+======================================================================
+
+--- Forged message: random ratchet key, message #500 ---
+
+✅ Rejected; no DH ratchet, no skipped keys stored
+✅ Next genuine message decrypts
+
+--- Message on a retired ratchet key ---
+
+✅ Refused without a DH ratchet: No key for message #3 of an old chain (evicted or expired)
+✅ Retired ratchet keys survive serialization
+
+🎉 Unauthenticated headers test PASSED!
+
+======================================================================
+🎊 ALL TESTS PASSED! 🎊
+======================================================================
+"""
@@ -0,0 +1,308 @@
+#!pip install pynacl cryptography
+
+"""
+Streamed attachments under a DoubleRatchet message key (STREAM construction).
+
+DoubleRatchet.encrypt_bytes() seals the whole plaintext in one AEAD call, so a
+1 GB attachment needs the whole file (and its ciphertext) in memory. Here an
+attachment is one ratchet message whose body is cut into fixed-size segments:
+
+    ratchet header (suite header_size) | version (1) | segment size (4)
+    segment 0 | segment 1 | ... | final segment
+
+- the stream key is HMAC(message key, "StreamKey") (DoubleRatchet.next_stream_key
+  / stream_key), so it is used for this attachment only; the receiving
+  ratchet state only moves once the first segment has opened, so a forged
+  stream header leaves the session as it was
+- every segment is sealed on its own with nonce = 0 (7) | counter (4) | final
+  flag (1) and the ratchet + stream header as associated data: segments cannot
+  be reordered, dropped, or moved to another attachment, and cutting the stream
+  at a segment boundary fails on the final-segment flag
+- all segments are segment size + 16 bytes except the final one (0 to segment
+  size bytes of plaintext)
+- the AEAD is the session suite's (AES-256-GCM / ChaCha20-Poly1305); suite 0
+  sessions use PyNaCl's ChaCha20-Poly1305 (IETF)
+
+Both sides are incremental, update() / finalize() like hashlib: memory stays
+at about one segment whatever the attachment size, and the first segments can
+be on the wire before the rest of the file has been read. The decryptor holds
+back the last complete segment until more data (or finalize) shows whether it
+is the final one. Plaintext from update() is authenticated segment by segment;
+only finalize() confirms the attachment is complete.
+"""
+import struct
+from typing import BinaryIO, Callable, Optional
+
+from nacl import bindings
+from nacl.exceptions import CryptoError
+
+from double_ratchet_demo import DoubleRatchet
+
+STREAM_VERSION = 1
+STREAM_HEADER = struct.Struct(">BI")
+SEGMENT_NONCE = struct.Struct(">7xIB")
+TAG_SIZE = 16
+DEFAULT_SEGMENT_SIZE = 64 * 1024
+MAX_SEGMENT_SIZE = 16 * 1024 * 1024
+MAX_SEGMENTS = 2 ** 32
+
+
+class StreamError(ValueError):
+    """Malformed, truncated or misused attachment stream"""
+
+
+class _ChaCha20Poly1305:
+    """PyNaCl's IETF ChaCha20-Poly1305, with the interface of cryptography's AEAD classes"""
+
+    def __init__(self, key: bytes):
+        self._key = key
+
+    def encrypt(self, nonce: bytes, data, associated_data: bytes) -> bytes:
+        return bindings.crypto_aead_chacha20poly1305_ietf_encrypt(bytes(data), associated_data, nonce, self._key)
+
+    def decrypt(self, nonce: bytes, data, associated_data: bytes) -> bytes:
+        return bindings.crypto_aead_chacha20poly1305_ietf_decrypt(bytes(data), associated_data, nonce, self._key)
+
+
+class _Segments:
+    """Segment AEAD and counter shared by the encryptor and decryptor"""
+
+    def __init__(self, session: DoubleRatchet, key: bytes, header: bytes,
+                 commit: Optional[Callable[[], None]] = None):
+        aead_class = getattr(session.suite, "aead_class", None) or _ChaCha20Poly1305
+        self._aead = aead_class(key)
+        self._header = header
+        self._commit = commit  # receiving side: apply the ratchet step after the first good segment
+        self.counter = 0
+        self.done = False
+
+    def _nonce(self, final: bool) -> bytes:
+        if self.done:
+            raise StreamError("Stream already finalized")
+        if self.counter >= MAX_SEGMENTS:
+            raise StreamError("Too many segments for one stream")
+        nonce = SEGMENT_NONCE.pack(self.counter, final)
+        self.counter += 1
+        self.done = final
+        return nonce
+
+    def seal(self, plaintext, final: bool) -> bytes:
+        return self._aead.encrypt(self._nonce(final), plaintext, self._header)
+
+    def open(self, ciphertext, final: bool) -> bytes:
+        counter = self.counter
+        try:
+            plaintext = self._aead.decrypt(self._nonce(final), ciphertext, self._header)
+        except Exception as e:  # cryptography's InvalidTag or PyNaCl's CryptoError
+            self.done = True
+            kind = "final segment (truncated stream?)" if final else "segment"
+            raise CryptoError(f"Attachment {kind} #{counter} failed verification") from e
+        if self._commit is not None:
+            self._commit()
+            self._commit = None
+        return plaintext
+
+
+class AttachmentEncryptor:
+    def __init__(self, session: DoubleRatchet, segment_size: int = DEFAULT_SEGMENT_SIZE):
+        if not 0 < segment_size <= MAX_SEGMENT_SIZE:
+            raise StreamError(f"Segment size must be 1 to {MAX_SEGMENT_SIZE} bytes")
+        self.segment_size = segment_size
+        ratchet_header, key = session.next_stream_key()
+        self.header = ratchet_header + STREAM_HEADER.pack(STREAM_VERSION, segment_size)
+        self._segments = _Segments(session, key, self.header)
+        self._buffer = bytearray()
+        self._header_sent = False
+
+    def _output(self, segments) -> bytes:
+        if not self._header_sent:
+            self._header_sent = True
+            segments.insert(0, self.header)
+        return b"".join(segments)
+
+    def update(self, data) -> bytes:
+        """Ciphertext of every complete segment so far (the first call also returns the header)"""
+        self._buffer += data
+        size, segments, offset = self.segment_size, [], 0
+        if len(self._buffer) > size:  # a full segment is only non-final if more data follows it
+            with memoryview(self._buffer) as view:
+                while len(self._buffer) - offset > size:
+                    segments.append(self._segments.seal(view[offset:offset + size], False))
+                    offset += size
+            del self._buffer[:offset]
+        return self._output(segments)
+
+    def finalize(self) -> bytes:
+        """Seal the remaining data as the final segment"""
+        final = self._segments.seal(bytes(self._buffer), True)
+        self._buffer.clear()
+        return self._output([final])
+
+
+class AttachmentDecryptor:
+    def __init__(self, session: DoubleRatchet, max_segment_size: int = MAX_SEGMENT_SIZE):
+        self.session = session
+        self.max_segment_size = max_segment_size
+        self.segment_size = None
+        self._header_size = session.suite.header_size + STREAM_HEADER.size
+        self._segments = None
+        self._buffer = bytearray()
+
+    def _read_header(self):
+        header = bytes(self._buffer[:self._header_size])
+        version, segment_size = STREAM_HEADER.unpack_from(header, self.session.suite.header_size)
+        if version != STREAM_VERSION:
+            raise StreamError(f"Unsupported attachment stream version {version}")
+        if not 0 < segment_size <= self.max_segment_size:
+            raise StreamError(f"Segment size {segment_size} out of range (max {self.max_segment_size})")
+        key, commit = self.session.stream_key(header[:self.session.suite.header_size])
+        self._segments = _Segments(self.session, key, header, commit)
+        self.segment_size = segment_size
+        del self._buffer[:self._header_size]
+
+    def update(self, data) -> bytes:
+        """Plaintext of every segment known not to be the final one"""
+        self._buffer += data
+        if self._segments is None:
+            if len(self._buffer) < self._header_size:
+                return b""
+            self._read_header()
+        size, plaintexts, offset = self.segment_size + TAG_SIZE, [], 0
+        if len(self._buffer) > size:
+            with memoryview(self._buffer) as view:
+                while len(self._buffer) - offset > size:
+                    plaintexts.append(self._segments.open(view[offset:offset + size], False))
+                    offset += size
+            del self._buffer[:offset]
+        return b"".join(plaintexts)
+
+    def finalize(self) -> bytes:
+        """Open the final segment; raises if the stream is truncated"""
+        if self._segments is None:
+            raise StreamError("Truncated attachment: incomplete header")
+        if len(self._buffer) < TAG_SIZE:
+            raise StreamError("Truncated attachment: no final segment")
+        plaintext = self._segments.open(bytes(self._buffer), True)
+        self._buffer.clear()
+        return plaintext
+
+
+def encrypt_file(session: DoubleRatchet, source: BinaryIO, destination: BinaryIO,
+                 segment_size: int = DEFAULT_SEGMENT_SIZE) -> int:
+    """Encrypt source into destination one segment at a time; returns the ciphertext size"""
+    encryptor, written = AttachmentEncryptor(session, segment_size), 0
+    while True:
+        chunk = source.read(segment_size)
+        if not chunk:
+            break
+        written += destination.write(encryptor.update(chunk))
+    return written + destination.write(encryptor.finalize())
+
+
+def decrypt_file(session: DoubleRatchet, source: BinaryIO, destination: BinaryIO,
+                 chunk_size: int = DEFAULT_SEGMENT_SIZE) -> int:
+    """
+    Decrypt source into destination; returns the plaintext size. If this
+    raises, destination holds a verified but incomplete prefix.
+    """
+    decryptor, written = AttachmentDecryptor(session), 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        written += destination.write(decryptor.update(chunk))
+    return written + destination.write(decryptor.finalize())
+
+
+if __name__ == "__main__":
+    import io
+    import os
+    import time
+    import tracemalloc
+    from ratchet_cipher_suites import preferred_suites
+
+    def session_pair(suites):
+        alice, bob = DoubleRatchet("Alice", suites=suites), DoubleRatchet("Bob", suites=suites)
+        bob.init_as_bob(alice.get_public_bundle(), alice.init_as_alice(bob.get_public_bundle()))
+        return alice, bob
+
+    # round trips at segment-size edges, interleaved with ordinary messages
+    for suites in (preferred_suites()[:1], preferred_suites()[-1:]):
+        alice, bob = session_pair(suites)
+        for size in (0, 1, 1000, 1024, 4096, 5000):
+            data = os.urandom(size)
+            sealed = io.BytesIO()
+            encrypt_file(alice, io.BytesIO(data), sealed, segment_size=1024)
+            assert bob.decrypt(alice.encrypt("between attachments")) == "between attachments"
+            opened = io.BytesIO()
+            assert decrypt_file(bob, io.BytesIO(sealed.getvalue()), opened, chunk_size=333) == size
+            assert opened.getvalue() == data
+        print(f"{suites[0].name:<32} round trips of 0 to 5000 bytes in 1 KiB segments OK")
+
+    # truncation at a segment boundary, reordered segments
+    alice, bob = session_pair(preferred_suites())
+    encryptor = AttachmentEncryptor(alice, segment_size=1024)
+    stream = encryptor.update(os.urandom(4096)) + encryptor.finalize()
+    header_size, segment = len(encryptor.header), 1024 + TAG_SIZE
+    body = stream[header_size:]
+    for name, forged in (("cut after 2 segments", stream[:header_size + 2 * segment]),
+                         ("segments 0 and 1 swapped", stream[:header_size] + body[segment:2 * segment]
+                          + body[:segment] + body[2 * segment:])):
+        restored = DoubleRatchet.from_bytes(bob.to_bytes())
+        decryptor = AttachmentDecryptor(restored)
+        try:
+            decryptor.update(forged)
+            decryptor.finalize()
+            raise AssertionError(f"{name} accepted")
+        except CryptoError as e:
+            print(f"Rejected, {name}: {e}")
+
+    # a forged header (random ratchet key, message #500) leaves the session as it was
+    state, suite = bob.to_bytes(), bob.suite
+    forged = suite.header(os.urandom(32), 500) + stream[suite.header_size:]
+    try:
+        AttachmentDecryptor(bob).update(forged)
+        raise AssertionError("forged header accepted")
+    except CryptoError as e:
+        assert bob.to_bytes() == state
+        print(f"Rejected, forged header: {e}; session unchanged")
+    decryptor = AttachmentDecryptor(bob)
+    assert len(decryptor.update(stream) + decryptor.finalize()) == 4096
+
+    # a 256 MiB attachment through encryptor -> decryptor: memory stays at a few segments
+    SIZE, CHUNK = 256 * 1024 * 1024, 1024 * 1024
+    chunk = os.urandom(CHUNK)
+    for suites in (preferred_suites()[:1], preferred_suites()[-1:]):
+        alice, bob = session_pair(suites)
+        tracemalloc.start()
+        start = time.perf_counter()
+        encryptor, decryptor, received = AttachmentEncryptor(alice), AttachmentDecryptor(bob), 0
+        for _ in range(SIZE // CHUNK):
+            received += len(decryptor.update(encryptor.update(chunk)))
+        received += len(decryptor.update(encryptor.finalize())) + len(decryptor.finalize())
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert received == SIZE
+        print(f"{suites[0].name:<32} 256 MiB streamed: {SIZE / elapsed / 1e6:7.1f} MB/s, "
+              f"peak traced memory {peak / 1024 / 1024:.1f} MiB")
+
+    # versus one encrypt_bytes() call on a 64 MiB attachment
+    alice, bob = session_pair(preferred_suites())
+    attachment = os.urandom(64 * 1024 * 1024)
+    tracemalloc.start()
+    assert len(bob.decrypt_bytes(alice.encrypt_bytes(attachment))) == len(attachment)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"encrypt_bytes/decrypt_bytes, 64 MiB in one message: peak traced memory {peak / 1024 / 1024:.1f} MiB")
+
+"""
+X25519_AES256GCM_SHA256          round trips of 0 to 5000 bytes in 1 KiB segments OK
+X25519_XSALSA20POLY1305_SHA256   round trips of 0 to 5000 bytes in 1 KiB segments OK
+Rejected, cut after 2 segments: Attachment final segment (truncated stream?) #1 failed verification
+Rejected, segments 0 and 1 swapped: Attachment segment #0 failed verification
+Rejected, forged header: Attachment segment #0 failed verification; session unchanged
+X25519_AES256GCM_SHA256          256 MiB streamed:   336.4 MB/s, peak traced memory 3.2 MiB
+X25519_XSALSA20POLY1305_SHA256   256 MiB streamed:   121.0 MB/s, peak traced memory 3.2 MiB
+encrypt_bytes/decrypt_bytes, 64 MiB in one message: peak traced memory 128.0 MiB
+"""
@@ -0,0 +1,287 @@
+#!pip install pynacl cryptography
+
+"""
+Load test and benchmark harness for DoubleRatchet.
+
+The test_* functions in double_ratchet_demo.py check correctness; this drives
+many session pairs at once and measures them, as a capacity-planning baseline
+and to compare optimisations (run it before and after, keep the --json output).
+
+A scenario sets:
+
+- sessions, messages    session pairs, and messages exchanged per pair
+- size                  plaintext bytes per message
+- alternation           probability that the next message goes the other way
+                        (a reply); replies are what trigger DH ratchets
+- reorder, window       probability that a message is held back, and for how
+                        many later messages of the same direction (1..window)
+- loss                  probability that a message is never delivered
+
+Pairs take turns one message at a time, so every session stays live during
+the run, as on a server. Reported per scenario:
+
+- messages/s            encrypt + delivery over the whole traffic phase
+- encrypt / decrypt     p50 and p99 latency (exact, from every sample)
+- memory per session    traced Python allocations of live sessions after the
+                        traffic (skipped keys included), from a separate run of
+                        --memory-sample pairs, and the DoubleRatchet.to_bytes() size
+- counters              the sessions' shared RatchetMetrics counters
+
+Note that this DoubleRatchet only ratchets its DH keys on Bob's first reply
+(a new sending key for Bob, a new receiving chain for Alice), so dh_ratchets
+is at most two per pair whatever the alternation rate.
+"""
+import gc
+import os
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from double_ratchet_demo import DoubleRatchet, RatchetMetrics, SkippedMessageError
+from ratchet_cipher_suites import SUITES
+
+SCENARIOS: Dict[str, Dict] = {
+    "in-order":    dict(size=256, alternation=0.0, reorder=0.0, loss=0.0),
+    "chat":        dict(size=256, alternation=0.5, reorder=0.0, loss=0.0),
+    "reordered":   dict(size=256, alternation=0.5, reorder=0.1, loss=0.0),
+    "lossy":       dict(size=256, alternation=0.5, reorder=0.1, loss=0.05),
+    "large":       dict(size=16 * 1024, alternation=0.5, reorder=0.0, loss=0.0),
+}
+
+
+def percentile(samples: List[int], fraction: float) -> float:
+    """Nearest-rank percentile of sorted nanosecond samples, in microseconds"""
+    if not samples:
+        return 0.0
+    return round(samples[min(int(fraction * len(samples)), len(samples) - 1)] / 1000, 1)
+
+
+class Pair:
+    """Two sessions and the messages in flight between them"""
+
+    def __init__(self, suite_id: int, metrics: RatchetMetrics, key_pool=None):
+        suites = [SUITES[suite_id]]
+        self.sides = (DoubleRatchet("Alice", metrics=metrics, key_pool=key_pool, suites=suites),
+                      DoubleRatchet("Bob", metrics=metrics, key_pool=key_pool, suites=suites))
+        alice, bob = self.sides
+        bob.init_as_bob(alice.get_public_bundle(), alice.init_as_alice(bob.get_public_bundle()))
+        self.sender = 0
+        self.sent = [0, 0]
+        # per direction: [due, sequence, message, plaintext] waiting for delivery
+        self.in_flight: Tuple[List[list], List[list]] = ([], [])
+
+
+class Benchmark:
+    def __init__(self, sessions: int = 1000, messages: int = 50, size: int = 256, alternation: float = 0.5,
+                 reorder: float = 0.0, window: int = 8, loss: float = 0.0, suite_id: int = 0,
+                 key_pool=None, seed: int = 1):
+        if not all(0.0 <= p <= 1.0 for p in (alternation, reorder, loss)):
+            raise ValueError("alternation, reorder and loss are probabilities")
+        self.sessions = sessions
+        self.messages = messages
+        self.size = size
+        self.alternation = alternation
+        self.reorder = reorder
+        self.window = window
+        self.loss = loss
+        self.suite_id = suite_id
+        self.key_pool = key_pool
+        self.seed = seed
+
+    def config(self) -> Dict:
+        return {"sessions": self.sessions, "messages": self.messages, "size": self.size,
+                "alternation": self.alternation, "reorder": self.reorder, "window": self.window,
+                "loss": self.loss, "suite": SUITES[self.suite_id].name, "key_pool": self.key_pool is not None}
+
+    # ==================== Traffic ====================
+
+    def _pairs(self, count: int, metrics: RatchetMetrics) -> List[Pair]:
+        return [Pair(self.suite_id, metrics, self.key_pool) for _ in range(count)]
+
+    def _drive(self, pairs: List[Pair], rng: random.Random, payloads: Sequence[bytes],
+               encrypt_ns: Optional[List[int]], decrypt_ns: Optional[List[int]]) -> Dict[str, int]:
+        """Send messages per pair, round-robin over pairs; latencies appended when lists are given"""
+        perf_ns = time.perf_counter_ns
+        outcome = {"sent": 0, "delivered": 0, "lost": 0, "failed": 0}
+
+        def deliver(receiver: DoubleRatchet, entry: list):
+            start = perf_ns()
+            try:
+                plaintext = receiver.decrypt_bytes(entry[2])
+            except SkippedMessageError:
+                outcome["failed"] += 1
+                return
+            if decrypt_ns is not None:
+                decrypt_ns.append(perf_ns() - start)
+            assert plaintext == entry[3], "decrypted the wrong plaintext"
+            outcome["delivered"] += 1
+
+        for _ in range(self.messages):
+            for pair in pairs:
+                if rng.random() < self.alternation:
+                    pair.sender ^= 1
+                direction = pair.sender
+                payload = payloads[rng.randrange(len(payloads))]
+                start = perf_ns()
+                message = pair.sides[direction].encrypt_bytes(payload)
+                if encrypt_ns is not None:
+                    encrypt_ns.append(perf_ns() - start)
+                outcome["sent"] += 1
+                sequence = pair.sent[direction] = pair.sent[direction] + 1
+
+                if rng.random() < self.loss:
+                    outcome["lost"] += 1
+                    continue
+                delay = rng.randint(1, self.window) if rng.random() < self.reorder else 0
+                in_flight = pair.in_flight[direction]
+                in_flight.append([sequence + delay, sequence, message, payload])
+                if delay == 0:
+                    in_flight.sort()
+                    while in_flight and in_flight[0][0] <= sequence:
+                        deliver(pair.sides[direction ^ 1], in_flight.pop(0))
+
+        # held messages still in flight at the end arrive late
+        for pair in pairs:
+            for direction in (0, 1):
+                for entry in sorted(pair.in_flight[direction]):
+                    deliver(pair.sides[direction ^ 1], entry)
+                pair.in_flight[direction].clear()
+        return outcome
+
+    # ==================== Measurements ====================
+
+    def run(self, memory_sample: int = 100) -> Dict:
+        rng = random.Random(self.seed)
+        payloads = [os.urandom(self.size) for _ in range(16)]
+        metrics = RatchetMetrics()
+
+        start = time.perf_counter()
+        pairs = self._pairs(self.sessions, metrics)
+        setup = time.perf_counter() - start
+
+        encrypt_ns: List[int] = []
+        decrypt_ns: List[int] = []
+        gc.collect()
+        start = time.perf_counter()
+        outcome = self._drive(pairs, rng, payloads, encrypt_ns, decrypt_ns)
+        elapsed = time.perf_counter() - start
+        encrypt_ns.sort()
+        decrypt_ns.sort()
+        state_sizes = [len(session.to_bytes()) for pair in pairs for session in pair.sides]
+        del pairs
+
+        report = {
+            "config": self.config(),
+            "setup_pairs_per_s": round(self.sessions / setup),
+            "messages_per_s": round(outcome["sent"] / elapsed),
+            "elapsed_s": round(elapsed, 3),
+            "messages": outcome,
+            "encrypt_us": {"p50": percentile(encrypt_ns, 0.50), "p99": percentile(encrypt_ns, 0.99)},
+            "decrypt_us": {"p50": percentile(decrypt_ns, 0.50), "p99": percentile(decrypt_ns, 0.99)},
+            "state_bytes_per_session": round(sum(state_sizes) / len(state_sizes)),
+            "counters": metrics.snapshot()["counters"],
+        }
+        if memory_sample:
+            report["memory_bytes_per_session"] = self.memory_per_session(min(memory_sample, self.sessions))
+        return report
+
+    def memory_per_session(self, count: int) -> int:
+        """Traced bytes held per live session after running the workload on count pairs"""
+        rng = random.Random(self.seed)
+        payloads = [os.urandom(self.size) for _ in range(16)]
+        gc.collect()
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            pairs = self._pairs(count, RatchetMetrics())
+            self._drive(pairs, rng, payloads, None, None)
+            gc.collect()
+            held = tracemalloc.get_traced_memory()[0] - baseline
+        finally:
+            tracemalloc.stop()
+        del pairs
+        return round(held / (2 * count))
+
+
+def print_report(name: str, report: Dict):
+    outcome, counters = report["messages"], report["counters"]
+    print(f"{name:<10} {report['messages_per_s']:>7} msg/s   "
+          f"encrypt p50/p99 {report['encrypt_us']['p50']:6.1f}/{report['encrypt_us']['p99']:6.1f} us   "
+          f"decrypt p50/p99 {report['decrypt_us']['p50']:6.1f}/{report['decrypt_us']['p99']:6.1f} us   "
+          f"{report.get('memory_bytes_per_session', 0):>5} B/session "
+          f"({report['state_bytes_per_session']} B stored)")
+    print(f"{'':<10} sent {outcome['sent']}, delivered {outcome['delivered']}, lost {outcome['lost']}, "
+          f"failed {outcome['failed']}; dh_ratchets {counters.get('dh_ratchets', 0)}, "
+          f"skipped keys stored/used {counters.get('skipped_keys_stored', 0)}/"
+          f"{counters.get('skipped_keys_used', 0)}")
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="built-in scenario to run (repeatable; default: all)")
+    parser.add_argument("--sessions", type=int, default=1000, help="session pairs (default 1000)")
+    parser.add_argument("--messages", type=int, default=50, help="messages per pair (default 50)")
+    parser.add_argument("--size", type=int, help="custom scenario: plaintext bytes")
+    parser.add_argument("--alternation", type=float, help="custom scenario: reply probability")
+    parser.add_argument("--reorder", type=float, help="custom scenario: hold-back probability")
+    parser.add_argument("--window", type=int, default=8, help="most later messages a held one waits for")
+    parser.add_argument("--loss", type=float, help="custom scenario: loss probability")
+    parser.add_argument("--suite", type=int, default=0, choices=sorted(SUITES), help="cipher suite id")
+    parser.add_argument("--key-pool", action="store_true", help="take key pairs from an X25519KeyPool")
+    parser.add_argument("--memory-sample", type=int, default=100, help="pairs traced for memory (0: skip)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", metavar="PATH", help="also write the reports as JSON ('-': stdout)")
+    args = parser.parse_args(argv)
+
+    custom = {name: getattr(args, name) for name in ("size", "alternation", "reorder", "loss")
+              if getattr(args, name) is not None}
+    if custom:
+        scenarios = {"custom": {**SCENARIOS["chat"], **custom}}
+    else:
+        scenarios = {name: SCENARIOS[name] for name in (args.scenario or SCENARIOS)}
+
+    key_pool = None
+    if args.key_pool:
+        from ratchet_keypool import X25519KeyPool
+        key_pool = X25519KeyPool()
+        key_pool.fill()
+
+    reports = {}
+    try:
+        for name, scenario in scenarios.items():
+            benchmark = Benchmark(args.sessions, args.messages, window=args.window, suite_id=args.suite,
+                                  key_pool=key_pool, seed=args.seed, **scenario)
+            reports[name] = benchmark.run(args.memory_sample)
+            if args.json != "-":
+                print_report(name, reports[name])
+    finally:
+        if key_pool is not None:
+            key_pool.close()
+
+    if args.json == "-":
+        print(json.dumps(reports, indent=2))
+    elif args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
+
+"""
+$ python ratchet_benchmark.py
+in-order     25687 msg/s   encrypt p50/p99   12.2/  40.6 us   decrypt p50/p99   15.2/  51.2 us    1952 B/session (267 B stored)
+           sent 50000, delivered 50000, lost 0, failed 0; dh_ratchets 0, skipped keys stored/used 0/0
+chat         24941 msg/s   encrypt p50/p99   12.3/ 106.6 us   decrypt p50/p99   15.5/  85.7 us    2216 B/session (315 B stored)
+           sent 50000, delivered 50000, lost 0, failed 0; dh_ratchets 2000, skipped keys stored/used 0/0
+reordered    22575 msg/s   encrypt p50/p99   12.9/ 106.2 us   decrypt p50/p99   18.8/  85.4 us    2418 B/session (315 B stored)
+           sent 50000, delivered 50000, lost 0, failed 0; dh_ratchets 2000, skipped keys stored/used 4118/4118
+lossy        18657 msg/s   encrypt p50/p99   18.5/ 146.5 us   decrypt p50/p99   26.1/ 128.5 us    2763 B/session (377 B stored)
+           sent 50000, delivered 47477, lost 2523, failed 0; dh_ratchets 2000, skipped keys stored/used 6254/3820
+large         9437 msg/s   encrypt p50/p99   44.3/ 189.1 us   decrypt p50/p99   49.5/ 151.2 us    2216 B/session (315 B stored)
+           sent 50000, delivered 50000, lost 0, failed 0; dh_ratchets 2000, skipped keys stored/used 0/0
+"""
@@ -0,0 +1,247 @@
+#!pip install pynacl cryptography
+
+"""
+Cipher suites for DoubleRatchet: message AEAD, root KDF and message header.
+
+The Go version has a CipherSuite interface (X25519_CHACHA20POLY1305_SHA256);
+this is the Python counterpart. Every suite keeps X25519 for the DH ratchet
+and HMAC-SHA256 for the chain KDF, and defines:
+
+- initial_root / kdf_root   X3DH root key and DH-ratchet root KDF
+- seal / open               message encryption, header bytes as associated data
+- header / parse_header     message header layout
+
+Suites:
+
+    id  name                                  header                          per message
+    0   X25519_XSALSA20POLY1305_SHA256        key (32), n (4)                 random nonce (24), tag (16)
+    1   X25519_CHACHA20POLY1305_SHA256        suite id (1), key (32), n (4)   tag (16)
+    2   X25519_AES256GCM_SHA256               suite id (1), key (32), n (4)   tag (16)
+
+Suite 0 is the original format (PyNaCl SecretBox, SHA-256/HMAC root KDF,
+header not authenticated). Suites 1 and 2 use the cryptography package
+(OpenSSL: AES-NI / vectorised ChaCha20, GIL released during the operation)
+and HKDF-SHA256 with the suite name in the info string, so both peers must
+agree on the suite to agree on any key. Every message key is used once, so
+the AEAD nonce is the message number (as in the Go version) and is not sent.
+
+Negotiation: get_public_bundle() lists the suite ids a party supports in
+preference order; both sides pick the initiator's first choice that the
+responder supports (a bundle without the list supports suite 0 only).
+preferred_suites() orders AES-256-GCM first on CPUs with AES instructions
+and ChaCha20-Poly1305 first elsewhere.
+"""
+import os
+import hmac
+import hashlib
+import platform
+from typing import Dict, List, Sequence, Tuple
+
+from nacl import bindings
+from nacl.exceptions import CryptoError
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+except ImportError:  # without the cryptography package only suite 0 is available
+    AESGCM = ChaCha20Poly1305 = None
+
+PUBLIC_KEY_SIZE = 32
+MSG_NUM_SIZE = 4
+
+
+class CipherSuite:
+    """Base class: a suite is stateless and shared by all sessions using it"""
+
+    suite_id: int
+    name: str
+    header_size: int
+    overhead: int  # bytes added to each plaintext after the header
+
+    def initial_root(self, shared_secret: bytes) -> bytes:
+        raise NotImplementedError
+
+    def kdf_root(self, root_key: bytes, dh_output: bytes) -> Tuple[bytes, bytes]:
+        """(new root key, new chain key)"""
+        raise NotImplementedError
+
+    def seal(self, message_key: bytes, msg_num: int, plaintext: bytes, header: bytes) -> bytes:
+        raise NotImplementedError
+
+    def open(self, message_key: bytes, msg_num: int, ciphertext, header) -> bytes:
+        """Plaintext; raises nacl.exceptions.CryptoError if authentication fails"""
+        raise NotImplementedError
+
+    def header(self, ratchet_public_key: bytes, msg_num: int) -> bytes:
+        raise NotImplementedError
+
+    def parse_header(self, message) -> Tuple[bytes, int]:
+        """(sender ratchet public key, message number)"""
+        raise NotImplementedError
+
+    def __repr__(self) -> str:
+        return self.name
+
+
+class XSalsa20Poly1305Suite(CipherSuite):
+    """The original format: SecretBox with a random nonce, header not authenticated"""
+
+    suite_id = 0
+    name = "X25519_XSALSA20POLY1305_SHA256"
+    header_size = PUBLIC_KEY_SIZE + MSG_NUM_SIZE
+    overhead = bindings.crypto_secretbox_NONCEBYTES + bindings.crypto_secretbox_MACBYTES
+
+    def initial_root(self, shared_secret: bytes) -> bytes:
+        return hashlib.sha256(b"RootKey_" + shared_secret).digest()
+
+    def kdf_root(self, root_key: bytes, dh_output: bytes) -> Tuple[bytes, bytes]:
+        prk = hmac.digest(root_key, dh_output, 'sha256')
+        return hmac.digest(prk, b"RootKey\x01", 'sha256'), hmac.digest(prk, b"ChainKey\x01", 'sha256')
+
+    def seal(self, message_key: bytes, msg_num: int, plaintext: bytes, header: bytes) -> bytes:
+        nonce = os.urandom(bindings.crypto_secretbox_NONCEBYTES)
+        return nonce + bindings.crypto_secretbox(plaintext, nonce, message_key)
+
+    def open(self, message_key: bytes, msg_num: int, ciphertext, header) -> bytes:
+        nonce_size = bindings.crypto_secretbox_NONCEBYTES
+        return bindings.crypto_secretbox_open(bytes(ciphertext[nonce_size:]), bytes(ciphertext[:nonce_size]),
+                                              message_key)
+
+    def header(self, ratchet_public_key: bytes, msg_num: int) -> bytes:
+        return ratchet_public_key + msg_num.to_bytes(MSG_NUM_SIZE, 'big')
+
+    def parse_header(self, message) -> Tuple[bytes, int]:
+        return bytes(message[:PUBLIC_KEY_SIZE]), int.from_bytes(message[PUBLIC_KEY_SIZE:self.header_size], 'big')
+
+
+class AeadSuite(CipherSuite):
+    """IETF AEAD (12-byte nonce) from the cryptography package, HKDF-SHA256 root KDF"""
+
+    header_size = 1 + PUBLIC_KEY_SIZE + MSG_NUM_SIZE
+    overhead = 16
+
+    def __init__(self, suite_id: int, name: str, aead_class):
+        self.suite_id = suite_id
+        self.name = name
+        self.aead_class = aead_class
+        self._info = name.encode()
+
+    def _hkdf(self, salt, secret: bytes, label: bytes, length: int) -> bytes:
+        return HKDF(hashes.SHA256(), length, salt, label + self._info).derive(secret)
+
+    def initial_root(self, shared_secret: bytes) -> bytes:
+        return self._hkdf(None, shared_secret, b"DoubleRatchet X3DH ", 32)
+
+    def kdf_root(self, root_key: bytes, dh_output: bytes) -> Tuple[bytes, bytes]:
+        okm = self._hkdf(root_key, dh_output, b"DoubleRatchet Root ", 64)
+        return okm[:32], okm[32:]
+
+    def seal(self, message_key: bytes, msg_num: int, plaintext: bytes, header: bytes) -> bytes:
+        return self.aead_class(message_key).encrypt(msg_num.to_bytes(12, 'big'), plaintext, header)
+
+    def open(self, message_key: bytes, msg_num: int, ciphertext, header) -> bytes:
+        try:
+            return self.aead_class(message_key).decrypt(msg_num.to_bytes(12, 'big'), ciphertext, header)
+        except InvalidTag:
+            raise CryptoError("Decryption failed. Ciphertext failed verification") from None
+
+    def header(self, ratchet_public_key: bytes, msg_num: int) -> bytes:
+        return bytes([self.suite_id]) + ratchet_public_key + msg_num.to_bytes(MSG_NUM_SIZE, 'big')
+
+    def parse_header(self, message) -> Tuple[bytes, int]:
+        if len(message) < self.header_size or message[0] != self.suite_id:
+            suite = message[0] if len(message) else None
+            raise ValueError(f"Message is not {self.name} (suite id {suite}, expected {self.suite_id})")
+        return (bytes(message[1:1 + PUBLIC_KEY_SIZE]),
+                int.from_bytes(message[1 + PUBLIC_KEY_SIZE:self.header_size], 'big'))
+
+
+XSALSA20_POLY1305 = XSalsa20Poly1305Suite()
+SUITES: Dict[int, CipherSuite] = {XSALSA20_POLY1305.suite_id: XSALSA20_POLY1305}
+if AESGCM is not None:
+    CHACHA20_POLY1305 = AeadSuite(1, "X25519_CHACHA20POLY1305_SHA256", ChaCha20Poly1305)
+    AES256_GCM = AeadSuite(2, "X25519_AES256GCM_SHA256", AESGCM)
+    SUITES.update({CHACHA20_POLY1305.suite_id: CHACHA20_POLY1305, AES256_GCM.suite_id: AES256_GCM})
+
+
+def has_aes_instructions() -> bool:
+    """AES-NI (x86) or ARMv8 AES extensions, from /proc/cpuinfo; False if unknown"""
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith(("flags", "Features")):
+                    return "aes" in line.split(":", 1)[1].split()
+    except OSError:
+        pass
+    return platform.system() == "Darwin" and platform.machine() == "arm64"  # Apple silicon
+
+
+def preferred_suites() -> List[CipherSuite]:
+    """Available suites, fastest AEAD for this CPU first, suite 0 last"""
+    if len(SUITES) == 1:
+        return [XSALSA20_POLY1305]
+    fast = [AES256_GCM, CHACHA20_POLY1305] if has_aes_instructions() else [CHACHA20_POLY1305, AES256_GCM]
+    return fast + [XSALSA20_POLY1305]
+
+
+def negotiate(initiator_suites: Sequence[int], responder_suites: Sequence[int]) -> CipherSuite:
+    """The initiator's first suite that the responder also supports"""
+    for suite_id in initiator_suites:
+        if suite_id in responder_suites and suite_id in SUITES:
+            return SUITES[suite_id]
+    raise ValueError(f"No common cipher suite ({list(initiator_suites)} / {list(responder_suites)})")
+
+
+if __name__ == "__main__":
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    print("AES instructions:", has_aes_instructions())
+    print("Preference order:", preferred_suites())
+
+    message_key, header = os.urandom(32), os.urandom(37)
+    for size, count in ((64, 100000), (65536, 4000)):
+        plaintext = os.urandom(size)
+        for suite in SUITES.values():
+            sealed = suite.seal(message_key, 7, plaintext, header)
+            assert suite.open(message_key, 7, sealed, header) == plaintext
+            start = time.perf_counter()
+            for _ in range(count):
+                suite.open(message_key, 7, suite.seal(message_key, 7, plaintext, header), header)
+            elapsed = time.perf_counter() - start
+            print(f"{size:>6} B  {suite.name:<32}{count * size * 2 / elapsed / 1e6:8.1f} MB/s "
+                  f"({elapsed / count * 1e6:.1f} us per seal+open)")
+
+    # Threads only help where the AEAD releases the GIL, and only with more than one core
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    if cpus < 2:
+        print(f"Thread scaling not measured: {cpus} CPU available")
+    else:
+        threads = min(4, cpus)
+        plaintext = os.urandom(65536)
+        for suite in SUITES.values():
+            def work(_):
+                for _ in range(500):
+                    suite.seal(message_key, 7, plaintext, header)
+            rates = []
+            for workers in (1, threads):
+                with ThreadPoolExecutor(workers) as pool:
+                    start = time.perf_counter()
+                    list(pool.map(work, range(workers)))
+                rates.append(workers * 500 * 65536 / (time.perf_counter() - start) / 1e6)
+            print(f"{threads} threads x 500 x 64 KiB  {suite.name:<32}{rates[1]:8.1f} MB/s "
+                  f"({rates[1] / rates[0]:.1f}x one thread, {cpus} CPUs)")
+
+"""
+AES instructions: True
+Preference order: [X25519_AES256GCM_SHA256, X25519_CHACHA20POLY1305_SHA256, X25519_XSALSA20POLY1305_SHA256]
+    64 B  X25519_XSALSA20POLY1305_SHA256      11.8 MB/s (10.9 us per seal+open)
+    64 B  X25519_CHACHA20POLY1305_SHA256      10.7 MB/s (11.9 us per seal+open)
+    64 B  X25519_AES256GCM_SHA256             15.3 MB/s (8.4 us per seal+open)
+ 65536 B  X25519_XSALSA20POLY1305_SHA256     418.4 MB/s (313.3 us per seal+open)
+ 65536 B  X25519_CHACHA20POLY1305_SHA256    1798.5 MB/s (72.9 us per seal+open)
+ 65536 B  X25519_AES256GCM_SHA256           4172.5 MB/s (31.4 us per seal+open)
+Thread scaling not measured: 1 CPU available
+"""
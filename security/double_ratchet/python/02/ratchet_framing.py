@@ -0,0 +1,238 @@
+#!pip install pynacl cryptography
+
+"""
+Length-prefixed, versioned frames for DoubleRatchet messages on byte streams.
+
+DoubleRatchet.encrypt() output has no length or version, so it cannot be
+sent on a stream as is. A frame wraps one message (big-endian):
+
+    offset  size  field
+    0       1     frame version (1)
+    1       1     flags (bit 0: encrypted header)
+    2       4     body length L
+    6       L     body: suite header | ciphertext
+                  or, with an encrypted header:
+                  SecretBox(header_key, suite header) (nonce 24 + header + tag 16) | ciphertext
+
+An encrypted header hides the sender's ratchet key and message number from
+the network. It is sealed with the session's static header_key (derived at
+X3DH), so unlike message keys it has no forward secrecy.
+
+FrameDecoder parses frames out of one reusable receive buffer: the caller
+reads into get_buffer() (socket.recv_into, or asyncio.BufferedProtocol, whose
+get_buffer / buffer_updated methods it mirrors) and frames() yields
+memoryviews of complete frame bodies. Frame bodies are not copied: the
+header and ciphertext views go straight to DoubleRatchet.decrypt_parts and
+the AEAD suites read them in place (suite 0 still copies inside PyNaCl).
+Yielded views are only valid until the next get_buffer() call, which moves
+a partial frame at the end of the buffer to its start.
+"""
+import struct
+import asyncio
+from typing import Callable, Iterator, Optional, Tuple
+
+from nacl.secret import SecretBox
+
+from double_ratchet_demo import DoubleRatchet
+
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct(">BBI")
+FLAG_ENCRYPTED_HEADER = 0x01
+SEALED_HEADER_OVERHEAD = SecretBox.NONCE_SIZE + SecretBox.MACBYTES
+DEFAULT_BUFFER_SIZE = 256 * 1024
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+class FrameError(ValueError):
+    """Malformed or oversized frame; the stream cannot be resynchronised"""
+
+
+def encode_frame(session: DoubleRatchet, plaintext: bytes, encrypt_header: bool = False) -> bytes:
+    """Encrypt plaintext with the session and wrap it in a frame"""
+    message = session.encrypt_bytes(plaintext)
+    flags = 0
+    if encrypt_header:
+        header_size = session.suite.header_size
+        message = SecretBox(session.header_key).encrypt(message[:header_size]) + message[header_size:]
+        flags |= FLAG_ENCRYPTED_HEADER
+    return FRAME_HEADER.pack(FRAME_VERSION, flags, len(message)) + message
+
+
+def split_frame(session: DoubleRatchet, flags: int, body: memoryview) -> Tuple[bytes, memoryview]:
+    """(suite header, ciphertext view) of a frame body, opening an encrypted header"""
+    header_size = session.suite.header_size
+    if flags & FLAG_ENCRYPTED_HEADER:
+        sealed_size = header_size + SEALED_HEADER_OVERHEAD
+        header = SecretBox(session.header_key).decrypt(bytes(body[:sealed_size]))
+        return header, body[sealed_size:]
+    return body[:header_size], body[header_size:]
+
+
+def decode_frame(session: DoubleRatchet, flags: int, body: memoryview) -> bytes:
+    """Decrypt one frame body yielded by FrameDecoder.frames()"""
+    return session.decrypt_parts(*split_frame(session, flags, body))
+
+
+class FrameDecoder:
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER_SIZE, max_frame_size: int = MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # first unparsed byte
+        self._end = 0    # end of received data
+
+    # ==================== Receiving ====================
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        """Free space to read into; moves a partial frame to the front or grows the buffer"""
+        if self._start:
+            pending = self._end - self._start
+            self._view[:pending] = self._view[self._start:self._end]
+            self._start, self._end = 0, pending
+        wanted = max(sizehint, self._frame_size() - self._end, 1)
+        if len(self._buffer) - self._end < wanted:
+            self._grow(self._end + wanted)
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes: int):
+        """nbytes were written to the start of the last get_buffer() view"""
+        self._end += nbytes
+
+    def _grow(self, size: int):
+        """Swap in a larger buffer (the old one may still be exported to yielded views)"""
+        buffer = bytearray(size)
+        buffer[:self._end] = self._view[:self._end]
+        self._buffer, self._view = buffer, memoryview(buffer)
+
+    def _frame_size(self) -> int:
+        """Size of the pending frame if its header has arrived, else 0"""
+        if self._end - self._start < FRAME_HEADER.size:
+            return 0
+        length = FRAME_HEADER.unpack_from(self._buffer, self._start)[2]
+        if length > self.max_frame_size:
+            raise FrameError(f"Frame of {length} bytes exceeds {self.max_frame_size}")
+        return FRAME_HEADER.size + length
+
+    # ==================== Parsing ====================
+
+    def frames(self) -> Iterator[Tuple[int, memoryview]]:
+        """(flags, body view) of every complete frame received so far"""
+        while self._end - self._start >= FRAME_HEADER.size:
+            version, flags, length = FRAME_HEADER.unpack_from(self._buffer, self._start)
+            if version != FRAME_VERSION:
+                raise FrameError(f"Unsupported frame version {version}")
+            if length > self.max_frame_size:
+                raise FrameError(f"Frame of {length} bytes exceeds {self.max_frame_size}")
+            body_start = self._start + FRAME_HEADER.size
+            if self._end - body_start < length:
+                return
+            self._start = body_start + length
+            yield flags, self._view[body_start:self._start]
+
+    def pending(self) -> int:
+        """Bytes received but not yet returned as frames"""
+        return self._end - self._start
+
+
+class FrameProtocol(asyncio.BufferedProtocol):
+    """asyncio protocol that decrypts every frame and passes the plaintext to on_message"""
+
+    def __init__(self, session: DoubleRatchet, on_message: Callable[[bytes], None],
+                 decoder: Optional[FrameDecoder] = None):
+        self.session = session
+        self.on_message = on_message
+        self.decoder = decoder or FrameDecoder()
+        self.transport: Optional[asyncio.BaseTransport] = None
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        self.transport = transport
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        try:
+            return self.decoder.get_buffer(sizehint)
+        except FrameError as e:  # asyncio closes the transport on any get_buffer error
+            if not self.closed.done():
+                self.closed.set_exception(e)
+            raise
+
+    def buffer_updated(self, nbytes: int):
+        self.decoder.buffer_updated(nbytes)
+        try:
+            for flags, body in self.decoder.frames():
+                self.on_message(decode_frame(self.session, flags, body))
+        except Exception as e:
+            self.transport.close()
+            if not self.closed.done():
+                self.closed.set_exception(e)
+
+    def connection_lost(self, exc: Optional[Exception]):
+        if not self.closed.done():
+            self.closed.set_result(self.decoder.pending())
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    import random
+    import socket
+    import tracemalloc
+    from ratchet_cipher_suites import preferred_suites
+
+    COUNT, SIZE = 5000, 1024
+
+    def session_pair(suites) -> Tuple[DoubleRatchet, DoubleRatchet]:
+        alice, bob = DoubleRatchet("Alice", suites=suites), DoubleRatchet("Bob", suites=suites)
+        bob.init_as_bob(alice.get_public_bundle(), alice.init_as_alice(bob.get_public_bundle()))
+        return alice, bob
+
+    for suites in (preferred_suites()[:1], preferred_suites()[-1:]):
+        for encrypt_header in (False, True):
+            alice, bob = session_pair(suites)
+            payloads = [os.urandom(SIZE) for _ in range(COUNT)]
+            stream = memoryview(b"".join(encode_frame(alice, payload, encrypt_header) for payload in payloads))
+
+            # feed the stream in random-sized reads, as a socket would deliver it
+            decoder, position, received = FrameDecoder(), 0, 0
+            tracemalloc.start()
+            start = time.perf_counter()
+            while position < len(stream):
+                buffer = decoder.get_buffer()
+                nbytes = min(len(buffer), random.randint(1, 64 * 1024), len(stream) - position)
+                buffer[:nbytes] = stream[position:position + nbytes]
+                decoder.buffer_updated(nbytes)
+                position += nbytes
+                for flags, body in decoder.frames():
+                    assert decode_frame(bob, flags, body) == payloads[received]
+                    received += 1
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            assert received == COUNT and decoder.pending() == 0
+            print(f"{suites[0].name:<32} encrypted header {str(encrypt_header):<5} "
+                  f"{COUNT / elapsed:8.0f} frames/s, peak traced memory {peak / 1024:.0f} KiB")
+
+    async def over_socket():
+        alice, bob = session_pair(preferred_suites())
+        received = []
+        loop = asyncio.get_running_loop()
+        reader_side, writer_side = socket.socketpair()
+        writer_side.setblocking(False)
+        transport, protocol = await loop.connect_accepted_socket(
+            lambda: FrameProtocol(bob, received.append), reader_side)
+        for i in range(1000):
+            await loop.sock_sendall(writer_side, encode_frame(alice, f"message {i}".encode(), i % 2 == 1))
+        writer_side.close()
+        pending = await protocol.closed
+        assert received == [f"message {i}".encode() for i in range(1000)]
+        print(f"FrameProtocol over a socket: {len(received)} messages, {pending} bytes left over")
+
+    asyncio.run(over_socket())
+
+"""
+X25519_AES256GCM_SHA256          encrypted header False    15933 frames/s, peak traced memory 3 KiB
+X25519_AES256GCM_SHA256          encrypted header True     12493 frames/s, peak traced memory 3 KiB
+X25519_XSALSA20POLY1305_SHA256   encrypted header False    13101 frames/s, peak traced memory 5 KiB
+X25519_XSALSA20POLY1305_SHA256   encrypted header True      8248 frames/s, peak traced memory 5 KiB
+FrameProtocol over a socket: 1000 messages, 0 bytes left over
+"""
@@ -0,0 +1,154 @@
+#!pip install pynacl
+
+"""
+Pool of pre-generated X25519 key pairs, refilled by a background thread.
+
+PrivateKey.generate() reads 32 random bytes and computes the public key with
+a base-point scalar multiplication. DoubleRatchet needs a fresh key pair in
+init_as_alice and whenever it starts a new sending chain (Bob's first send),
+so without a pool that work sits on the message-latency path. With one, those
+steps only pay for the scalar multiplication of the shared secret.
+
+- take() pops a ready key pair (collections.deque: thread-safe, no lock);
+  when the pool has dropped to low_water it wakes the refill thread, which
+  tops it up to size
+- an empty pool never blocks: take() generates a key inline and counts a miss
+- PyNaCl releases the GIL inside libsodium, so refilling overlaps with the
+  caller's own work
+- each key pair is handed out once and never returned to the pool
+
+DoubleRatchet(key_pool=...) accepts any object with a take() method.
+"""
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+from nacl.public import PrivateKey
+
+DEFAULT_POOL_SIZE = 256
+DEFAULT_LOW_WATER = 64
+
+
+class X25519KeyPool:
+    def __init__(self, size: int = DEFAULT_POOL_SIZE, low_water: int = DEFAULT_LOW_WATER,
+                 start: bool = True):
+        if not 0 <= low_water < size:
+            raise ValueError("low_water must be at least 0 and below size")
+        self.size = size
+        self.low_water = low_water
+        self.hits = self.misses = self.refills = 0
+        self._keys: "deque[PrivateKey]" = deque()
+        self._wanted = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        if start:
+            self.start()
+
+    # ==================== Refill thread ====================
+
+    def _refill_forever(self):
+        while True:
+            self._wanted.wait()
+            self._wanted.clear()
+            if self._closed:
+                return
+            self.refills += 1
+            while len(self._keys) < self.size and not self._closed:
+                self._keys.append(PrivateKey.generate())
+
+    def start(self):
+        """Start the refill thread and fill the pool in the background"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refill_forever, name="x25519-keypool", daemon=True)
+            self._thread.start()
+            self._wanted.set()
+
+    def fill(self):
+        """Fill the pool to size on the calling thread (e.g. at startup, before traffic)"""
+        while len(self._keys) < self.size:
+            self._keys.append(PrivateKey.generate())
+
+    def close(self):
+        """Stop the refill thread and drop the unused keys"""
+        self._closed = True
+        self._wanted.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._keys.clear()
+
+    def __enter__(self) -> "X25519KeyPool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # ==================== Keys ====================
+
+    def take(self) -> PrivateKey:
+        """A fresh key pair; generated inline if the pool is empty"""
+        try:
+            key = self._keys.popleft()
+            self.hits += 1
+        except IndexError:
+            key = PrivateKey.generate()
+            self.misses += 1
+        if len(self._keys) <= self.low_water and not self._closed:
+            self._wanted.set()
+        return key
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def stats(self) -> Dict[str, int]:
+        return {"available": len(self._keys), "hits": self.hits, "misses": self.misses,
+                "refills": self.refills}
+
+
+if __name__ == "__main__":
+    import time
+    from double_ratchet_demo import DoubleRatchet
+
+    SESSIONS = 2000
+
+    def key_generating_steps(key_pool=None):
+        """
+        Average latency (us) of init_as_alice and of Bob's first send: the two
+        steps on the message path that need a fresh key pair.
+        """
+        init = first_send = 0.0
+        for i in range(SESSIONS):
+            alice = DoubleRatchet("Alice", key_pool=key_pool)
+            bob = DoubleRatchet("Bob", key_pool=key_pool)
+            bob_bundle = bob.get_public_bundle()
+            start = time.perf_counter()
+            alice_ephemeral = alice.init_as_alice(bob_bundle)
+            init += time.perf_counter() - start
+            bob.init_as_bob(alice.get_public_bundle(), alice_ephemeral)
+            bob.decrypt(alice.encrypt(f"hello {i}"))
+            start = time.perf_counter()
+            reply = bob.encrypt(f"reply {i}")
+            first_send += time.perf_counter() - start
+            alice.decrypt(reply)
+            time.sleep(0.0005)  # idle time between sessions, when the pool refills
+        return init / SESSIONS * 1e6, first_send / SESSIONS * 1e6
+
+    print("init_as_alice / Bob's first send, no pool:   %.1f us / %.1f us" % key_generating_steps())
+    with X25519KeyPool(size=256, low_water=64) as pool:
+        pool.fill()
+        print("init_as_alice / Bob's first send, with pool: %.1f us / %.1f us" % key_generating_steps(pool))
+        print("Pool:", pool.stats())
+
+    # a burst larger than the pool: take() never blocks, it falls back to inline generation
+    with X25519KeyPool(size=32, low_water=8) as pool:
+        pool.fill()
+        for _ in range(1000):
+            pool.take()
+        print("Burst of 1000 takes from a pool of 32:", pool.stats())
+
+"""
+init_as_alice / Bob's first send, no pool:   396.6 us / 175.4 us
+init_as_alice / Bob's first send, with pool: 350.6 us / 147.8 us
+Pool: {'available': 128, 'hits': 8000, 'misses': 0, 'refills': 38}
+Burst of 1000 takes from a pool of 32: {'available': 25, 'hits': 515, 'misses': 485, 'refills': 17}
+"""
@@ -0,0 +1,475 @@
+#!pip install pynacl
+
+"""
+Local X3DH prekey server: signed prekeys and bulk one-time prekeys in SQLite.
+
+get_public_bundle() hands every initiator the same long-lived 'ephemeral'
+key. Here each identity publishes a signed prekey (the bundle's 'ephemeral',
+signed with an Ed25519 key) and uploads one-time prekeys in bulk; every claim
+returns the bundle plus one one-time prekey, which DoubleRatchet uses for a
+fourth DH and which no other initiator ever gets. Setting up a session with a
+new peer is one round trip (POST .../claim), then Alice's first message.
+
+- store: SQLite in WAL mode, one connection per server thread; one-time
+  prekeys in a WITHOUT ROWID table keyed by (user, key id)
+- bulk upload: thousands of keys in one request and one transaction
+  (executemany); the body is binary, key id (4) | public key (32) per key
+- exactly once: a claim is a single DELETE ... RETURNING of the user's lowest
+  key id inside BEGIN IMMEDIATE, so concurrent claims (threads or processes
+  sharing the database file) never get the same key
+- when a user's one-time prekeys run out, claims return the bundle without
+  one (X3DH with three DHs) until the owner uploads more; /count tells the
+  owner when to
+
+HTTP API (ThreadingHTTPServer, keep-alive), JSON with base64 keys:
+
+    PUT  /v1/prekeys/<user>            publish identity, signing key, signed prekey
+    POST /v1/prekeys/<user>/one-time   bulk upload (binary body)
+    POST /v1/prekeys/<user>/claim      bundle + one one-time prekey
+    GET  /v1/prekeys/<user>/count      one-time prekeys left
+
+There is no authentication of uploads: this is a local stand-in for a real
+service, not one. The signed prekey signature only shows that the prekey
+belongs to the signing key in the same bundle, so a server (or anyone who
+re-publishes a user) can swap the whole bundle. Clients that know the peer's
+identity and signing keys out of band (e.g. from a verified safety number)
+pass them to PrekeyClient.claim, which rejects any other bundle.
+"""
+import json
+import base64
+import struct
+import sqlite3
+import threading
+import http.client
+from urllib.parse import quote, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from nacl.public import PrivateKey
+from nacl.signing import SigningKey, VerifyKey
+from nacl.exceptions import BadSignatureError, CryptoError
+
+from double_ratchet_demo import DoubleRatchet
+
+ONE_TIME_RECORD = struct.Struct(">I32s")
+MAX_ONE_TIME_PREKEYS = 100_000  # per user
+MAX_UPLOAD = 10_000             # keys per bulk upload
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS identities (
+    user             TEXT PRIMARY KEY,
+    identity         BLOB NOT NULL,
+    signing          BLOB NOT NULL,
+    signed_prekey_id INTEGER NOT NULL,
+    signed_prekey    BLOB NOT NULL,
+    signature        BLOB NOT NULL,
+    suites           BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS one_time_prekeys (
+    user    TEXT NOT NULL,
+    key_id  INTEGER NOT NULL,
+    public  BLOB NOT NULL,
+    PRIMARY KEY (user, key_id)
+) WITHOUT ROWID;
+"""
+
+BUNDLE_KEYS = ("identity", "signing", "signed_prekey", "signature")
+
+
+class PrekeyError(ValueError):
+    """Unknown user, bad signature or malformed prekey data"""
+
+
+def _verify_signed_prekey(bundle: dict):
+    try:
+        VerifyKey(bundle['signing']).verify(bundle['signed_prekey'], bundle['signature'])
+    except (BadSignatureError, ValueError, TypeError):
+        raise PrekeyError("Bad signed prekey signature") from None
+
+
+class PrekeyStore:
+    """SQLite prekey store, safe to share between threads"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # autocommit mode: transactions are explicit BEGIN IMMEDIATE / COMMIT
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self, work):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(connection)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return result
+
+    # ==================== Owner ====================
+
+    def publish(self, user: str, identity: bytes, signing: bytes, signed_prekey_id: int,
+                signed_prekey: bytes, signature: bytes, suites: Sequence[int] = (0,)):
+        """Create or update a user's identity and signed prekey"""
+        _verify_signed_prekey({'signing': signing, 'signed_prekey': signed_prekey, 'signature': signature})
+        self._connection().execute(
+            "INSERT OR REPLACE INTO identities VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user, identity, signing, signed_prekey_id, signed_prekey, signature, bytes(suites)))
+
+    def upload_one_time(self, user: str, keys: Sequence[Tuple[int, bytes]]) -> int:
+        """Add (key id, public key) pairs in one transaction; returns the number left"""
+        if len(keys) > MAX_UPLOAD:
+            raise PrekeyError(f"At most {MAX_UPLOAD} one-time prekeys per upload")
+
+        def upload(connection: sqlite3.Connection) -> int:
+            if connection.execute("SELECT 1 FROM identities WHERE user = ?", (user,)).fetchone() is None:
+                raise PrekeyError(f"Unknown user {user!r}")
+            connection.executemany("INSERT INTO one_time_prekeys VALUES (?, ?, ?)",
+                                   ((user, key_id, public) for key_id, public in keys))
+            count = self._count(connection, user)
+            if count > MAX_ONE_TIME_PREKEYS:
+                raise PrekeyError(f"At most {MAX_ONE_TIME_PREKEYS} one-time prekeys per user")
+            return count
+
+        try:
+            return self._transaction(upload)
+        except sqlite3.IntegrityError:
+            raise PrekeyError("Duplicate one-time prekey id") from None
+
+    @staticmethod
+    def _count(connection: sqlite3.Connection, user: str) -> int:
+        return connection.execute("SELECT count(*) FROM one_time_prekeys WHERE user = ?", (user,)).fetchone()[0]
+
+    def count(self, user: str) -> int:
+        return self._count(self._connection(), user)
+
+    # ==================== Initiators ====================
+
+    def claim(self, user: str) -> dict:
+        """The user's bundle with one one-time prekey, removed from the store (none left: without)"""
+        def claim(connection: sqlite3.Connection):
+            identity = connection.execute(
+                "SELECT identity, signing, signed_prekey_id, signed_prekey, signature, suites "
+                "FROM identities WHERE user = ?", (user,)).fetchone()
+            if identity is None:
+                raise PrekeyError(f"Unknown user {user!r}")
+            one_time = connection.execute(
+                "DELETE FROM one_time_prekeys WHERE user = ? AND key_id = "
+                "(SELECT key_id FROM one_time_prekeys WHERE user = ? ORDER BY key_id LIMIT 1) "
+                "RETURNING key_id, public", (user, user)).fetchall()
+            return identity, one_time
+
+        (identity, signing, signed_prekey_id, signed_prekey, signature, suites), one_time = \
+            self._transaction(claim)
+        bundle = {'identity': identity, 'signing': signing, 'signed_prekey_id': signed_prekey_id,
+                  'signed_prekey': signed_prekey, 'signature': signature, 'suites': list(suites),
+                  'one_time_id': None, 'one_time': None}
+        if one_time:
+            bundle['one_time_id'], bundle['one_time'] = one_time[0]
+        return bundle
+
+
+# ==================== HTTP ====================
+
+def _encode(bundle: dict) -> bytes:
+    return json.dumps({name: base64.b64encode(value).decode() if isinstance(value, bytes) else value
+                       for name, value in bundle.items()}).encode()
+
+
+def _decode(body: bytes, binary: Sequence[str]) -> dict:
+    data = json.loads(body)
+    for name in binary:
+        if data.get(name) is not None:
+            data[name] = base64.b64decode(data[name])
+    return data
+
+
+class PrekeyRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: one connection per client
+    # headers and body leave in one segment: no Nagle / delayed-ACK stall per request
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def _route(self) -> Tuple[str, str]:
+        parts = self.path.split("/")
+        if len(parts) not in (4, 5) or parts[:3] != ["", "v1", "prekeys"] or not parts[3]:
+            return "", ""
+        return unquote(parts[3]), parts[4] if len(parts) == 5 else ""
+
+    def _reply(self, status: int, body: bytes = b"", content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method: str):
+        user, action = self._route()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        store: PrekeyStore = self.server.store
+        try:
+            if not user:
+                return self._reply(404, b'{"error": "not found"}')
+            if method == "PUT" and action == "":
+                data = _decode(body, BUNDLE_KEYS)
+                store.publish(user, data["identity"], data["signing"], data["signed_prekey_id"],
+                              data["signed_prekey"], data["signature"], data.get("suites", [0]))
+                return self._reply(204)
+            if method == "POST" and action == "one-time":
+                if len(body) % ONE_TIME_RECORD.size:
+                    raise PrekeyError("Body is not a whole number of one-time prekey records")
+                left = store.upload_one_time(user, list(ONE_TIME_RECORD.iter_unpack(body)))
+                return self._reply(200, json.dumps({"one_time": left}).encode())
+            if method == "POST" and action == "claim":
+                return self._reply(200, _encode(store.claim(user)))
+            if method == "GET" and action == "count":
+                return self._reply(200, json.dumps({"one_time": store.count(user)}).encode())
+            self._reply(404, b'{"error": "not found"}')
+        except PrekeyError as e:
+            status = 404 if str(e).startswith("Unknown user") else 400
+            self._reply(status, json.dumps({"error": str(e)}).encode())
+        except (KeyError, ValueError, TypeError) as e:
+            self._reply(400, json.dumps({"error": f"Malformed request: {e}"}).encode())
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def log_message(self, format, *args):
+        pass  # one line per request on stderr is too slow under load
+
+
+def make_server(store: PrekeyStore, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """HTTP server for store; call serve_forever() (port 0: any free port, see server_address)"""
+    server = ThreadingHTTPServer((host, port), PrekeyRequestHandler)
+    server.daemon_threads = True
+    server.store = store
+    return server
+
+
+class PrekeyClient:
+    """One keep-alive connection to the server; use one client per thread"""
+
+    def __init__(self, host: str, port: int):
+        self._connection = http.client.HTTPConnection(host, port)
+
+    def _request(self, method: str, path: str, body: bytes = b"") -> bytes:
+        self._connection.request(method, "/v1/prekeys/" + path, body)
+        response = self._connection.getresponse()
+        data = response.read()
+        if response.status >= 400:
+            raise PrekeyError(json.loads(data)["error"])
+        return data
+
+    def publish(self, user: str, owner: "PrekeyOwner"):
+        self._request("PUT", quote(user, safe=""), _encode(owner.publication()))
+
+    def upload_one_time(self, user: str, keys: Sequence[Tuple[int, bytes]]) -> int:
+        """Bulk upload; returns the number of one-time prekeys the server now holds"""
+        body = b"".join(ONE_TIME_RECORD.pack(key_id, public) for key_id, public in keys)
+        return json.loads(self._request("POST", quote(user, safe="") + "/one-time", body))["one_time"]
+
+    def count(self, user: str) -> int:
+        return json.loads(self._request("GET", quote(user, safe="") + "/count"))["one_time"]
+
+    def claim(self, user: str, identity: Optional[bytes] = None, signing: Optional[bytes] = None) -> dict:
+        """
+        A verified bundle for DoubleRatchet.init_as_alice ('ephemeral' is the
+        signed prekey). identity and signing pin the user's public keys, known
+        out of band; without them the bundle is only self-consistent
+        """
+        bundle = _decode(self._request("POST", quote(user, safe="") + "/claim"),
+                         BUNDLE_KEYS + ("one_time",))
+        for name, pinned in (('identity', identity), ('signing', signing)):
+            if pinned is not None and bundle[name] != pinned:
+                raise PrekeyError(f"{name.capitalize()} key of {user!r} does not match the pinned key")
+        _verify_signed_prekey(bundle)
+        bundle['ephemeral'] = bundle['signed_prekey']
+        return bundle
+
+    def close(self):
+        self._connection.close()
+
+
+# ==================== Key owner ====================
+
+class PrekeyOwner:
+    """
+    The responder's side: identity and signing keys, signed prekeys and the
+    private halves of uploaded one-time prekeys (each used once, then dropped).
+    """
+
+    def __init__(self, identity_key: Optional[PrivateKey] = None, signing_key: Optional[SigningKey] = None,
+                 suites: Sequence[int] = (0,)):
+        self.identity_key = identity_key or PrivateKey.generate()
+        self.signing_key = signing_key or SigningKey.generate()
+        self.suites = list(suites)
+        self.signed_prekeys: Dict[int, PrivateKey] = {}
+        self.signed_prekey_id = 0
+        self.one_time_keys: Dict[int, PrivateKey] = {}
+        self._next_one_time_id = 1
+        self.rotate_signed_prekey()
+
+    def rotate_signed_prekey(self):
+        """New signed prekey; older ones stay usable for initiators that fetched them (publish again)"""
+        self.signed_prekey_id += 1
+        self.signed_prekeys[self.signed_prekey_id] = PrivateKey.generate()
+
+    def publication(self) -> dict:
+        signed_prekey = self.signed_prekeys[self.signed_prekey_id].public_key.encode()
+        return {'identity': self.identity_key.public_key.encode(), 'signing': self.signing_key.verify_key.encode(),
+                'signed_prekey_id': self.signed_prekey_id, 'signed_prekey': signed_prekey,
+                'signature': self.signing_key.sign(signed_prekey).signature, 'suites': self.suites}
+
+    def generate_one_time(self, count: int) -> List[Tuple[int, bytes]]:
+        """count new one-time prekeys, as (key id, public key) for upload"""
+        keys = []
+        for key_id in range(self._next_one_time_id, self._next_one_time_id + count):
+            self.one_time_keys[key_id] = private = PrivateKey.generate()
+            keys.append((key_id, private.public_key.encode()))
+        self._next_one_time_id += count
+        return keys
+
+    def respond(self, name: str, alice_bundle: dict, alice_ephemeral: bytes, signed_prekey_id: int,
+                one_time_id: Optional[int], first_message: bytes, **kwargs) -> Tuple[DoubleRatchet, bytes]:
+        """
+        Bob's session for an initiator who claimed our bundle, and the
+        plaintext of Alice's first message (the ids come with it). A one-time
+        prekey works once only: it is dropped once the first message has
+        decrypted, so a forged one (CryptoError) leaves it usable.
+        """
+        if signed_prekey_id not in self.signed_prekeys:
+            raise PrekeyError(f"Unknown signed prekey {signed_prekey_id}")
+        one_time_key = None
+        if one_time_id is not None:
+            one_time_key = self.one_time_keys.get(one_time_id)
+            if one_time_key is None:
+                raise PrekeyError(f"One-time prekey {one_time_id} unknown or already used")
+        session = DoubleRatchet(name, identity_key=self.identity_key,
+                                ephemeral_key=self.signed_prekeys[signed_prekey_id], **kwargs)
+        session.init_as_bob(alice_bundle, alice_ephemeral, one_time_key)
+        plaintext = session.decrypt_bytes(first_message)
+        if one_time_id is not None and self.one_time_keys.pop(one_time_id, None) is None:
+            # a concurrent respond() for the same first message got there first
+            raise PrekeyError(f"One-time prekey {one_time_id} unknown or already used")
+        return session, plaintext
+
+if __name__ == "__main__":
+    import os
+    import time
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+
+    ONE_TIME, CLIENTS, CLAIMS_PER_CLIENT = 5000, 16, 400
+
+    store = PrekeyStore(os.path.join(tempfile.mkdtemp(), "prekeys.db"))
+    server = make_server(store)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+
+    bob = PrekeyOwner()
+    client = PrekeyClient(host, port)
+    client.publish("bob", bob)
+    start = time.perf_counter()
+    keys = bob.generate_one_time(ONE_TIME)
+    generated = time.perf_counter() - start
+    start = time.perf_counter()
+    assert client.upload_one_time("bob", keys) == ONE_TIME
+    print(f"Generated {ONE_TIME} one-time prekeys in {generated * 1000:.0f} ms, "
+          f"uploaded in one request ({len(keys) * ONE_TIME_RECORD.size} bytes) in "
+          f"{(time.perf_counter() - start) * 1000:.0f} ms")
+
+    # Bob's public keys as initiators would know them out of band
+    pinned = {'identity': bob.identity_key.public_key.encode(), 'signing': bob.signing_key.verify_key.encode()}
+
+    def initiator(worker: int):
+        """Claim bundles for many new peers: one round trip each, then the first message"""
+        own_client, first_messages, latencies = PrekeyClient(host, port), [], []
+        for i in range(CLAIMS_PER_CLIENT):
+            alice = DoubleRatchet(f"alice-{worker}-{i}")
+            start = time.perf_counter()
+            bundle = own_client.claim("bob", **pinned)
+            latencies.append(time.perf_counter() - start)
+            ephemeral = alice.init_as_alice(bundle)
+            first_messages.append((alice.get_public_bundle(), ephemeral, bundle['signed_prekey_id'],
+                                   bundle['one_time_id'], alice.encrypt(f"hello from {alice.name}"), alice.name))
+        own_client.close()
+        return first_messages, latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(CLIENTS) as pool:
+        results = list(pool.map(initiator, range(CLIENTS)))
+    elapsed = time.perf_counter() - start
+    first_messages = [message for messages, _ in results for message in messages]
+    latencies = sorted(latency for _, worker_latencies in results for latency in worker_latencies)
+    claimed = [message[3] for message in first_messages if message[3] is not None]
+    assert len(claimed) == len(set(claimed)) == ONE_TIME, "a one-time prekey was handed out twice"
+    print(f"{len(first_messages)} claims from {CLIENTS} threads in {elapsed:.2f} s "
+          f"({len(first_messages) / elapsed:.0f} sessions/s, claim p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms)")
+    print(f"{len(claimed)} with a distinct one-time prekey, {len(first_messages) - len(claimed)} "
+          f"after they ran out (three DHs); left on the server: {client.count('bob')}")
+
+    # a forged first message naming a one-time prekey does not use it up
+    alice_bundle, ephemeral, signed_prekey_id, one_time_id, message, _ = first_messages[0]
+    forged = message[:-1] + bytes([message[-1] ^ 1])
+    try:
+        bob.respond("bob", alice_bundle, ephemeral, signed_prekey_id, one_time_id, forged)
+        raise AssertionError("forged first message accepted")
+    except CryptoError:
+        assert one_time_id in bob.one_time_keys
+        print(f"Forged first message rejected; one-time prekey {one_time_id} still usable")
+
+    # Bob sets up his side of every session from the first messages
+    for alice_bundle, ephemeral, signed_prekey_id, one_time_id, message, name in first_messages:
+        _, plaintext = bob.respond("bob", alice_bundle, ephemeral, signed_prekey_id, one_time_id, message)
+        assert plaintext == f"hello from {name}".encode()
+    print(f"Bob decrypted all {len(first_messages)} first messages; "
+          f"{len(bob.one_time_keys)} private one-time prekeys left")
+
+    # a one-time prekey cannot be used twice
+    try:
+        alice_bundle, ephemeral, signed_prekey_id, one_time_id, message, _ = first_messages[0]
+        bob.respond("bob", alice_bundle, ephemeral, signed_prekey_id, one_time_id, message)
+    except PrekeyError as e:
+        print(f"Replayed first message rejected: {e}")
+
+    # replenish in bulk when the owner sees the count is low
+    print("Replenished:", client.upload_one_time("bob", bob.generate_one_time(1000)), "one-time prekeys")
+
+    # a bundle re-published under Bob's name is self-consistent but fails the pin
+    client.publish("bob", PrekeyOwner())
+    client.claim("bob")
+    try:
+        client.claim("bob", **pinned)
+        raise AssertionError("substituted bundle accepted")
+    except PrekeyError as e:
+        print(f"Substituted bundle rejected: {e}")
+    client.close()
+    server.shutdown()
+
+"""
+Generated 5000 one-time prekeys in 245 ms, uploaded in one request (180000 bytes) in 34 ms
+6400 claims from 16 threads in 8.66 s (739 sessions/s, claim p50 19.0 ms, p99 38.6 ms)
+5000 with a distinct one-time prekey, 1400 after they ran out (three DHs); left on the server: 0
+Forged first message rejected; one-time prekey 2 still usable
+Bob decrypted all 6400 first messages; 0 private one-time prekeys left
+Replayed first message rejected: One-time prekey 2 unknown or already used
+Replenished: 1000 one-time prekeys
+Substituted bundle rejected: Identity key of 'bob' does not match the pinned key
+"""
@@ -0,0 +1,266 @@
+#!pip install pynacl cryptography
+
+"""
+Sender-key groups on top of pairwise DoubleRatchet sessions.
+
+Sending to N members with pairwise sessions is N encryptions of the same
+plaintext. Here every member owns a sender chain for the group: a chain key
+(advanced with HMAC-SHA256 per message, like a DoubleRatchet receiving chain)
+and an Ed25519 signing key. A group message is encrypted once with the next
+message key and signed once; every member holding the sender's chain decrypts
+it. The chain itself (a distribution message: chain id, iteration, chain key,
+signing public key) travels over the pairwise ratchets, only to members that
+do not have it yet: after a member joins or the chain rotates.
+
+- the AEAD is a ratchet_cipher_suites suite; the header (version, suite id,
+  chain id, iteration) and the group id are its associated data
+- the signature stops members, who all know the chain key, from forging
+  messages as the sender
+- removing a member rotates the chain, so the removed member cannot read
+  later messages (the others get the new chain with the next message)
+- out-of-order group messages use DoubleRatchet's SkippedKeyStore (lazy
+  checkpoints, MAX_SKIP per message, bounded count and TTL)
+
+Group message:   Ed25519 signature (64) | header (10) | AEAD ciphertext
+                 (PyNaCl's signed-message layout)
+Distribution:    version, suite id, chain id, iteration, chain key (32),
+                 signing public key (32), group id
+"""
+import os
+import hmac
+import struct
+from typing import Dict, Optional, Tuple
+
+from nacl.signing import SigningKey, VerifyKey
+from nacl.exceptions import BadSignatureError
+
+from double_ratchet_demo import MAX_SKIP, DoubleRatchet, SkippedKeyStore, SkippedMessageError
+from ratchet_cipher_suites import SUITES, CipherSuite, preferred_suites
+
+GROUP_VERSION = 1
+GROUP_HEADER = struct.Struct(">BBII")
+DISTRIBUTION = struct.Struct(">BBII32s32s")
+SIGNATURE_SIZE = 64
+
+
+class SenderKeyError(ValueError):
+    """Unknown sender chain, bad signature or malformed group message"""
+
+
+def kdf_group_chain(chain_key: bytes) -> Tuple[bytes, bytes]:
+    """(next chain key, message key), labels distinct from the pairwise chains"""
+    return (hmac.digest(chain_key, b"GroupNextChain", 'sha256'),
+            hmac.digest(chain_key, b"GroupMessageKey", 'sha256'))
+
+
+class SenderChain:
+    """One member's sending chain: our own, or a copy received from its owner"""
+
+    def __init__(self, suite: CipherSuite, chain_id: int, iteration: int, chain_key: bytes,
+                 verify_key: VerifyKey, signing_key: Optional[SigningKey] = None):
+        self.suite = suite
+        self.chain_id = chain_id
+        self.iteration = iteration
+        self.chain_key = chain_key
+        self.verify_key = verify_key
+        self.signing_key = signing_key
+        self.skipped_keys = SkippedKeyStore(kdf_group_chain)
+
+    @classmethod
+    def generate(cls, suite: CipherSuite) -> "SenderChain":
+        signing_key = SigningKey.generate()
+        return cls(suite, int.from_bytes(os.urandom(4), 'big'), 0, os.urandom(32),
+                   signing_key.verify_key, signing_key)
+
+    def distribution(self, group_id: bytes) -> bytes:
+        return DISTRIBUTION.pack(GROUP_VERSION, self.suite.suite_id, self.chain_id, self.iteration,
+                                 self.chain_key, self.verify_key.encode()) + group_id
+
+    @classmethod
+    def from_distribution(cls, data: bytes) -> Tuple[bytes, "SenderChain"]:
+        """(group id, chain) from a distribution message"""
+        if len(data) < DISTRIBUTION.size:
+            raise SenderKeyError("Truncated sender key distribution")
+        version, suite_id, chain_id, iteration, chain_key, verify_key = DISTRIBUTION.unpack_from(data)
+        if version != GROUP_VERSION or suite_id not in SUITES:
+            raise SenderKeyError(f"Unsupported sender key distribution v{version}, suite {suite_id}")
+        chain = cls(SUITES[suite_id], chain_id, iteration, chain_key, VerifyKey(verify_key))
+        return data[DISTRIBUTION.size:], chain
+
+    def next_message_key(self) -> Tuple[int, bytes]:
+        iteration = self.iteration
+        self.chain_key, message_key = kdf_group_chain(self.chain_key)
+        self.iteration += 1
+        return iteration, message_key
+
+    def message_key(self, iteration: int) -> bytes:
+        """Key of a received message, keeping the keys of skipped iterations"""
+        chain_tag = self.chain_id.to_bytes(4, 'big')
+        if iteration < self.iteration:
+            message_key = self.skipped_keys.pop((chain_tag, iteration))
+            if message_key is None:
+                raise SkippedMessageError(
+                    f"No key for group message #{iteration} (replayed, evicted or expired)")
+            return message_key
+        if iteration - self.iteration > MAX_SKIP:
+            raise SkippedMessageError(f"Group message #{iteration} would skip {iteration - self.iteration} keys")
+        while self.iteration < iteration:
+            self.skipped_keys.skip(chain_tag, self.iteration, self.chain_key)
+            self.chain_key, _ = kdf_group_chain(self.chain_key)
+            self.iteration += 1
+        return self.next_message_key()[1]
+
+
+class GroupSession:
+    """Our view of one group: our sender chain, members' chains and pairwise sessions"""
+
+    def __init__(self, group_id: bytes, suite: Optional[CipherSuite] = None):
+        self.group_id = group_id
+        self.suite = suite or preferred_suites()[0]
+        self.members: Dict[str, DoubleRatchet] = {}
+        self.chain = SenderChain.generate(self.suite)
+        self.rotations = 0
+        self._received: Dict[str, SenderChain] = {}
+        self._needs_chain = set()
+
+    # ==================== Membership ====================
+
+    def add_member(self, name: str, session: DoubleRatchet):
+        """Add a member reachable over an established pairwise session"""
+        self.members[name] = session
+        self._needs_chain.add(name)
+
+    def remove_member(self, name: str):
+        """Drop a member and rotate our chain so it cannot read what follows"""
+        self.members.pop(name, None)
+        self._received.pop(name, None)
+        self.rotate()
+
+    def rotate(self):
+        """Start a new sender chain; every member gets it with the next message"""
+        self.chain = SenderChain.generate(self.suite)
+        self._needs_chain = set(self.members)
+        self.rotations += 1
+
+    # ==================== Sending ====================
+
+    def encrypt(self, plaintext: bytes) -> Tuple[bytes, Dict[str, bytes]]:
+        """
+        (group message for every member, {member: pairwise message}). The
+        pairwise messages carry our chain to members that do not have it yet
+        and must be delivered before the group message.
+        """
+        distributions = {}
+        if self._needs_chain:
+            distribution = self.chain.distribution(self.group_id)
+            for name in self._needs_chain:
+                distributions[name] = self.members[name].encrypt_bytes(distribution)
+            self._needs_chain.clear()
+
+        iteration, message_key = self.chain.next_message_key()
+        header = GROUP_HEADER.pack(GROUP_VERSION, self.suite.suite_id, self.chain.chain_id, iteration)
+        body = header + self.suite.seal(message_key, iteration, plaintext, self.group_id + header)
+        return bytes(self.chain.signing_key.sign(body)), distributions
+
+    # ==================== Receiving ====================
+
+    def receive_distribution(self, sender: str, message: bytes):
+        """Install a sender's chain from a pairwise message"""
+        group_id, chain = SenderChain.from_distribution(self.members[sender].decrypt_bytes(message))
+        if group_id != self.group_id:
+            raise SenderKeyError(f"Distribution for group {group_id!r}, not {self.group_id!r}")
+        self._received[sender] = chain
+
+    def decrypt(self, sender: str, message: bytes) -> bytes:
+        if len(message) < SIGNATURE_SIZE + GROUP_HEADER.size:
+            raise SenderKeyError("Truncated group message")
+        version, suite_id, chain_id, iteration = GROUP_HEADER.unpack_from(message, SIGNATURE_SIZE)
+        chain = self._received.get(sender)
+        if chain is None or chain.chain_id != chain_id or chain.suite.suite_id != suite_id:
+            raise SenderKeyError(f"No sender chain {chain_id:08x} from {sender}")
+
+        try:
+            chain.verify_key.verify(message)
+        except BadSignatureError:
+            raise SenderKeyError(f"Bad signature on group message from {sender}") from None
+
+        message_key = chain.message_key(iteration)
+        view = memoryview(message)
+        header = view[SIGNATURE_SIZE:SIGNATURE_SIZE + GROUP_HEADER.size]
+        return chain.suite.open(message_key, iteration, view[SIGNATURE_SIZE + GROUP_HEADER.size:],
+                                self.group_id + header)
+
+
+if __name__ == "__main__":
+    import time
+
+    MEMBERS = 100
+    group_id = b"group-42"
+
+    # pairwise sessions between the sender and every member
+    suites = preferred_suites()
+    sender = GroupSession(group_id)
+    members: Dict[str, GroupSession] = {}
+    for i in range(MEMBERS):
+        name = f"member-{i:03d}"
+        alice, bob = DoubleRatchet("Sender", suites=suites), DoubleRatchet(name, suites=suites)
+        bob.init_as_bob(alice.get_public_bundle(), alice.init_as_alice(bob.get_public_bundle()))
+        sender.add_member(name, alice)
+        members[name] = GroupSession(group_id)
+        members[name].add_member("sender", bob)
+
+    def deliver(group_message: bytes, distributions: Dict[str, bytes], expected: bytes):
+        for name, member in members.items():
+            if name in distributions:
+                member.receive_distribution("sender", distributions[name])
+            assert member.decrypt("sender", group_message) == expected
+
+    first, distributions = sender.encrypt(b"hello group")
+    deliver(first, distributions, b"hello group")
+    print(f"First message: {len(first)} bytes + {len(distributions)} distributions "
+          f"of {len(next(iter(distributions.values())))} bytes")
+
+    # out of order, then a forged message from a member who knows the chain key
+    late, _ = sender.encrypt(b"late")
+    newer, _ = sender.encrypt(b"newer")
+    deliver(newer, {}, b"newer")
+    deliver(late, {}, b"late")
+    forged = bytearray(newer)
+    forged[-1] ^= 1
+    try:
+        members["member-000"].decrypt("sender", bytes(forged))
+    except SenderKeyError as e:
+        print(f"Forged message rejected: {e}")
+
+    for size in (1024, 64 * 1024):
+        payload = os.urandom(size)
+        start = time.perf_counter()
+        pairwise_messages = {name: session.encrypt_bytes(payload)
+                             for name, session in sender.members.items()}
+        pairwise = time.perf_counter() - start
+        for name, message in pairwise_messages.items():
+            assert members[name].members["sender"].decrypt_bytes(message) == payload
+        start = time.perf_counter()
+        group_message, distributions = sender.encrypt(payload)
+        grouped = time.perf_counter() - start
+        deliver(group_message, distributions, payload)
+        print(f"{size:>6} B to {MEMBERS} members: pairwise {pairwise * 1000:6.2f} ms "
+              f"({sum(map(len, pairwise_messages.values()))} bytes), "
+              f"sender key {grouped * 1000:6.2f} ms ({len(group_message)} bytes)")
+
+    sender.remove_member("member-099")
+    removed = members.pop("member-099")
+    message, distributions = sender.encrypt(b"after removal")
+    deliver(message, distributions, b"after removal")
+    try:
+        removed.decrypt("sender", message)
+    except SenderKeyError as e:
+        print(f"Removed member locked out: {e}")
+
+"""
+First message: 101 bytes + 100 distributions of 135 bytes
+Forged message rejected: Bad signature on group message from sender
+  1024 B to 100 members: pairwise   1.13 ms (107700 bytes), sender key   0.07 ms (1114 bytes)
+ 65536 B to 100 members: pairwise   5.06 ms (6558900 bytes), sender key   0.59 ms (65626 bytes)
+Removed member locked out: No sender chain 42157292 from sender
+"""
@@ -0,0 +1,405 @@
+#!pip install pynacl
+
+"""
+Asyncio manager for many concurrent DoubleRatchet sessions, keyed by peer id.
+
+- encrypt/decrypt on different peers interleave freely; operations on the
+  same peer are serialised by a per-peer asyncio.Lock (ratchet state is
+  order-sensitive)
+- write-through: every operation saves the session to a RatchetSessionStore
+  before it returns (and before the socket server replies), so a crash never
+  rolls a session back to a state whose message keys were already used;
+  saves from operations finishing in the same event loop turn are written
+  as one batch (open the store with sync=True to survive power loss too)
+- active sessions live in memory in LRU order; sessions idle for longer than
+  idle_timeout, or beyond max_active, are dropped (they are already saved)
+  and loaded again on their next message
+- an optional key pool (ratchet_keypool.X25519KeyPool) is shared by all
+  sessions, so new sending chains take pre-generated key pairs
+- store I/O runs on one worker thread, so the event loop never blocks on the
+  file and store operations happen in submission order (a load queued after
+  a save sees the saved state)
+
+A unix socket server exposes the same operations to local processes.
+Request and response frames (big-endian):
+
+    request   op (1 byte: 1 encrypt, 2 decrypt), peer id length (2), payload length (4),
+              peer id (UTF-8), payload (plaintext UTF-8 / message bytes)
+    response  status (1 byte: 0 ok, 1 error), payload length (4),
+              payload (message bytes / plaintext UTF-8 / error text)
+"""
+import struct
+import asyncio
+import functools
+import itertools
+import contextlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from double_ratchet_demo import DoubleRatchet, RatchetMetrics
+from ratchet_session_store import RatchetSessionStore
+
+OP_ENCRYPT = 1
+OP_DECRYPT = 2
+STATUS_OK = 0
+STATUS_ERROR = 1
+REQUEST_HEADER = struct.Struct(">BHI")
+RESPONSE_HEADER = struct.Struct(">BI")
+
+DEFAULT_IDLE_TIMEOUT = 300.0
+DEFAULT_MAX_ACTIVE = 10000
+
+
+class RatchetSessionManager:
+    def __init__(self, store: RatchetSessionStore, idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 max_active: int = DEFAULT_MAX_ACTIVE, key_pool=None):
+        self.store = store
+        self.key_pool = key_pool
+        self.idle_timeout = idle_timeout
+        self.max_active = max_active
+        self.loads = self.evictions = 0
+        # one metrics instance for every managed session, loaded or added
+        self.metrics = RatchetMetrics()
+        self._active: "OrderedDict[str, DoubleRatchet]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._users: Dict[str, int] = {}
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ratchet-store")
+        self._evictor: Optional[asyncio.Task] = None
+        self._batch: Optional[Tuple[Dict[str, DoubleRatchet], asyncio.Task]] = None
+        self._closed = False
+
+    # ==================== Sessions ====================
+
+    async def _run_io(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._io, func, *args)
+
+    async def _save(self, peer_id: str, session: DoubleRatchet):
+        """
+        Write the session with the current batch and wait until it is in the
+        store; the caller holds the peer's lock, so the state cannot change
+        while the I/O worker serializes it
+        """
+        if self._batch is None:
+            self._batch = ({}, asyncio.get_running_loop().create_task(self._write_batch()))
+        sessions, written = self._batch
+        sessions[peer_id] = session
+        await asyncio.shield(written)
+
+    async def _write_batch(self):
+        await asyncio.sleep(0)  # let the other operations finishing in this loop turn join
+        sessions, _ = self._batch
+        self._batch = None
+        await self._run_io(self.store.save_many, list(sessions.items()))
+
+    def _use(self, peer_id: str) -> asyncio.Lock:
+        """The peer's lock, counted as in use until _release()"""
+        if self._closed:
+            raise RuntimeError("Session manager is closed")
+        self._users[peer_id] = self._users.get(peer_id, 0) + 1
+        return self._locks.setdefault(peer_id, asyncio.Lock())
+
+    def _release(self, peer_id: str):
+        users = self._users.pop(peer_id) - 1
+        if users:
+            self._users[peer_id] = users
+        elif peer_id not in self._active:
+            # nothing was loaded (e.g. unknown peer) and nobody else waits on the lock
+            self._locks.pop(peer_id, None)
+
+    @contextlib.asynccontextmanager
+    async def _session(self, peer_id: str):
+        """
+        Hold the peer's lock and yield its session, loading it if evicted;
+        the session is saved if the operation succeeds (a failed decrypt
+        leaves the state unchanged)
+        """
+        lock = self._use(peer_id)
+        try:
+            async with lock:
+                session = self._active.get(peer_id)
+                if session is None:
+                    session = await self._run_io(
+                        functools.partial(self.store.load, peer_id, metrics=self.metrics,
+                                          key_pool=self.key_pool))
+                    self._active[peer_id] = session
+                    self.loads += 1
+                self._active.move_to_end(peer_id)
+                self._last_used[peer_id] = asyncio.get_running_loop().time()
+                yield session
+                await self._save(peer_id, session)
+        finally:
+            self._release(peer_id)
+        await self._evict_overflow()
+
+    async def add_session(self, peer_id: str, session: DoubleRatchet):
+        """Start managing a new session (it records into the manager's metrics from now on)"""
+        lock = self._use(peer_id)
+        try:
+            async with lock:
+                session.metrics = session.skipped_keys.metrics = self.metrics
+                if self.key_pool is not None:
+                    session.key_pool = self.key_pool
+                self._active[peer_id] = session
+                self._active.move_to_end(peer_id)
+                self._last_used[peer_id] = asyncio.get_running_loop().time()
+                await self._save(peer_id, session)
+        finally:
+            self._release(peer_id)
+        await self._evict_overflow()
+
+    async def encrypt(self, peer_id: str, plaintext: str) -> bytes:
+        async with self._session(peer_id) as session:
+            return session.encrypt(plaintext)
+
+    async def decrypt(self, peer_id: str, message: bytes) -> str:
+        async with self._session(peer_id) as session:
+            return session.decrypt(message)
+
+    # ==================== Eviction ====================
+
+    async def _evict_overflow(self):
+        """Evict least recently used sessions beyond max_active"""
+        excess = len(self._active) - self.max_active
+        if excess > 0:
+            await self._evict(list(itertools.islice(self._active, excess)))
+
+    def _idle(self):
+        deadline = asyncio.get_running_loop().time() - self.idle_timeout
+        return [peer_id for peer_id in self._active if self._last_used[peer_id] <= deadline]
+
+    async def _evict(self, peer_ids):
+        """Drop idle sessions from memory (every finished operation was already saved)"""
+        for peer_id in peer_ids:
+            lock = self._locks.get(peer_id)
+            if peer_id in self._users or (lock is not None and lock.locked()):
+                continue
+            del self._active[peer_id]
+            del self._last_used[peer_id]
+            self._locks.pop(peer_id, None)
+            self.evictions += 1
+
+    async def _evict_idle_forever(self):
+        while True:
+            await asyncio.sleep(self.idle_timeout / 2)
+            await self._evict(self._idle())
+
+    def start(self):
+        """Start the idle-eviction task on the running loop"""
+        if self._evictor is None:
+            self._evictor = asyncio.get_running_loop().create_task(self._evict_idle_forever())
+
+    async def close(self):
+        """
+        Refuse new operations, stop eviction, wait for operations in flight
+        (and their saves), then close the store
+        """
+        self._closed = True
+        if self._evictor is not None:
+            self._evictor.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._evictor
+            self._evictor = None
+        # asyncio.Lock is FIFO: once we hold a lock, every operation queued on it has finished
+        for lock in list(self._locks.values()):
+            async with lock:
+                pass
+        self.evictions += len(self._active)
+        self._active.clear()
+        self._last_used.clear()
+        self._locks.clear()
+        await self._run_io(self.store.close)
+        self._io.shutdown()
+
+    def stats(self) -> Dict[str, int]:
+        return {"active": len(self._active), "stored": len(self.store),
+                "loads": self.loads, "evictions": self.evictions}
+
+    def metrics_snapshot(self) -> Dict:
+        """Counters and latency histograms aggregated over all managed sessions"""
+        return self.metrics.snapshot()
+
+    # ==================== Socket server ====================
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    op, id_length, payload_length = REQUEST_HEADER.unpack(
+                        await reader.readexactly(REQUEST_HEADER.size))
+                    peer_id = (await reader.readexactly(id_length)).decode('utf-8')
+                    payload = await reader.readexactly(payload_length)
+                except asyncio.IncompleteReadError:
+                    break
+                try:
+                    if op == OP_ENCRYPT:
+                        result = await self.encrypt(peer_id, payload.decode('utf-8'))
+                    elif op == OP_DECRYPT:
+                        result = (await self.decrypt(peer_id, payload)).encode('utf-8')
+                    else:
+                        raise ValueError(f"Unknown operation {op}")
+                    status = STATUS_OK
+                except Exception as e:
+                    status, result = STATUS_ERROR, f"{type(e).__name__}: {e}".encode('utf-8')
+                writer.write(RESPONSE_HEADER.pack(status, len(result)) + result)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve_unix(self, path: str) -> asyncio.AbstractServer:
+        """Serve encrypt/decrypt requests on a unix socket"""
+        self.start()
+        return await asyncio.start_unix_server(self._handle_client, path)
+
+
+class RatchetClient:
+    """Client for RatchetSessionManager.serve_unix (one request in flight per connection)"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, path: str) -> "RatchetClient":
+        return cls(*await asyncio.open_unix_connection(path))
+
+    async def _request(self, op: int, peer_id: str, payload: bytes) -> bytes:
+        encoded_id = peer_id.encode('utf-8')
+        self.writer.write(REQUEST_HEADER.pack(op, len(encoded_id), len(payload)) + encoded_id + payload)
+        await self.writer.drain()
+        status, length = RESPONSE_HEADER.unpack(await self.reader.readexactly(RESPONSE_HEADER.size))
+        result = await self.reader.readexactly(length)
+        if status != STATUS_OK:
+            raise RuntimeError(result.decode('utf-8'))
+        return result
+
+    async def encrypt(self, peer_id: str, plaintext: str) -> bytes:
+        return await self._request(OP_ENCRYPT, peer_id, plaintext.encode('utf-8'))
+
+    async def decrypt(self, peer_id: str, message: bytes) -> str:
+        return (await self._request(OP_DECRYPT, peer_id, message)).decode('utf-8')
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+if __name__ == "__main__":
+    import os
+    import time
+    import tempfile
+    from ratchet_keypool import X25519KeyPool
+    from double_ratchet_demo import SkippedMessageError
+
+    PEERS = 2000
+    CLIENTS = 50
+    directory = tempfile.mkdtemp()
+    socket_path = os.path.join(directory, "ratchet.sock")
+
+    # One DoubleRatchet pair per peer: the manager plays Bob, the peers play Alice
+    peers = {}
+    manager = RatchetSessionManager(RatchetSessionStore(os.path.join(directory, "sessions.bin")),
+                                    idle_timeout=0.5, max_active=500, key_pool=X25519KeyPool())
+
+    async def conversation(client: RatchetClient, peer_id: str, alice: DoubleRatchet):
+        for i in range(3):
+            text = f"{peer_id} message {i}"
+            assert await client.decrypt(peer_id, alice.encrypt(text)) == text
+            reply = await client.encrypt(peer_id, f"ack {i}")
+            assert alice.decrypt(reply) == f"ack {i}"
+
+    async def worker(peer_ids):
+        client = await RatchetClient.connect(socket_path)
+        for peer_id in peer_ids:
+            await conversation(client, peer_id, peers[peer_id])
+        await client.close()
+
+    async def main():
+        for i in range(PEERS):
+            peer_id = f"peer-{i:05d}"
+            alice, bob = DoubleRatchet("Alice"), DoubleRatchet("Bob")
+            bob.init_as_bob(alice.get_public_bundle(), alice.init_as_alice(bob.get_public_bundle()))
+            peers[peer_id] = alice
+            await manager.add_session(peer_id, bob)
+        print(f"Registered {PEERS} sessions:", manager.stats())
+
+        server = await manager.serve_unix(socket_path)
+        peer_ids = list(peers)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(peer_ids[c::CLIENTS]) for c in range(CLIENTS)))
+        elapsed = time.perf_counter() - start
+        operations = PEERS * 3 * 2
+        print(f"{operations} operations over {CLIENTS} connections in {elapsed:.2f}s "
+              f"({operations / elapsed:.0f}/s):", manager.stats())
+
+        await asyncio.sleep(1.2)
+        print("After idle eviction:", manager.stats())
+
+        # an evicted session is loaded back transparently
+        client = await RatchetClient.connect(socket_path)
+        await conversation(client, "peer-00042", peers["peer-00042"])
+        await client.close()
+        print("Evicted session resumed:", manager.stats())
+        for name, histogram in manager.metrics_snapshot()["histograms"].items():
+            print(f"  {name}: {histogram['count']} ops, p50 < {histogram['p50_us']} us, "
+                  f"p99 < {histogram['p99_us']} us")
+
+        # a crash right after a reply loses nothing: the store already holds the state after it
+        crashed_peer = "peer-01999"
+        alice = peers[crashed_peer]
+        message = alice.encrypt("before the crash")
+        assert await manager.decrypt(crashed_peer, message) == "before the crash"
+        assert alice.decrypt(await manager.encrypt(crashed_peer, "reply before the crash")) == "reply before the crash"
+        store = RatchetSessionStore(manager.store.path)
+        recovered = store.load(crashed_peer)
+        store.close()
+        try:
+            recovered.decrypt(message)
+            raise AssertionError("stale session in the store")
+        except SkippedMessageError:
+            pass
+        # a stale session would reuse the reply's message number (and AEAD nonce)
+        assert alice.decrypt(recovered.encrypt("after the crash")) == "after the crash"
+        print("Crash after a reply: stored session is current, no message number reused")
+
+        # an unknown peer fails without leaving a lock behind
+        try:
+            await manager.decrypt("peer-unknown", b"")
+        except KeyError:
+            assert "peer-unknown" not in manager._locks
+            print("Unknown peer: KeyError, no lock left behind")
+
+        server.close()
+        await server.wait_closed()
+
+        # close() waits for operations in flight and saves every session, busy or not
+        last = {peer_id: peers[peer_id].encrypt("last one") for peer_id in peer_ids[:100]}
+        in_flight = [asyncio.ensure_future(manager.decrypt(peer_id, message)) for peer_id, message in last.items()]
+        await asyncio.sleep(0)
+        await manager.close()
+        assert all(task.result() == "last one" for task in in_flight)
+        store = RatchetSessionStore(manager.store.path)
+        for peer_id, message in last.items():
+            try:
+                store.load(peer_id).decrypt(message)
+                raise AssertionError(f"{peer_id}: stale session saved")
+            except SkippedMessageError:
+                pass  # the saved state is past the last message
+        store.close()
+        print(f"Closed with {len(in_flight)} operations in flight: all finished and saved:", manager.stats())
+        manager.key_pool.close()
+
+    asyncio.run(main())
+
+"""
+Registered 2000 sessions: {'active': 500, 'stored': 2000, 'loads': 0, 'evictions': 1500}
+12000 operations over 50 connections in 2.99s (4017/s): {'active': 474, 'stored': 2000, 'loads': 2000, 'evictions': 3526}
+After idle eviction: {'active': 0, 'stored': 2000, 'loads': 2000, 'evictions': 4000}
+Evicted session resumed: {'active': 1, 'stored': 2000, 'loads': 2001, 'evictions': 4000}
+  decrypt: 6003 ops, p50 < 32 us, p99 < 1024 us
+  encrypt: 6003 ops, p50 < 32 us, p99 < 1024 us
+Crash after a reply: stored session is current, no message number reused
+Unknown peer: KeyError, no lock left behind
+Closed with 100 operations in flight: all finished and saved: {'active': 0, 'stored': 2000, 'loads': 2101, 'evictions': 4101}
+"""
@@ -0,0 +1,273 @@
+#!pip install pynacl
+
+"""
+Append-only file of serialized DoubleRatchet sessions, read through mmap.
+
+Dormant sessions stay on disk as DoubleRatchet.to_bytes() blobs (a few hundred
+bytes each, optionally sealed with a storage key). The only thing in memory
+per session is its index entry, peer id -> (offset, length) of the latest
+record; load() slices the mapped file and builds the DoubleRatchet object only
+when the session is needed again.
+
+The file starts with FILE_MAGIC (4 bytes), then records (big-endian):
+
+    offset  size  field
+    0       2     peer id length P
+    2       4     state length S (0 = session deleted)
+    6       4     CRC32 of bytes 0-5 (the lengths)
+    10      4     CRC32 of peer id || state
+    14      P     peer id (UTF-8)
+    14+P    S     session state (DoubleRatchet.to_bytes)
+
+Saving a session appends a record, so the file keeps old versions until
+compact() rewrites it with the latest record of every live session. A torn
+record at the end (crash during a write) is cut off when the file is opened:
+a partial header, a header whose state runs past the end of the file, a bad
+state CRC on the very last record, or a zero-filled tail. The lengths have
+their own CRC, so a corrupt length is never mistaken for a torn tail; any
+other bad record raises StoreError and the file is left alone (skipping it
+would bring back an older state of that session, whose keys were already used).
+"""
+import os
+import mmap
+import zlib
+import struct
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from double_ratchet_demo import DoubleRatchet
+
+FILE_MAGIC = b"DRS\x02"
+RECORD_LENGTHS = struct.Struct(">HI")
+RECORD_HEADER = struct.Struct(">HIII")
+
+
+class StoreError(ValueError):
+    """Not a session file, or a corrupt record that is not a torn tail"""
+
+
+def _record(encoded_id: bytes, state: bytes) -> bytes:
+    lengths = RECORD_LENGTHS.pack(len(encoded_id), len(state))
+    payload = encoded_id + state
+    return b"".join((lengths, struct.pack(">II", zlib.crc32(lengths), zlib.crc32(payload)), payload))
+
+
+class RatchetSessionStore:
+    def __init__(self, path: str, storage_key: Optional[bytes] = None, sync: bool = False):
+        self.path = path
+        self.storage_key = storage_key
+        self.sync = sync
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._file = open(path, 'a+b')
+        self._map: Optional[mmap.mmap] = None
+        self._size = 0
+        self._scan()
+
+    # ==================== Index ====================
+
+    def _remap(self):
+        """Map the whole file (a zero-length file cannot be mapped)"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._size:
+            self._map = mmap.mmap(self._file.fileno(), self._size, access=mmap.ACCESS_READ)
+
+    def _fail(self, message: str):
+        self.close()
+        raise StoreError(f"{self.path}: {message}")
+
+    def _scan(self):
+        """Rebuild the index from the records; truncate a torn tail, refuse any other bad record"""
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._remap()
+        if self._size < len(FILE_MAGIC) and self._map is not None and self._map[:] != FILE_MAGIC[:self._size]:
+            self._fail("not a session file")
+        if self._size < len(FILE_MAGIC):  # new file, or torn while being created
+            self._file.truncate(0)
+            self._file.write(FILE_MAGIC)
+            self._file.flush()
+            self._size = len(FILE_MAGIC)
+            self._remap()
+        elif self._map[:len(FILE_MAGIC)] != FILE_MAGIC:
+            self._fail(f"not a session file (magic {self._map[:len(FILE_MAGIC)]!r}, expected {FILE_MAGIC!r})")
+        offset = len(FILE_MAGIC)
+        while offset + RECORD_HEADER.size <= self._size:
+            id_length, state_length, lengths_crc, crc = RECORD_HEADER.unpack_from(self._map, offset)
+            if zlib.crc32(self._map[offset:offset + RECORD_LENGTHS.size]) != lengths_crc:
+                if not any(self._map[offset:]):
+                    break  # zero-filled tail: crash after the file was extended
+                self._fail(f"corrupt record header at offset {offset} ({self._size - offset} bytes from there on)")
+            start = offset + RECORD_HEADER.size
+            end = start + id_length + state_length
+            if end > self._size:
+                break  # intact header, state cut off: torn write
+            if zlib.crc32(self._map[start:end]) != crc:
+                if end == self._size:
+                    break  # the last record: torn write
+                self._fail(f"corrupt record at offset {offset} ({self._size - end} bytes of records after it)")
+            peer_id = self._map[start:start + id_length].decode('utf-8')
+            if state_length:
+                self._index[peer_id] = (start + id_length, state_length)
+            else:
+                self._index.pop(peer_id, None)
+            offset = end
+        if offset != self._size:
+            self._file.truncate(offset)
+            self._size = offset
+            self._remap()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, peer_id: str) -> bool:
+        return peer_id in self._index
+
+    def peer_ids(self) -> Iterator[str]:
+        return iter(list(self._index))
+
+    # ==================== Writes ====================
+
+    def _append(self, records: Iterable[Tuple[str, bytes]]):
+        """Append (peer_id, state) records in one write; empty state deletes"""
+        chunks, entries, offset = [], [], self._size
+        for peer_id, state in records:
+            encoded_id = peer_id.encode('utf-8')
+            chunks.append(_record(encoded_id, state))
+            entries.append((peer_id, offset + RECORD_HEADER.size + len(encoded_id), len(state)))
+            offset += len(chunks[-1])
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(b"".join(chunks))
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+        self._size = offset
+        for peer_id, state_offset, state_length in entries:
+            if state_length:
+                self._index[peer_id] = (state_offset, state_length)
+            else:
+                self._index.pop(peer_id, None)
+
+    def save(self, peer_id: str, session: DoubleRatchet):
+        self._append([(peer_id, session.to_bytes(self.storage_key))])
+
+    def save_many(self, sessions: Iterable[Tuple[str, DoubleRatchet]]):
+        """Save many sessions with a single write"""
+        self._append((peer_id, session.to_bytes(self.storage_key)) for peer_id, session in sessions)
+
+    def delete(self, peer_id: str):
+        if peer_id in self._index:
+            self._append([(peer_id, b"")])
+
+    # ==================== Reads ====================
+
+    def load_bytes(self, peer_id: str) -> bytes:
+        """Serialized state of one session (KeyError if unknown)"""
+        offset, length = self._index[peer_id]
+        if self._map is None or len(self._map) < offset + length:
+            self._remap()
+        return self._map[offset:offset + length]
+
+    def load(self, peer_id: str, **kwargs) -> DoubleRatchet:
+        """Rebuild one session from its latest record (KeyError if unknown); kwargs go to from_bytes"""
+        return DoubleRatchet.from_bytes(self.load_bytes(peer_id), self.storage_key, **kwargs)
+
+    # ==================== Maintenance ====================
+
+    def compact(self):
+        """Rewrite the file with only the latest record of every live session"""
+        temp_path = self.path + ".compact"
+        with open(temp_path, 'wb') as out:
+            out.write(FILE_MAGIC)
+            for peer_id in list(self._index):
+                out.write(_record(peer_id.encode('utf-8'), self.load_bytes(peer_id)))
+            out.flush()
+            os.fsync(out.fileno())
+        self.close()
+        os.replace(temp_path, self.path)
+        self._index.clear()
+        self._file = open(self.path, 'a+b')
+        self._scan()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+if __name__ == "__main__":
+    import time
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "sessions.bin")
+    store = RatchetSessionStore(path, storage_key=os.urandom(32))
+
+    count = 100000
+    alice, bob = DoubleRatchet("Alice"), DoubleRatchet("Bob")
+    bob.init_as_bob(alice.get_public_bundle(), alice.init_as_alice(bob.get_public_bundle()))
+    bob.decrypt(alice.encrypt("hello"))
+
+    start = time.perf_counter()
+    store.save_many((f"peer-{i:06d}", bob) for i in range(count))
+    elapsed = time.perf_counter() - start
+    size = os.path.getsize(path)
+    print(f"Saved {count} sessions in {elapsed:.2f}s: {size} bytes ({size / count:.0f} per session)")
+
+    store.close()
+    start = time.perf_counter()
+    store = RatchetSessionStore(path, storage_key=store.storage_key)
+    print(f"Reopened and indexed {len(store)} sessions in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    session = store.load("peer-054321")
+    print(f"Loaded one session in {(time.perf_counter() - start) * 1000:.3f} ms:",
+          session.decrypt(alice.encrypt("still there?")) == "still there?")
+
+    # a torn tail is cut off; any other bad record is refused and the file kept
+    small = os.path.join(os.path.dirname(path), "small.bin")
+    record_size = RECORD_HEADER.size + len("peer-0") + len(session.to_bytes())
+    cases = (("torn last record", 3 * record_size - 1, None, 2),
+             ("cut inside the last state", None, 3 * record_size - 5, 2),
+             ("bad state of the first record", record_size - 1, None, None),
+             ("high byte of the first state length", 2, None, None),
+             ("high byte of the last state length", 2 + 2 * record_size, None, None))
+    for name, flip, cut, expected in cases:
+        if os.path.exists(small):
+            os.remove(small)
+        small_store = RatchetSessionStore(small)
+        small_store.save_many((f"peer-{i}", session) for i in range(3))
+        small_store.close()
+        size = os.path.getsize(small)
+        with open(small, 'r+b') as f:
+            if flip is not None:
+                f.seek(len(FILE_MAGIC) + flip)
+                byte = f.read(1)
+                f.seek(len(FILE_MAGIC) + flip)
+                f.write(bytes([byte[0] ^ 0x80]))
+            if cut is not None:
+                f.truncate(len(FILE_MAGIC) + cut)
+        try:
+            small_store = RatchetSessionStore(small)
+            assert len(small_store) == expected, name
+            print(f"{name}: reopened with {len(small_store)} sessions, {os.path.getsize(small)} bytes")
+            small_store.close()
+        except StoreError as e:
+            assert expected is None and os.path.getsize(small) == size, name
+            print(f"{name}: StoreError, all {size} bytes left in place")
+
+    store.save("peer-054321", session)
+    store.delete("peer-000001")
+    store.compact()
+    print(f"After compaction: {len(store)} sessions, {os.path.getsize(path)} bytes")
+
+"""
+Saved 100000 sessions in 1.90s: 33100004 bytes (331 per session)
+Reopened and indexed 100000 sessions in 0.39s
+Loaded one session in 0.408 ms: True
+torn last record: reopened with 2 sessions, 576 bytes
+cut inside the last state: reopened with 2 sessions, 576 bytes
+bad state of the first record: StoreError, all 862 bytes left in place
+high byte of the first state length: StoreError, all 862 bytes left in place
+high byte of the last state length: StoreError, all 862 bytes left in place
+After compaction: 99999 sessions, 33099673 bytes
+"""